@@ -0,0 +1,203 @@
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Optional
+import time
+
+import boto3
+
+from instrumentation import METRICS
+
+
+class AsyncJobScheduler:
+    """Keep a bounded number of Bedrock async invocations in flight.
+
+    Jobs are submitted through a caller-supplied function, all outstanding
+    invocation ARNs are polled in a single loop, and each job's completion
+    callback runs as soon as its invocation finishes. The Bedrock client, the
+    clock, and the sleep function are injectable so a local stub can stand in
+    for Bedrock.
+    """
+
+    def __init__(
+        self,
+        client: boto3.client,
+        max_in_flight: int = 5,
+        max_submits_per_second: float = 1.0,
+        poll_interval: float = 5.0,
+        max_poll_errors: int = 3,
+        stage: str = "async_job",
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Initialize the scheduler.
+        Args:
+            client (boto3.client): The Boto3 client for the Bedrock service (or a stub with `get_async_invoke`).
+            max_in_flight (int): The maximum number of invocations running at once.
+            max_submits_per_second (float): The submit-rate budget for new invocations.
+            poll_interval (float): Seconds to wait between polling rounds when no job has finished.
+            max_poll_errors (int): The consecutive `get_async_invoke` errors (e.g., throttling or a
+                dropped connection) after which an invocation is reported as failed.
+            stage (str): The stage label of the job metrics, e.g., marengo.
+            clock (Callable[[], float]): Monotonic clock, in seconds.
+            sleep (Callable[[float], None]): Sleep function, in seconds.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        if max_submits_per_second <= 0:
+            raise ValueError("max_submits_per_second must be greater than 0")
+
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.submit_interval = 1.0 / max_submits_per_second
+        self.poll_interval = poll_interval
+        self.max_poll_errors = max_poll_errors
+        self.stage = stage
+        self.clock = clock
+        self.sleep = sleep
+        self._last_submit: Optional[float] = None
+
+    def run(
+        self,
+        jobs: Iterable[Any],
+        submit: Callable[[Any], str],
+        on_complete: Callable[[Any, dict], None],
+        on_failure: Optional[Callable[[Any, dict], None]] = None,
+        resume: Optional[Dict[str, Any]] = None,
+        job_name: Callable[[Any], str] = str,
+        skip: Optional[Callable[[Any], bool]] = None,
+    ) -> Dict[str, str]:
+        """Run all jobs to completion.
+        Args:
+            jobs (Iterable[Any]): The jobs to run; each is passed to the callbacks unchanged.
+            submit (Callable[[Any], str]): Starts the invocation for a job and returns its ARN.
+            on_complete (Callable[[Any, dict], None]): Called with the job and the final
+                `get_async_invoke` response when the invocation completes.
+            on_failure (Callable[[Any, dict], None], optional): Called with the job and the final
+                response when the invocation fails or is stopped, or with a Failed response carrying
+                the error as `failureMessage` when `submit`, polling, or `on_complete` raises.
+            resume (Dict[str, Any], optional): Invocations already in flight, e.g., from before a
+                restart, keyed by invocation ARN; they are polled without being resubmitted.
+            job_name (Callable[[Any], str]): Names a job in the metrics, e.g., by its video file name.
+            skip (Callable[[Any], bool], optional): Checked just before a pending job is submitted;
+                jobs it returns True for are dropped, e.g., the other windows of a video that failed.
+        Returns:
+            Dict[str, str]: The final status of each invocation, keyed by invocation ARN; jobs whose
+                submit raised are keyed as `unsubmitted:<job name>`.
+        """
+        pending = deque(jobs)
+        in_flight: Dict[str, Any] = dict(resume or {})
+        statuses: Dict[str, str] = {arn: "InProgress" for arn in in_flight}
+        # Jobs queue from the start of the run until submitted, then run until seen finished
+        queued_at = self.clock()
+        submitted_at: Dict[str, float] = {}
+        poll_errors: Dict[str, int] = {}
+
+        while pending or in_flight:
+            # Top up the in-flight set, staying within the submit-rate budget
+            while pending and len(in_flight) < self.max_in_flight:
+                job = pending.popleft()
+                if skip is not None and skip(job):
+                    print(f"Job skipped: {job_name(job)}")
+                    continue
+                self._wait_for_submit_slot()
+                submit_time = self.clock()
+                try:
+                    invocation_arn = submit(job)
+                except Exception as e:
+                    # A job that cannot be started fails alone; the rest of the batch keeps running
+                    print(f"Job submit failed for {job_name(job)}: {e}")
+                    statuses[f"unsubmitted:{job_name(job)}"] = "Failed"
+                    self._fail(job, {"invocationArn": None}, on_failure, job_name, error=e)
+                    continue
+                print(f"Job started with invocation ARN: {invocation_arn}")
+                METRICS.record_span(
+                    "async_job_queue", submit_time - queued_at, stage=self.stage, job=job_name(job)
+                )
+                submitted_at[invocation_arn] = submit_time
+                in_flight[invocation_arn] = job
+                statuses[invocation_arn] = "InProgress"
+
+            # Poll every outstanding invocation in one pass
+            finished = 0
+            for invocation_arn in list(in_flight):
+                METRICS.increment("bedrock_requests", operation="get_async_invoke", stage=self.stage)
+                try:
+                    response = self.client.get_async_invoke(invocationArn=invocation_arn)
+                except Exception as e:
+                    # The invocation keeps running; poll it again next round, up to a limit
+                    poll_errors[invocation_arn] = poll_errors.get(invocation_arn, 0) + 1
+                    print(f"Polling {invocation_arn} failed ({poll_errors[invocation_arn]}): {e}")
+                    if poll_errors[invocation_arn] < self.max_poll_errors:
+                        continue
+                    job = in_flight.pop(invocation_arn)
+                    statuses[invocation_arn] = "Failed"
+                    finished += 1
+                    self._fail(
+                        job, {"invocationArn": invocation_arn}, on_failure, job_name, error=e
+                    )
+                    continue
+                poll_errors.pop(invocation_arn, None)
+                status = response["status"]
+                if status == "InProgress":
+                    continue
+
+                job = in_flight.pop(invocation_arn)
+                statuses[invocation_arn] = status
+                finished += 1
+                # Resumed jobs were submitted before this run, so their run time is unknown
+                if invocation_arn in submitted_at:
+                    METRICS.record_span(
+                        "async_job_run",
+                        self.clock() - submitted_at[invocation_arn],
+                        stage=self.stage,
+                        job=job_name(job),
+                        job_status=status,
+                    )
+                if status == "Completed":
+                    try:
+                        on_complete(job, response)
+                    except Exception as e:
+                        print(f"Job output processing failed for {job_name(job)}: {e}")
+                        statuses[invocation_arn] = "Failed"
+                        self._fail(job, response, on_failure, job_name, error=e)
+                else:
+                    print(f"Job failed: {response.get('failureMessage')}")
+                    self._fail(job, response, on_failure, job_name)
+
+            print(
+                f"Invocations in flight: {len(in_flight)}, pending: {len(pending)}, finished this round: {finished}"
+            )
+
+            # Only wait when nothing changed; a finished job frees a slot immediately
+            if in_flight and not finished:
+                self.sleep(self.poll_interval)
+
+        return statuses
+
+    def _fail(
+        self,
+        job: Any,
+        response: dict,
+        on_failure: Optional[Callable[[Any, dict], None]],
+        job_name: Callable[[Any], str],
+        error: Optional[Exception] = None,
+    ) -> None:
+        """Count a failed job and report it; an error raised by `on_failure` is printed, not raised."""
+        METRICS.increment("async_jobs_failed", stage=self.stage)
+        if on_failure is None:
+            return
+        if error is not None:
+            response = {**response, "status": "Failed", "failureMessage": str(error)}
+        try:
+            on_failure(job, response)
+        except Exception as e:
+            print(f"Job failure handling failed for {job_name(job)}: {e}")
+
+    def _wait_for_submit_slot(self) -> None:
+        """Sleep until the next submit is allowed by the rate budget."""
+        now = self.clock()
+        if self._last_submit is not None:
+            wait = self._last_submit + self.submit_interval - now
+            if wait > 0:
+                self.sleep(wait)
+                now = self.clock()
+        self._last_submit = now
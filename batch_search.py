@@ -0,0 +1,126 @@
+from typing import Callable, List, Optional, Sequence, Tuple
+import json
+import time
+
+import numpy as np
+from opensearchpy import OpenSearch
+
+from concurrent_requests import RETRYABLE_STATUSES, run_bounded, send_with_retries
+from search_queries import knn_query
+
+
+class BatchSearcher:
+    """Run many vector queries as pipelined `_msearch` requests.
+
+    Query vectors are packed into fixed-size batches, each sent as one
+    multi-search request from a worker pool, with the number of requests in
+    flight bounded. Responses are written back to the row of their query, so
+    results stay aligned with the input matrix. Queries rejected with a
+    retryable status are resent with backoff. The client's connection pool
+    (`pool_maxsize`) should be at least `max_workers`, so every worker reuses a
+    pooled connection.
+    """
+
+    def __init__(
+        self,
+        os_client: OpenSearch,
+        os_index: str,
+        build_query: Callable[[List[float]], dict] = knn_query,
+        batch_size: int = 50,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        initial_backoff: float = 1.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Initialize the batch searcher.
+
+        Args:
+            os_client (OpenSearch): The OpenSearch client instance (or a `LocalVectorIndex`).
+            os_index (str): The name of the OpenSearch index.
+            build_query (Callable[[List[float]], dict]): Builds the query body for a vector,
+                e.g., `lambda vector: knn_query(vector, k=10, inner_hits=True)`.
+            batch_size (int): The number of queries in one `_msearch` request.
+            max_workers (int): The number of `_msearch` requests sent concurrently.
+            max_retries (int): The maximum number of retries for rejected queries.
+            initial_backoff (float): The first retry delay, in seconds; doubled on each retry.
+            sleep (Callable[[float], None]): Sleep function, in seconds.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self.os_client = os_client
+        self.os_index = os_index
+        self.build_query = build_query
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.sleep = sleep
+
+    def search(self, queries: np.ndarray) -> List[dict]:
+        """Search with every row of a query matrix.
+
+        Args:
+            queries (np.ndarray): The (queries, dimensions) matrix of query vectors.
+
+        Returns:
+            List[dict]: One search response per query row, in input order; a query that failed
+                has an `error` entry instead of hits.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim != 2:
+            raise ValueError("queries must be a (queries, dimensions) matrix")
+
+        results: List[Optional[dict]] = [None] * len(queries)
+        start = time.perf_counter()
+
+        batches = (
+            list(range(first, min(first + self.batch_size, len(queries))))
+            for first in range(0, len(queries), self.batch_size)
+        )
+        run_bounded(
+            batches, lambda rows: self._send_batch(queries, rows, results), self.max_workers
+        )
+
+        seconds = time.perf_counter() - start
+        failed = sum(1 for result in results if result is None or "error" in result)
+        print(
+            f"Searched {len(queries)} queries in {seconds:.2f} seconds "
+            f"({len(queries) / seconds if seconds else 0.0:.1f} queries/sec, {failed} failed)"
+        )
+        return results
+
+    def _send_batch(
+        self, queries: np.ndarray, rows: Sequence[int], results: List[Optional[dict]]
+    ) -> None:
+        """Send one batch, writing each response to its row and retrying only rejected queries."""
+
+        def send(pending: List[int]) -> List[Tuple[int, dict]]:
+            lines = []
+            for row in pending:
+                lines.append(json.dumps({"index": self.os_index}))
+                lines.append(json.dumps(self.build_query(queries[row].tolist())))
+            body = "\n".join(lines) + "\n"
+
+            try:
+                responses = self.os_client.msearch(body=body, index=self.os_index)["responses"]
+            except Exception as ex:
+                # The whole request failed (e.g., a connection error), so every query is retryable
+                return [(row, {"error": str(ex)}) for row in pending]
+            # Rows past the end of a short response list were not answered, so they are retried
+            rejected = [
+                (row, {"error": "No msearch response for the query"})
+                for row in pending[len(responses) :]
+            ]
+            for row, response in zip(pending, responses):
+                if "error" in response and response.get("status") in RETRYABLE_STATUSES:
+                    rejected.append((row, response))
+                else:
+                    results[row] = response
+            return rejected
+
+        rejected, _ = send_with_retries(
+            list(rows), send, self.max_retries, self.initial_backoff, self.sleep, "queries"
+        )
+        for row, error in rejected:
+            results[row] = error
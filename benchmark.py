@@ -0,0 +1,337 @@
+# Summary: This script benchmarks the notebook's search strategies (k-NN, filtered, inner hits, all inner hits,
+#          radial, and the t-SNE fetch) for quality and speed. Exact brute-force cosine search over the local
+#          embedding files is the ground truth; each strategy is scored by recall@k and nDCG@k and timed for
+#          p50/p95/p99 latency and QPS at several concurrency levels, against OpenSearch (one index per
+#          index profile) or the local vector engine. Results are written to JSON and CSV files.
+# Author: Gary A. Stafford
+# Date: 2025-07-23
+# License: MIT License
+
+import csv
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import boto3
+import numpy as np
+from dotenv import load_dotenv
+
+from local_search import LocalVectorIndex
+from query_cache import QueryEmbeddingCache
+from query_encoder import QueryEncoder
+from search_queries import duration_filter, embedding_option_filter, knn_query, radial_query
+from utilities import Utilities
+
+load_dotenv()  # Loads variables from .env file
+
+AWS_REGION = os.getenv("AWS_REGION_MARENGO")
+S3_VIDEO_STORAGE_BUCKET_MARENGO = os.getenv("S3_VIDEO_STORAGE_BUCKET_MARENGO")
+OPENSEARCH_ENDPOINT = os.getenv("OPENSEARCH_ENDPOINT")
+INDEX_NAME = "tv-commercials-index"
+
+LOCAL_EMBEDDINGS_DIRECTORY = "bedrock_marengo_embeddings"
+LOCAL_ANALYSIS_DIRECTORY = "bedrock_pegasus_analyses"
+OUTPUT_DIRECTORY = "benchmark_results"
+
+# Benchmark target: local (the in-process engine) or opensearch
+TARGET = os.getenv("BENCHMARK_TARGET", "local")
+# Index profiles to compare; each is benchmarked against the index named <INDEX_NAME>-<profile>,
+# or against INDEX_NAME itself for the profile named "default"
+PROFILES = os.getenv("BENCHMARK_PROFILES", "default").split(",")
+# JSON list of {"text": ...} or {"id": ..., "embedding": [...]} queries; if unset, segment
+# vectors sampled from the local embeddings are used as queries
+QUERIES_FILE_PATH = os.getenv("BENCHMARK_QUERIES")
+NUM_SAMPLE_QUERIES = int(os.getenv("BENCHMARK_NUM_SAMPLE_QUERIES", "50"))
+CONCURRENCY_LEVELS = [int(c) for c in os.getenv("BENCHMARK_CONCURRENCY", "1,4,8").split(",")]
+K = int(os.getenv("BENCHMARK_K", "6"))
+RADIAL_MAX_DISTANCE = 1.0
+WARMUP_QUERIES = 5
+
+
+class Strategy(NamedTuple):
+    name: str
+    build: Callable[[List[float], int], dict]
+
+
+# The search variants from the notebook, built with the shared query builders
+STRATEGIES = [
+    Strategy("knn", lambda embedding, k: knn_query(embedding, k=k)),
+    Strategy(
+        "knn_filtered",
+        lambda embedding, k: knn_query(embedding, k=k, filter=duration_filter(20, 60)),
+    ),
+    Strategy("inner_hits", lambda embedding, k: knn_query(embedding, k=k, inner_hits=True)),
+    Strategy(
+        "all_inner_hits",
+        lambda embedding, k: knn_query(
+            embedding, k=k, inner_hits=True, expand_nested_docs=True
+        ),
+    ),
+    Strategy(
+        "all_inner_hits_audio",
+        lambda embedding, k: knn_query(
+            embedding,
+            k=k,
+            filter=embedding_option_filter("audio"),
+            inner_hits=True,
+            expand_nested_docs=True,
+        ),
+    ),
+    Strategy(
+        "radial",
+        lambda embedding, k: radial_query(embedding, max_distance=RADIAL_MAX_DISTANCE, size=k),
+    ),
+    Strategy(
+        "t_sne_fetch",
+        lambda embedding, k: knn_query(
+            embedding, k=9, inner_hits=True, include_vectors=True
+        ),
+    ),
+]
+
+
+def main() -> None:
+    ground_truth = LocalVectorIndex.from_embeddings(
+        LOCAL_EMBEDDINGS_DIRECTORY, LOCAL_ANALYSIS_DIRECTORY
+    )
+    print(f"Ground truth: {len(ground_truth)} videos, {len(ground_truth.vectors)} segments")
+
+    queries = load_queries(ground_truth)
+    print(f"Queries: {len(queries)}")
+
+    if TARGET == "opensearch":
+        os_client = Utilities.create_opensearch_client(OPENSEARCH_ENDPOINT, AWS_REGION)
+        targets = [
+            (
+                profile,
+                os_client,
+                INDEX_NAME if profile == "default" else f"{INDEX_NAME}-{profile}",
+            )
+            for profile in PROFILES
+        ]
+    elif TARGET == "local":
+        targets = [("exact", ground_truth, ground_truth.index_name)]
+    else:
+        raise ValueError(f"Unsupported benchmark target: {TARGET}")
+
+    rows = []
+    for profile, client, index in targets:
+        for strategy in STRATEGIES:
+            rows.extend(
+                benchmark_strategy(
+                    client,
+                    index,
+                    ground_truth,
+                    queries,
+                    strategy,
+                    profile,
+                    K,
+                    CONCURRENCY_LEVELS,
+                )
+            )
+
+    json_file_path, csv_file_path = write_results(rows, OUTPUT_DIRECTORY)
+    print(f"Results written to {json_file_path} and {csv_file_path}")
+
+
+def load_queries(ground_truth: LocalVectorIndex) -> List[Tuple[str, List[float]]]:
+    """Load the query set as (query ID, embedding) pairs.
+    Args:
+        ground_truth (LocalVectorIndex): The local index, used to sample queries when no query file is set.
+    Returns:
+        List[Tuple[str, List[float]]]: The queries.
+    """
+    if QUERIES_FILE_PATH is None:
+        # Query by example: sampled segment vectors stand in for text query embeddings
+        rng = np.random.default_rng(42)
+        rows = rng.choice(
+            len(ground_truth.vectors),
+            size=min(NUM_SAMPLE_QUERIES, len(ground_truth.vectors)),
+            replace=False,
+        )
+        return [(f"segment-{row}", ground_truth.vectors[row].tolist()) for row in rows]
+
+    with open(QUERIES_FILE_PATH, "r") as f:
+        entries = json.load(f)
+
+    encoder = None
+    queries = []
+    for i, entry in enumerate(entries):
+        if "embedding" in entry:
+            queries.append((entry.get("id", str(i)), entry["embedding"]))
+            continue
+        if encoder is None:
+            encoder = QueryEncoder(
+                boto3.client("bedrock-runtime", region_name=AWS_REGION),
+                boto3.client("s3", region_name=AWS_REGION),
+                bucket=S3_VIDEO_STORAGE_BUCKET_MARENGO,
+                cache=QueryEmbeddingCache(),
+            )
+        queries.append((entry.get("id", entry["text"]), encoder.encode(entry["text"])))
+    return queries
+
+
+def benchmark_strategy(
+    client,
+    index: str,
+    ground_truth: LocalVectorIndex,
+    queries: List[Tuple[str, List[float]]],
+    strategy: Strategy,
+    profile: str,
+    k: int,
+    concurrency_levels: List[int],
+) -> List[dict]:
+    """Score one strategy against the exact ground truth and time it at each concurrency level.
+    Args:
+        client: The OpenSearch client, or a LocalVectorIndex.
+        index (str): The index to search.
+        ground_truth (LocalVectorIndex): The exact local index.
+        queries (List[Tuple[str, List[float]]]): The (query ID, embedding) pairs.
+        strategy (Strategy): The strategy to benchmark.
+        profile (str): The index profile name, for reporting.
+        k (int): The number of videos to score.
+        concurrency_levels (List[int]): The numbers of concurrent searches to time.
+    Returns:
+        List[dict]: One result row per concurrency level.
+    """
+    bodies = [strategy.build(embedding, k) for _, embedding in queries]
+
+    # Quality does not depend on concurrency, so it is measured once
+    recalls, ndcgs, segment_recalls = [], [], []
+    for body in bodies:
+        expected = ground_truth.search(body)
+        response = client.search(body=body, index=index)
+        expected_scores = {hit["_id"]: hit["_score"] for hit in expected["hits"]["hits"]}
+        retrieved = [hit["_id"] for hit in response["hits"]["hits"]]
+        cutoff = len(expected["hits"]["hits"])
+        recalls.append(recall_at_k(retrieved, list(expected_scores), cutoff))
+        ndcgs.append(ndcg_at_k(retrieved, expected_scores, cutoff))
+        if "inner_hits" in body["query"]["nested"]:
+            segment_recalls.append(
+                recall_at_k(segment_keys(response), segment_keys(expected), None)
+            )
+
+    rows = []
+    for concurrency in concurrency_levels:
+        latencies, seconds = time_searches(client, index, bodies, concurrency)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        row = {
+            "target": TARGET,
+            "profile": profile,
+            "strategy": strategy.name,
+            "k": k,
+            "queries": len(bodies),
+            "concurrency": concurrency,
+            f"recall@{k}": round(float(np.mean(recalls)), 4),
+            f"ndcg@{k}": round(float(np.mean(ndcgs)), 4),
+            "segment_recall": (
+                round(float(np.mean(segment_recalls)), 4) if segment_recalls else None
+            ),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+            "qps": round(len(bodies) / seconds, 1) if seconds else None,
+        }
+        print(
+            f"{profile}/{strategy.name} x{concurrency}: recall@{k} {row[f'recall@{k}']}, "
+            f"nDCG@{k} {row[f'ndcg@{k}']}, p50 {row['p50_ms']} ms, p99 {row['p99_ms']} ms, "
+            f"{row['qps']} QPS"
+        )
+        rows.append(row)
+    return rows
+
+
+def time_searches(
+    client, index: str, bodies: List[dict], concurrency: int
+) -> Tuple[np.ndarray, float]:
+    """Run every query with a number of concurrent workers, timing each search.
+    Args:
+        client: The OpenSearch client, or a LocalVectorIndex.
+        index (str): The index to search.
+        bodies (List[dict]): The query bodies.
+        concurrency (int): The number of concurrent searches.
+    Returns:
+        Tuple[np.ndarray, float]: Each search's latency, in seconds, and the total elapsed time.
+    """
+
+    def timed_search(body: dict) -> float:
+        start = time.perf_counter()
+        client.search(body=body, index=index)
+        return time.perf_counter() - start
+
+    for body in bodies[:WARMUP_QUERIES]:
+        client.search(body=body, index=index)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        latencies = list(executor.map(timed_search, bodies))
+        seconds = time.perf_counter() - start
+    return np.asarray(latencies), seconds
+
+
+def recall_at_k(retrieved: List, relevant: List, k: Optional[int]) -> float:
+    """The share of the relevant items found in the first k retrieved items (1.0 if none are relevant)."""
+    relevant = set(relevant[:k] if k is not None else relevant)
+    if not relevant:
+        return 1.0
+    found = set(retrieved[:k] if k is not None else retrieved)
+    return len(found & relevant) / len(relevant)
+
+
+def ndcg_at_k(retrieved: List[str], relevance: Dict[str, float], k: int) -> float:
+    """Normalized discounted cumulative gain, with each video's exact score as its graded relevance."""
+    if not relevance or k == 0:
+        return 1.0
+    dcg = sum(
+        relevance.get(doc_id, 0.0) / math.log2(rank + 2)
+        for rank, doc_id in enumerate(retrieved[:k])
+    )
+    ideal = sorted(relevance.values(), reverse=True)[:k]
+    idcg = sum(gain / math.log2(rank + 2) for rank, gain in enumerate(ideal))
+    return dcg / idcg if idcg else 1.0
+
+
+def segment_keys(response: dict) -> List[Tuple[str, str, float]]:
+    """List the (video, embedding option, start time) of every inner hit segment in a response."""
+    keys = []
+    for hit in response["hits"]["hits"]:
+        inner_hits = hit.get("inner_hits", {}).get("embeddings", {}).get("hits", {})
+        for inner_hit in inner_hits.get("hits", []):
+            fields = inner_hit.get("fields", {})
+            source = inner_hit.get("_source", {})
+            option = fields.get("embeddings.embeddingOption", [source.get("embeddingOption")])[0]
+            start_sec = fields.get("embeddings.startSec", [source.get("startSec")])[0]
+            keys.append((hit["_id"], option, round(float(start_sec), 2)))
+    return keys
+
+
+def write_results(rows: List[dict], directory: str) -> Tuple[str, str]:
+    """Write the result rows to timestamped JSON and CSV files.
+    Args:
+        rows (List[dict]): The result rows.
+        directory (str): The output directory.
+    Returns:
+        Tuple[str, str]: The JSON and CSV file paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    timestamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    json_file_path = os.path.join(directory, f"benchmark_{timestamp}.json")
+    csv_file_path = os.path.join(directory, f"benchmark_{timestamp}.csv")
+
+    with open(json_file_path, "w") as f:
+        json.dump({"dateCreated": timestamp, "results": rows}, f, indent=2)
+
+    fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+    with open(csv_file_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    return json_file_path, csv_file_path
+
+
+if __name__ == "__main__":
+    main()
+    print("Benchmark completed successfully.")
@@ -0,0 +1,286 @@
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import json
+import os
+import time
+
+from opensearchpy import OpenSearch
+from pydantic import BaseModel
+
+from concurrent_requests import RETRYABLE_STATUSES, run_bounded, send_with_retries
+from instrumentation import METRICS
+from manifest import Manifest
+
+
+class BulkIndexResult(BaseModel):
+    indexed: int = 0
+    failed: int = 0
+    retried: int = 0
+    chunks: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    errors: List[dict] = []
+    failed_ids: List[str] = []
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.indexed / self.seconds if self.seconds else 0.0
+
+    def merge(self, other: "BulkIndexResult") -> None:
+        """Add the counts from a chunk's result to this result."""
+        self.indexed += other.indexed
+        self.failed += other.failed
+        self.retried += other.retried
+        self.chunks += other.chunks
+        self.bytes += other.bytes
+        self.failed_ids.extend(other.failed_ids)
+        self.errors.extend(other.errors[: max(0, 10 - len(self.errors))])
+
+
+class BulkIndexer:
+    """Stream documents into OpenSearch in size- and count-capped bulk requests.
+
+    Documents are read one file at a time and packed into chunks that stay under
+    both caps, so memory use is bounded by the number of chunks in flight rather
+    than the corpus size. Chunks are sent from a worker pool; each per-item
+    response is checked and only the rejected items are retried with backoff.
+    """
+
+    def __init__(
+        self,
+        os_client: OpenSearch,
+        os_index: str,
+        action: str = "create",
+        id_field: Optional[str] = None,
+        max_chunk_bytes: int = 5 * 1024 * 1024,
+        max_chunk_docs: int = 500,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        initial_backoff: float = 1.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Initialize the bulk indexer.
+
+        Args:
+            os_client (OpenSearch): The OpenSearch client instance (or a local stand-in with `bulk`).
+            os_index (str): The name of the OpenSearch index.
+            action (str): The bulk action for each document: create, index, or update.
+            id_field (str, optional): The document field to use as `_id`; OpenSearch assigns IDs if omitted.
+            max_chunk_bytes (int): The maximum size of one bulk request body, in bytes.
+            max_chunk_docs (int): The maximum number of documents in one bulk request.
+            max_workers (int): The number of bulk requests sent concurrently.
+            max_retries (int): The maximum number of retries for rejected items.
+            initial_backoff (float): The first retry delay, in seconds; doubled on each retry.
+            sleep (Callable[[float], None]): Sleep function, in seconds.
+        """
+        if action not in ("create", "index", "update"):
+            raise ValueError(f"Unsupported bulk action: {action}")
+        if action == "update" and id_field is None:
+            raise ValueError("The update action requires an id_field")
+
+        self.os_client = os_client
+        self.os_index = os_index
+        self.action = action
+        self.id_field = id_field
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_chunk_docs = max_chunk_docs
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.sleep = sleep
+
+    def index_directory(self, document_path: str) -> BulkIndexResult:
+        """Index every JSON document in a directory.
+
+        Args:
+            document_path (str): Directory containing the document JSON files.
+
+        Returns:
+            BulkIndexResult: The indexing counts and throughput.
+        """
+        return self.index_documents(iter_documents(document_path))
+
+    def index_changed_documents(
+        self, document_path: str, document_manifest: Manifest, index_manifest: Manifest
+    ) -> BulkIndexResult:
+        """Index only the documents whose content hash differs from the one last indexed.
+
+        Documents are addressed by `id_field`, so a changed document replaces (or,
+        with the update action, upserts) the indexed copy instead of duplicating it.
+
+        Args:
+            document_path (str): Directory containing the document JSON files.
+            document_manifest (Manifest): The input hash of each prepared document, keyed by file name.
+            index_manifest (Manifest): The hash of each document last indexed, keyed by file name;
+                updated for every document indexed successfully.
+
+        Returns:
+            BulkIndexResult: The indexing counts and throughput.
+        """
+        if self.id_field is None:
+            raise ValueError("Incremental indexing requires an id_field")
+
+        changed = [
+            file
+            for file in document_manifest
+            if not index_manifest.is_current(file, document_manifest.get(file)["fingerprint"])
+        ]
+        print(
+            f"Documents changed since last indexed: {len(changed)}, "
+            f"unchanged: {len(document_manifest) - len(changed)}"
+        )
+
+        document_ids = {}
+
+        def iter_changed_documents() -> Iterator[dict]:
+            for file in changed:
+                file_path = os.path.join(document_path, file)
+                # A document deleted after it was prepared is left out rather than failing the run
+                if not os.path.exists(file_path):
+                    print(f"Skipping {file}, listed in the manifest but not found: {file_path}")
+                    continue
+                with open(file_path, "r") as f:
+                    document = json.load(f)
+                document_ids[file] = document[self.id_field]
+                yield document
+
+        result = self.index_documents(iter_changed_documents())
+        failed_ids = set(result.failed_ids)
+        for file, document_id in document_ids.items():
+            if document_id not in failed_ids:
+                index_manifest.record(file, document_manifest.get(file)["fingerprint"])
+        return result
+
+    def index_documents(self, documents: Iterable[dict]) -> BulkIndexResult:
+        """Index a stream of documents.
+
+        Args:
+            documents (Iterable[dict]): The documents to index.
+
+        Returns:
+            BulkIndexResult: The indexing counts and throughput.
+        """
+        result = BulkIndexResult()
+        start = time.perf_counter()
+
+        run_bounded(
+            self._iter_chunks(documents), self._send_chunk, self.max_workers, result.merge
+        )
+
+        result.seconds = time.perf_counter() - start
+        print(
+            f"Indexed {result.indexed} documents in {result.chunks} chunks "
+            f"({result.failed} failed, {result.retried} retried) "
+            f"in {result.seconds:.2f} seconds: {result.docs_per_second:.1f} docs/sec"
+        )
+        return result
+
+    def _iter_chunks(self, documents: Iterable[dict]) -> Iterator[List[Tuple[str, str]]]:
+        """Serialize documents into chunks of (action line, source line) pairs."""
+        chunk: List[Tuple[str, str]] = []
+        chunk_bytes = 0
+        for document in documents:
+            pair = self._serialize(document)
+            pair_bytes = len(pair[0].encode("utf-8")) + len(pair[1].encode("utf-8"))
+            if chunk and (
+                chunk_bytes + pair_bytes > self.max_chunk_bytes
+                or len(chunk) >= self.max_chunk_docs
+            ):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(pair)
+            chunk_bytes += pair_bytes
+        if chunk:
+            yield chunk
+
+    def _serialize(self, document: dict) -> Tuple[str, str]:
+        """Serialize one document into its bulk action and source lines."""
+        metadata = {"_index": self.os_index}
+        if self.id_field is not None:
+            metadata["_id"] = document[self.id_field]
+        source = {"doc": document, "doc_as_upsert": True} if self.action == "update" else document
+        return (
+            json.dumps({self.action: metadata}) + "\n",
+            json.dumps(source) + "\n",
+        )
+
+    def _send_chunk(self, chunk: List[Tuple[str, str]]) -> BulkIndexResult:
+        """Send one chunk, retrying only the items OpenSearch rejected."""
+        result = BulkIndexResult(chunks=1)
+
+        def send(pending: List[Tuple[str, str]]) -> List[Tuple[Tuple[str, str], dict]]:
+            body = "".join(line for pair in pending for line in pair)
+            body_bytes = len(body.encode("utf-8"))
+            result.bytes += body_bytes
+            METRICS.increment("bytes_sent", body_bytes, stage="index")
+            started = time.perf_counter()
+            try:
+                response = self.os_client.bulk(index=self.os_index, body=body)
+            except Exception as ex:
+                METRICS.record_span(
+                    "bulk_request",
+                    time.perf_counter() - started,
+                    stage="index",
+                    documents=len(pending),
+                    bytes=body_bytes,
+                    status="error",
+                    error=type(ex).__name__,
+                )
+                # The whole request failed (e.g., a connection error), so every item is retryable
+                return [
+                    (pair, {"status": None, "error": str(ex), "_id": _document_id(pair)})
+                    for pair in pending
+                ]
+            METRICS.record_span(
+                "bulk_request",
+                time.perf_counter() - started,
+                stage="index",
+                documents=len(pending),
+                bytes=body_bytes,
+            )
+            rejected = []
+            for pair, item in zip(pending, response["items"]):
+                status = next(iter(item.values()))
+                if status.get("error") is None:
+                    result.indexed += 1
+                elif status["status"] in RETRYABLE_STATUSES:
+                    rejected.append((pair, status))
+                else:
+                    result.failed += 1
+                    result.errors.append(status)
+                    if "_id" in status:
+                        result.failed_ids.append(status["_id"])
+            return rejected
+
+        rejected, result.retried = send_with_retries(
+            chunk, send, self.max_retries, self.initial_backoff, self.sleep, "documents"
+        )
+        errors = [error for _, error in rejected]
+        result.failed += len(errors)
+        result.errors.extend(errors[:10])
+        result.failed_ids.extend(e["_id"] for e in errors if e.get("_id") is not None)
+
+        METRICS.increment("documents_indexed", result.indexed, stage="index")
+        METRICS.increment("documents_failed", result.failed, stage="index")
+        METRICS.increment("bulk_retries", result.retried, stage="index")
+        return result
+
+
+def _document_id(pair: Tuple[str, str]) -> Optional[str]:
+    """Get the `_id` from a serialized action line, if one was set."""
+    metadata = next(iter(json.loads(pair[0]).values()))
+    return metadata.get("_id")
+
+
+def iter_documents(document_path: str) -> Iterator[dict]:
+    """Read the JSON documents in a directory one file at a time.
+
+    Args:
+        document_path (str): Directory containing the document JSON files.
+
+    Yields:
+        dict: Each parsed document.
+    """
+    for file in sorted(os.listdir(document_path)):
+        if file.endswith(".json"):
+            with open(os.path.join(document_path, file), "r") as f:
+                yield json.load(f)
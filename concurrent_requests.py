@@ -0,0 +1,82 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, List, Set, Tuple, TypeVar
+import random
+import time
+
+# Per-item statuses worth retrying: rejected by a full queue or a temporarily unavailable node
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+Task = TypeVar("Task")
+Item = TypeVar("Item")
+Result = TypeVar("Result")
+
+
+def run_bounded(
+    tasks: Iterable[Task],
+    send: Callable[[Task], Result],
+    max_workers: int,
+    on_result: Callable[[Result], None] = lambda result: None,
+) -> None:
+    """Send tasks from a worker pool, bounding the number of tasks in flight.
+
+    Tasks are pulled from the iterable only as workers free up, so at most
+    twice `max_workers` tasks (e.g., serialized request bodies) are held in
+    memory at once, however long the stream is.
+
+    Args:
+        tasks (Iterable[Task]): The tasks, e.g., a generator of bulk chunks or query batches.
+        send (Callable[[Task], Result]): Sends one task; runs on a worker thread.
+        max_workers (int): The number of tasks sent concurrently.
+        on_result (Callable[[Result], None]): Called with each task's result, on the calling thread.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight: Set[Future] = set()
+        for task in tasks:
+            if len(in_flight) >= max_workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    on_result(future.result())
+            in_flight.add(executor.submit(send, task))
+        for future in in_flight:
+            on_result(future.result())
+
+
+def send_with_retries(
+    items: List[Item],
+    send: Callable[[List[Item]], List[Tuple[Item, dict]]],
+    max_retries: int,
+    initial_backoff: float,
+    sleep: Callable[[float], None] = time.sleep,
+    description: str = "items",
+) -> Tuple[List[Tuple[Item, dict]], int]:
+    """Send items in one request, resending only the rejected ones with exponential backoff.
+
+    Args:
+        items (List[Item]): The items of the request, e.g., bulk documents or msearch queries.
+        send (Callable): Sends a list of items, handles the accepted and permanently failed
+            ones itself, and returns the (item, error) pairs rejected with a retryable status.
+        max_retries (int): The maximum number of retries.
+        initial_backoff (float): The first retry delay, in seconds; doubled on each retry, plus jitter.
+        sleep (Callable[[float], None]): Sleep function, in seconds.
+        description (str): The plural name of the items, for the retry message.
+
+    Returns:
+        Tuple[List[Tuple[Item, dict]], int]: The (item, error) pairs still rejected after the
+            last retry, and the number of item retries.
+    """
+    pending, rejected = items, []
+    attempt = retried = 0
+    while pending:
+        rejected = send(pending)
+        if not rejected or attempt >= max_retries:
+            break
+
+        attempt += 1
+        retried += len(rejected)
+        backoff_time = initial_backoff * (2 ** (attempt - 1)) + random.uniform(0, 1)
+        print(
+            f"Retrying {len(rejected)} rejected {description} in {backoff_time:.2f} seconds (attempt {attempt})..."
+        )
+        sleep(backoff_time)
+        pending = [item for item, _ in rejected]
+    return rejected, retried
@@ -1,5 +1,8 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, PrivateAttr
+from typing import Dict, List, Optional
+import json
+
+import numpy as np
 
 
 # Data models for TwelveLabs Marengo model for vector embeddings structure
@@ -20,6 +23,71 @@ class VideoEmbeddings(BaseModel):
     contentType: str
     embeddings: List[VideoEmbeddingSegment]
 
+    # Segment vectors as one (segments, dimensions) matrix; memory-mapped when loaded from .npy
+    _vectors: Optional[np.ndarray] = PrivateAttr(default=None)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Return the segment embeddings as a (segments, dimensions) matrix.
+        Vectors loaded with `from_npy` keep their stored dtype (float32 or float16) and are not copied;
+        otherwise the matrix is built once from the segment embedding lists as float32.
+        """
+        if self._vectors is None:
+            self._vectors = np.asarray(
+                [segment.embedding for segment in self.embeddings], dtype=np.float32
+            )
+        return self._vectors
+
+    def to_npy(self, npy_file_path: str, dtype: str = "float32") -> None:
+        """Write the segment vectors to a .npy file and everything else to a JSON metadata sidecar.
+        Args:
+            npy_file_path (str): The path of the .npy file; the sidecar is written next to it as .meta.json.
+            dtype (str): The on-disk vector dtype, float32 or float16.
+        """
+        vectors = np.ascontiguousarray(self.vectors, dtype=dtype)
+        metadata = self.model_dump(exclude={"embeddings": {"__all__": {"embedding"}}})
+        np.save(npy_file_path, vectors)
+        with open(_metadata_file_path(npy_file_path), "w") as f:
+            json.dump(metadata, f, indent=2)
+
+    @classmethod
+    def from_npy(cls, npy_file_path: str, mmap: bool = True) -> "VideoEmbeddings":
+        """Lazily load video embeddings written by `to_npy`.
+        The segment embedding lists are left empty; read the vectors through `vectors`, which is
+        memory-mapped by default, or call `materialize` when the lists are needed.
+        Args:
+            npy_file_path (str): The path of the .npy file.
+            mmap (bool): Memory-map the vectors instead of reading them into memory.
+        Returns:
+            VideoEmbeddings: The video embeddings object.
+        """
+        with open(_metadata_file_path(npy_file_path), "r") as f:
+            metadata = json.load(f)
+        for segment in metadata["embeddings"]:
+            segment["embedding"] = []
+
+        video_embeddings = cls(**metadata)
+        video_embeddings._vectors = np.load(npy_file_path, mmap_mode="r" if mmap else None)
+        return video_embeddings
+
+    def materialize(self) -> "VideoEmbeddings":
+        """Return a copy whose segment embedding lists are filled from the vectors.
+        Returns:
+            VideoEmbeddings: The video embeddings object with embedding lists populated.
+        """
+        if all(segment.embedding for segment in self.embeddings):
+            return self
+
+        vectors = self.vectors.astype(np.float32, copy=False).tolist()
+        return self.model_copy(
+            update={
+                "embeddings": [
+                    segment.model_copy(update={"embedding": vector})
+                    for segment, vector in zip(self.embeddings, vectors)
+                ]
+            }
+        )
+
 
 # Data model for TwelveLabs Pegasus model for video analysis structure
 class VideoAnalysis(BaseModel):
@@ -44,3 +112,18 @@ class OpenSearchDocument(BaseModel):
     sizeBytes: int
     durationSec: float = 0.0
     embeddings: List[VideoEmbeddingSegment]
+
+
+# Data model for a time range of a video merged from matching search result segments
+class VideoClip(BaseModel):
+    videoName: str
+    title: Optional[str] = None
+    startSec: float
+    endSec: float
+    score: float
+    modalityScores: Dict[str, float] = {}
+    offsets: List[int] = []
+
+
+def _metadata_file_path(npy_file_path: str) -> str:
+    return f"{npy_file_path[: -len('.npy')]}.meta.json"
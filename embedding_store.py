@@ -0,0 +1,125 @@
+from typing import Iterator, List
+import os
+
+from data import VideoEmbeddings
+
+EMBEDDINGS_FORMATS = ("json", "npy")
+
+
+def get_embeddings_file_path(
+    directory: str, file_name: str, file_format: str = "json"
+) -> str:
+    """Get the local path of a video's embeddings file.
+    Args:
+        directory (str): The local embeddings directory.
+        file_name (str): The video or embeddings file name (e.g., video.mp4 or video.json).
+        file_format (str): The embeddings file format, json or npy.
+    Returns:
+        str: The path of the embeddings file.
+    """
+    if file_format not in EMBEDDINGS_FORMATS:
+        raise ValueError(f"Unsupported embeddings format: {file_format}")
+    stem = os.path.splitext(file_name)[0]
+    return os.path.join(directory, f"{stem}.{file_format}")
+
+
+def embeddings_exist(directory: str, file_name: str) -> bool:
+    """Check whether a video's embeddings exist locally in any format.
+    Args:
+        directory (str): The local embeddings directory.
+        file_name (str): The video or embeddings file name.
+    Returns:
+        bool: True if a JSON or .npy embeddings file exists.
+    """
+    return any(
+        os.path.exists(get_embeddings_file_path(directory, file_name, file_format))
+        for file_format in EMBEDDINGS_FORMATS
+    )
+
+
+def get_embeddings_source_files(directory: str, file_name: str) -> List[str]:
+    """Get the local files that `read_video_embeddings` reads for a video, e.g., to hash them.
+    Args:
+        directory (str): The local embeddings directory.
+        file_name (str): The video or embeddings file name.
+    Returns:
+        List[str]: The .npy file and its metadata sidecar, or the JSON file; empty if none exist.
+    """
+    npy_file_path = get_embeddings_file_path(directory, file_name, "npy")
+    if os.path.exists(npy_file_path):
+        stem = os.path.splitext(npy_file_path)[0]
+        return [npy_file_path, f"{stem}.meta.json"]
+
+    json_file_path = get_embeddings_file_path(directory, file_name, "json")
+    return [json_file_path] if os.path.exists(json_file_path) else []
+
+
+def write_video_embeddings(
+    video_embeddings: VideoEmbeddings,
+    directory: str,
+    file_format: str = "json",
+    dtype: str = "float32",
+) -> str:
+    """Write video embeddings to the local directory.
+    Args:
+        video_embeddings (VideoEmbeddings): The video embeddings object.
+        directory (str): The local embeddings directory.
+        file_format (str): json for pretty-printed JSON, or npy for a .npy vector matrix plus a .meta.json sidecar.
+        dtype (str): The on-disk vector dtype for npy, float32 or float16.
+    Returns:
+        str: The path of the embeddings file that was written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    file_path = get_embeddings_file_path(
+        directory, video_embeddings.videoName, file_format
+    )
+    if file_format == "npy":
+        video_embeddings.to_npy(file_path, dtype=dtype)
+    else:
+        with open(file_path, "w") as f:
+            f.write(video_embeddings.model_dump_json(indent=2))
+    return file_path
+
+
+def read_video_embeddings(
+    directory: str, file_name: str, mmap: bool = True
+) -> VideoEmbeddings:
+    """Read a video's embeddings, preferring the .npy format when both formats exist.
+    Args:
+        directory (str): The local embeddings directory.
+        file_name (str): The video or embeddings file name.
+        mmap (bool): Memory-map .npy vectors instead of reading them into memory.
+    Returns:
+        VideoEmbeddings: The video embeddings object; lazily loaded for the .npy format.
+    Raises:
+        FileNotFoundError: If no embeddings file exists.
+    """
+    npy_file_path = get_embeddings_file_path(directory, file_name, "npy")
+    if os.path.exists(npy_file_path):
+        return VideoEmbeddings.from_npy(npy_file_path, mmap=mmap)
+
+    json_file_path = get_embeddings_file_path(directory, file_name, "json")
+    if not os.path.exists(json_file_path):
+        raise FileNotFoundError(f"File not found: {json_file_path}")
+    with open(json_file_path, "r") as f:
+        return VideoEmbeddings.model_validate_json(f.read())
+
+
+def iter_video_embeddings(directory: str, mmap: bool = True) -> Iterator[VideoEmbeddings]:
+    """Iterate over every video's embeddings in the local directory, one video at a time.
+    Args:
+        directory (str): The local embeddings directory.
+        mmap (bool): Memory-map .npy vectors instead of reading them into memory.
+    Yields:
+        VideoEmbeddings: The video embeddings object for each video.
+    """
+    file_names = {}
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.startswith("_") or file_name.endswith(".meta.json"):
+            continue
+        stem, extension = os.path.splitext(file_name)
+        if extension.lstrip(".") in EMBEDDINGS_FORMATS:
+            file_names[stem] = file_name
+
+    for stem in sorted(file_names):
+        yield read_video_embeddings(directory, file_names[stem], mmap=mmap)
@@ -0,0 +1,224 @@
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple
+import codecs
+import json
+import os
+import re
+
+import numpy as np
+
+from data import VideoEmbeddingSegment
+from embedding_store import get_embeddings_file_path
+
+CHUNK_SIZE = 64 * 1024
+
+# The start of the segment list in a Marengo output file: {"data": [{...}, {...}]}
+_DATA_ARRAY = re.compile(r'"data"\s*:\s*\[')
+_SEPARATORS = " \t\r\n,"
+
+
+def iter_output_segments(
+    stream: BinaryIO, chunk_size: int = CHUNK_SIZE
+) -> Iterator[VideoEmbeddingSegment]:
+    """Parse the segments of a Marengo output file one by one, without reading the whole file.
+    Only the current segment and one chunk of text are held in memory at a time.
+    Args:
+        stream (BinaryIO): The output file, e.g., an S3 object's streaming body or an open file.
+        chunk_size (int): The number of bytes read at a time.
+    Yields:
+        VideoEmbeddingSegment: Each segment, in file order.
+    Raises:
+        ValueError: If the file ends before the segment list does.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, position, in_array = "", 0, False
+
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+        while True:
+            if not in_array:
+                match = _DATA_ARRAY.search(buffer, position)
+                if match is None:
+                    break
+                position, in_array = match.end(), True
+
+            while position < len(buffer) and buffer[position] in _SEPARATORS:
+                position += 1
+            if position == len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+
+            try:
+                segment, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # The segment continues in the next chunk
+            position = end
+            yield VideoEmbeddingSegment(**segment)
+
+    raise ValueError("The Marengo output ended before its segment list")
+
+
+def plan_windows(duration_sec: Optional[float], window_sec: float) -> List[Tuple[float, float]]:
+    """Split a video into consecutive time windows, each processed as a separate Marengo job.
+    Args:
+        duration_sec (float, optional): The video duration, in seconds; None if unknown.
+        window_sec (float): The window length, in seconds; 0 disables splitting.
+    Returns:
+        List[Tuple[float, float]]: The (startSec, lengthSec) of each window; a single (0, 0) entry,
+            meaning the whole video, if the video fits in one window or its duration is unknown.
+    """
+    if not duration_sec or window_sec <= 0 or duration_sec <= window_sec:
+        return [(0.0, 0.0)]
+    windows = []
+    start = 0.0
+    while start < duration_sec:
+        windows.append((start, min(window_sec, duration_sec - start)))
+        start += window_sec
+    return windows
+
+
+class SegmentSpool:
+    """Append-only on-disk store for the segments of one video or video window.
+
+    Each vector is written to a raw float32 file as soon as its segment is
+    parsed, and the rest of the segment to a JSON lines file, so a window's
+    segments are never held in memory together. `write_spooled_video_embeddings`
+    later combines the spools of a video, in window order, into its embeddings file.
+    """
+
+    def __init__(self, path_prefix: str) -> None:
+        """Create (or truncate) the spool files.
+        Args:
+            path_prefix (str): The spool file path without extension; .f32 and .jsonl files are written.
+        """
+        os.makedirs(os.path.dirname(path_prefix) or ".", exist_ok=True)
+        self.vectors_path = f"{path_prefix}.f32"
+        self.segments_path = f"{path_prefix}.jsonl"
+        self.count = 0
+        self.dimension: Optional[int] = None
+        self.end_sec = 0.0
+        self._vectors_file = open(self.vectors_path, "wb")
+        self._segments_file = open(self.segments_path, "w")
+
+    def append(self, segment: VideoEmbeddingSegment) -> None:
+        """Write one segment to the spool.
+        Args:
+            segment (VideoEmbeddingSegment): The segment.
+        """
+        vector = np.asarray(segment.embedding, dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = len(vector)
+        elif len(vector) != self.dimension:
+            raise ValueError(
+                f"Segment has {len(vector)} dimensions, expected {self.dimension}"
+            )
+        self._vectors_file.write(vector.tobytes())
+        self._segments_file.write(json.dumps(segment.model_dump(exclude={"embedding"})) + "\n")
+        self.count += 1
+        self.end_sec = max(self.end_sec, segment.endSec)
+
+    def close(self) -> None:
+        """Flush and close the spool files; the spool can then be read."""
+        self._vectors_file.close()
+        self._segments_file.close()
+
+    def iter_batches(self, batch_size: int = 1024) -> Iterator[Tuple[List[dict], np.ndarray]]:
+        """Read the spooled segments back in batches.
+        Args:
+            batch_size (int): The number of segments per batch.
+        Yields:
+            Tuple[List[dict], np.ndarray]: The segments without their embeddings, and their
+                (batch, dimensions) float32 vectors, memory-mapped from the spool.
+        """
+        if self.count == 0:
+            return
+        vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r", shape=(self.count, self.dimension)
+        )
+        with open(self.segments_path, "r") as f:
+            for start in range(0, self.count, batch_size):
+                stop = min(start + batch_size, self.count)
+                segments = [json.loads(next(f)) for _ in range(start, stop)]
+                yield segments, vectors[start:stop]
+
+    def remove(self) -> None:
+        """Delete the spool files."""
+        self.close()
+        for file_path in (self.vectors_path, self.segments_path):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+
+def write_spooled_video_embeddings(
+    metadata: dict,
+    spools: Sequence[SegmentSpool],
+    directory: str,
+    file_format: str = "json",
+    dtype: str = "float32",
+) -> str:
+    """Write a video's embeddings file from its spooled segments, one batch at a time.
+    Produces the same files as `embedding_store.write_video_embeddings`. The file is written
+    under a temporary name and renamed when complete, so a partial file is never read.
+    Args:
+        metadata (dict): The VideoEmbeddings fields other than `embeddings`, e.g., videoName and durationSec.
+        spools (Sequence[SegmentSpool]): The closed spools of the video, in time order.
+        directory (str): The local embeddings directory.
+        file_format (str): json for JSON, or npy for a .npy vector matrix plus a .meta.json sidecar.
+        dtype (str): The on-disk vector dtype for npy, float32 or float16.
+    Returns:
+        str: The path of the embeddings file that was written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    file_path = get_embeddings_file_path(directory, metadata["videoName"], file_format)
+    temporary_path = f"{file_path}.tmp"
+
+    def segments(include_vectors: bool) -> Iterator[str]:
+        for spool in spools:
+            for batch, vectors in spool.iter_batches():
+                for segment, vector in zip(batch, vectors):
+                    if not include_vectors:
+                        yield json.dumps(segment)
+                        continue
+                    # str() of a float32 is its shortest round-trip repr; tolist() would widen it
+                    # to float64 and write about twice as many digits
+                    embedding = ",".join(map(str, vector))
+                    yield f'{{"embedding": [{embedding}], {json.dumps(segment)[1:]}'
+
+    if file_format == "npy":
+        dimensions = {spool.dimension for spool in spools if spool.count}
+        if len(dimensions) > 1:
+            raise ValueError(f"Spools have different dimensions: {sorted(dimensions)}")
+        shape = (sum(spool.count for spool in spools), dimensions.pop() if dimensions else 0)
+        # open_memmap writes the .npy header, so the rows can be filled in place
+        matrix = np.lib.format.open_memmap(temporary_path, mode="w+", dtype=dtype, shape=shape)
+        row = 0
+        for spool in spools:
+            for _, vectors in spool.iter_batches():
+                matrix[row : row + len(vectors)] = vectors
+                row += len(vectors)
+        matrix.flush()
+        del matrix
+
+        metadata_path = f"{os.path.splitext(file_path)[0]}.meta.json"
+        with open(f"{metadata_path}.tmp", "w") as f:
+            _write_embeddings_document(f, metadata, segments(include_vectors=False))
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+    else:
+        with open(temporary_path, "w") as f:
+            _write_embeddings_document(f, metadata, segments(include_vectors=True))
+
+    os.replace(temporary_path, file_path)
+    return file_path
+
+
+def _write_embeddings_document(f, metadata: dict, segments: Iterator[str]) -> None:
+    """Write a VideoEmbeddings JSON document, streaming its `embeddings` list one JSON segment at a time."""
+    f.write("{")
+    for key, value in metadata.items():
+        f.write(f"\n  {json.dumps(key)}: {json.dumps(value)},")
+    f.write('\n  "embeddings": [')
+    for i, segment in enumerate(segments):
+        f.write(("," if i else "") + "\n    " + segment)
+    f.write("\n  ]\n}\n")
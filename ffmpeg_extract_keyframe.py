@@ -1,31 +1,105 @@
-# Summary: This script extracts the a keyframe from each video file in a specified directory and saves it as a JPEG image.
-#          It uses the FFmpeg library to handle video processing.
+# Summary: This script extracts keyframes from each video file in a specified directory and saves them as JPEG images.
+#          It uses the FFmpeg library to handle video processing, running several FFmpeg processes in parallel.
+#          Modes: "single" extracts one frame at a fixed timestamp, "best" picks the most detailed of several
+#          candidate frames (skipping black lead-ins), and "segments" extracts one frame per Marengo segment
+#          and packs them into a sprite sheet.
 # Author: Gary A. Stafford
 # Date: 2025-07-23
 # License: MIT License
 
+import json
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
 
 from ffmpeg import FFmpeg
+from PIL import Image, ImageStat
+
+from embedding_store import embeddings_exist, read_video_embeddings
 
 LOCAL_KEYFRAMES_DIRECTORY = "keyframes"
+LOCAL_SEGMENT_KEYFRAMES_DIRECTORY = f"{LOCAL_KEYFRAMES_DIRECTORY}/segments"
 LOCAL_VIDEOS_DIRECTORY = "videos"
+LOCAL_EMBEDDINGS_DIRECTORY = "bedrock_marengo_embeddings"
+
+KEYFRAME_MODE = os.getenv("KEYFRAME_MODE", "single")  # single, best, or segments
+MAX_WORKERS = int(os.getenv("KEYFRAME_MAX_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+DEFAULT_TIMESTAMP = "00:00:02"  # HH:MM:SS format
+CANDIDATE_FRACTIONS = [0.1, 0.25, 0.5, 0.75]  # Positions of the candidate frames in "best" mode
+SPRITE_THUMBNAIL_WIDTH = 320
+SPRITE_COLUMNS = 5
 
 
 def main():
     if not os.path.exists(LOCAL_KEYFRAMES_DIRECTORY):
         os.makedirs(LOCAL_KEYFRAMES_DIRECTORY)
 
-    for file in os.listdir(LOCAL_VIDEOS_DIRECTORY):
-        if file.endswith(".mp4"):
-            print(file)
-            input_path = os.path.join(LOCAL_VIDEOS_DIRECTORY, file)
-            output_path = os.path.join(
-                LOCAL_KEYFRAMES_DIRECTORY, f"{os.path.splitext(file)[0]}.jpg"
-            )
-            timestamp = "00:00:02"  # HH:MM:SS format
-            print(f"Extracting first keyframe from {input_path} to {output_path}")
-            extract_first_keyframe(input_path, output_path, timestamp)
+    video_files = [
+        file for file in os.listdir(LOCAL_VIDEOS_DIRECTORY) if file.endswith(".mp4")
+    ]
+
+    # Each worker runs its own FFmpeg processes; bound how many run at once
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(process_video, file, KEYFRAME_MODE): file
+            for file in video_files
+        }
+        for future in as_completed(futures):
+            try:
+                print(f"Keyframes extracted: {future.result()}")
+            except Exception as e:
+                print(f"Error extracting keyframes from {futures[future]}: {e}")
+
+
+def process_video(file: str, mode: str) -> str:
+    """
+    Extracts the keyframes for one video file in the given mode.
+
+    :param file: Name of the video file in the videos directory.
+    :param mode: Extraction mode: single, best, or segments.
+    :return: Path of the keyframe or sprite sheet written.
+    """
+    input_path = os.path.join(LOCAL_VIDEOS_DIRECTORY, file)
+    stem = os.path.splitext(file)[0]
+    output_path = os.path.join(LOCAL_KEYFRAMES_DIRECTORY, f"{stem}.jpg")
+
+    if mode == "single":
+        print(f"Extracting first keyframe from {input_path} to {output_path}")
+        extract_first_keyframe(input_path, output_path, DEFAULT_TIMESTAMP)
+        return output_path
+    if mode == "best":
+        extract_best_keyframe(input_path, output_path)
+        return output_path
+    if mode == "segments":
+        if not embeddings_exist(LOCAL_EMBEDDINGS_DIRECTORY, file):
+            raise FileNotFoundError(f"No Marengo embeddings found for {file}")
+        video_embeddings = read_video_embeddings(LOCAL_EMBEDDINGS_DIRECTORY, file)
+        segments = sorted(
+            {(segment.startSec, segment.endSec) for segment in video_embeddings.embeddings}
+        )
+        return extract_segment_keyframes(input_path, stem, segments)
+    raise ValueError(f"Unsupported keyframe mode: {mode}")
+
+
+def keyframes_exist(file: str, mode: str) -> bool:
+    """
+    Checks whether a video's keyframe outputs for the given mode already exist.
+
+    :param file: Name of the video file in the videos directory.
+    :param mode: Extraction mode: single, best, or segments.
+    :return: True if the keyframe exists, or, for segments mode, the sprite sheet and its index,
+        which are written after every segment keyframe.
+    """
+    stem = os.path.splitext(file)[0]
+    if mode == "segments":
+        sprite_path = os.path.join(LOCAL_KEYFRAMES_DIRECTORY, f"{stem}_sprite.jpg")
+        return os.path.exists(sprite_path) and os.path.exists(
+            f"{os.path.splitext(sprite_path)[0]}.json"
+        )
+    return os.path.exists(os.path.join(LOCAL_KEYFRAMES_DIRECTORY, f"{stem}.jpg"))
 
 
 def extract_first_keyframe(input_path, output_path, timestamp):
@@ -34,14 +108,167 @@ def extract_first_keyframe(input_path, output_path, timestamp):
 
     :param input_path: Path to the input video file.
     :param output_path: Path where the extracted keyframe will be saved.
-    :param timestamp: Timestamp in HH:MM:SS format where the keyframe should be extracted.
+    :param timestamp: Timestamp in HH:MM:SS format (or seconds) where the keyframe should be extracted.
     """
     if not os.path.exists(output_path):
         print(f"Extracting keyframe from {input_path} at {timestamp} to {output_path}")
-        # Use FFmpeg to extract the keyframe
+        # Seek on the input so FFmpeg jumps to the nearest keyframe instead of decoding up to the timestamp
         ffmpeg = FFmpeg().input(input_path, ss=timestamp).output(output_path, vframes=1)
         ffmpeg.execute()
 
 
+def extract_best_keyframe(input_path: str, output_path: str) -> None:
+    """
+    Extracts several candidate frames and keeps the most detailed one, skipping black or blank frames.
+
+    :param input_path: Path to the input video file.
+    :param output_path: Path where the chosen keyframe will be saved.
+    """
+    if os.path.exists(output_path):
+        return
+
+    duration = get_video_duration(input_path)
+    if duration:
+        timestamps = [round(duration * fraction, 2) for fraction in CANDIDATE_FRACTIONS]
+    else:
+        timestamps = [1, 2, 4, 8]
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        candidates = []
+        for i, timestamp in enumerate(timestamps):
+            candidate_path = os.path.join(temp_directory, f"candidate_{i}.jpg")
+            try:
+                extract_first_keyframe(input_path, candidate_path, str(timestamp))
+            except Exception as e:
+                print(f"Skipping candidate at {timestamp}s for {input_path}: {e}")
+                continue
+            if os.path.exists(candidate_path):
+                candidates.append((frame_detail(candidate_path), candidate_path))
+
+        if not candidates:
+            raise RuntimeError(f"No frames could be extracted from {input_path}")
+        best_detail, best_path = max(candidates)
+        shutil.copyfile(best_path, output_path)
+        print(f"Best keyframe for {input_path} (detail {best_detail:.1f}) saved to {output_path}")
+
+
+def extract_segment_keyframes(
+    input_path: str, stem: str, segments: List[Tuple[float, float]]
+) -> str:
+    """
+    Extracts one keyframe from the middle of each Marengo segment and packs them into a sprite sheet.
+
+    :param input_path: Path to the input video file.
+    :param stem: Video file name without extension, used to name the outputs.
+    :param segments: Unique (startSec, endSec) pairs of the video's segments.
+    :return: Path of the sprite sheet.
+    """
+    os.makedirs(LOCAL_SEGMENT_KEYFRAMES_DIRECTORY, exist_ok=True)
+
+    frame_paths = []
+    for start_sec, end_sec in segments:
+        frame_path = segment_keyframe_path(stem, start_sec, end_sec)
+        midpoint = round((start_sec + end_sec) / 2, 3)
+        extract_first_keyframe(input_path, frame_path, str(midpoint))
+        frame_paths.append(frame_path)
+
+    sprite_path = os.path.join(LOCAL_KEYFRAMES_DIRECTORY, f"{stem}_sprite.jpg")
+    build_sprite_sheet(frame_paths, segments, sprite_path)
+    return sprite_path
+
+
+def build_sprite_sheet(
+    frame_paths: List[str],
+    segments: List[Tuple[float, float]],
+    sprite_path: str,
+    columns: int = SPRITE_COLUMNS,
+    thumbnail_width: int = SPRITE_THUMBNAIL_WIDTH,
+) -> None:
+    """
+    Packs frames into a single sprite sheet, with a JSON index of each segment's tile.
+
+    :param frame_paths: Paths of the frames, in segment order.
+    :param segments: The (startSec, endSec) pair of each frame.
+    :param sprite_path: Path where the sprite sheet will be saved; the index is saved next to it as .json.
+    :param columns: Number of tiles per row.
+    :param thumbnail_width: Width of each tile, in pixels.
+    """
+    if not frame_paths:
+        print(f"No frames to pack into {sprite_path}")
+        return
+
+    frames = []
+    for frame_path in frame_paths:
+        frame = Image.open(frame_path)
+        frame.draft("RGB", (thumbnail_width, thumbnail_width))  # Decode at reduced size when possible
+        frame = frame.convert("RGB")
+        height = round(frame.height * thumbnail_width / frame.width)
+        frames.append(frame.resize((thumbnail_width, height)))
+
+    tile_height = max(frame.height for frame in frames)
+    rows = (len(frames) + columns - 1) // columns
+    sprite = Image.new("RGB", (columns * thumbnail_width, rows * tile_height))
+    tiles = []
+    for i, (frame, (start_sec, end_sec)) in enumerate(zip(frames, segments)):
+        x, y = (i % columns) * thumbnail_width, (i // columns) * tile_height
+        sprite.paste(frame, (x, y))
+        tiles.append(
+            {
+                "startSec": start_sec,
+                "endSec": end_sec,
+                "x": x,
+                "y": y,
+                "width": thumbnail_width,
+                "height": frame.height,
+            }
+        )
+
+    sprite.save(sprite_path, quality=85)
+    with open(f"{os.path.splitext(sprite_path)[0]}.json", "w") as f:
+        json.dump(tiles, f, indent=2)
+
+
+def segment_keyframe_path(stem: str, start_sec: float, end_sec: float) -> str:
+    """
+    Returns the path of a segment's keyframe, so search results can show the matching segment's frame.
+    Segments of different lengths can share a start time, so both ends are part of the name.
+
+    :param stem: Video file name without extension.
+    :param start_sec: Start time of the segment, in seconds.
+    :param end_sec: End time of the segment, in seconds.
+    :return: Path of the segment keyframe.
+    """
+    return os.path.join(
+        LOCAL_SEGMENT_KEYFRAMES_DIRECTORY,
+        f"{stem}_{round(start_sec * 1000):08d}_{round(end_sec * 1000):08d}.jpg",
+    )
+
+
+def get_video_duration(input_path: str) -> Optional[float]:
+    """
+    Returns the duration of a video in seconds using FFprobe, or None if it cannot be read.
+
+    :param input_path: Path to the input video file.
+    """
+    try:
+        ffprobe = FFmpeg(executable="ffprobe").input(
+            input_path, print_format="json", show_format=None
+        )
+        return float(json.loads(ffprobe.execute())["format"]["duration"])
+    except Exception:
+        return None
+
+
+def frame_detail(frame_path: str) -> float:
+    """
+    Scores how much detail a frame has: the standard deviation of its luminance (near 0 for black frames).
+
+    :param frame_path: Path to the frame.
+    """
+    with Image.open(frame_path) as frame:
+        frame.draft("L", (160, 160))
+        return ImageStat.Stat(frame.convert("L")).stddev[0]
+
+
 if __name__ == "__main__":
     main()
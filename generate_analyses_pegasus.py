@@ -9,12 +9,19 @@ import os
 import json
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
 
 from dotenv import load_dotenv
 import boto3
 from botocore.config import Config
+from pydantic import ValidationError
 
-from utilities import Utilities
+from instrumentation import METRICS, count_sdk_throttles, export_metrics, start_metrics
+from rate_limiter import AdaptiveRateLimiter
+from dedupe_videos import link_pegasus_analysis, load_duplicates
+from manifest import Manifest
+from utilities import S3Object, Utilities
 from data import VideoAnalysis
 
 load_dotenv()  # Loads variables from .env file
@@ -25,71 +32,314 @@ S3_VIDEO_STORAGE_BUCKET_PEGASUS = os.getenv("S3_VIDEO_STORAGE_BUCKET_PEGASUS")
 MODEL_ID = "us.twelvelabs.pegasus-1-2-v1:0"
 S3_SOURCE_PREFIX = "commercials"
 LOCAL_DESTINATION_DIRECTORY = "bedrock_pegasus_analyses"
+MANIFEST_FILE_PATH = f"{LOCAL_DESTINATION_DIRECTORY}/_manifest.jsonl"
+
+# Concurrency and shared rate limiting; the limiter adapts to the account's TPS quota
+MAX_VIDEO_WORKERS = int(os.getenv("PEGASUS_MAX_VIDEO_WORKERS", "4"))
+INITIAL_REQUESTS_PER_SECOND = 1.0
+MAX_REQUESTS_PER_SECOND = float(os.getenv("PEGASUS_MAX_REQUESTS_PER_SECOND", "10.0"))
+
+# One SDK attempt per call: botocore would otherwise retry throttles itself before the
+# shared rate limiter sees them; generate_video_analysis retries throttles and transient errors
+CLIENT_CONFIG = Config(retries={"total_max_attempts": 1, "mode": "standard"})
+TRANSIENT_ERRORS = (
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelNotReadyException",
+)
+
+# Define the prompts for title, summary, and keywords
+PROMPTS = {
+    "title": "Generate a descriptive title for the video. Only provide the title in the response; no pre-text, post-text, or quotation marks.",
+    "summary": "Generate a detailed summary of the video. Consider the visual, audio, textual, spatial, and temporal aspects in the video. Only provide the summary in the response; no pre-text, post-text, or quotation marks.",
+    "keywords": """Extract keywords from the video content as a list of strings, for example: ["keyword1", "keyword2", "keyword3", "keyword4"]. Only provide the list keywords in the response; no pre-text, post-text.""",
+}
+
+# Single structured call returning the title, summary, and keywords together;
+# falls back to the per-field prompts above if the response does not parse
+USE_STRUCTURED_OUTPUT = os.getenv("PEGASUS_USE_STRUCTURED_OUTPUT", "true").lower() == "true"
+PROMPT_STRUCTURED = "Generate a descriptive title, a detailed summary, and a list of keywords for the video. Consider the visual, audio, textual, spatial, and temporal aspects in the video for the summary. Provide the title and summary without quotation marks."
+RESPONSE_FORMAT_STRUCTURED = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "video_analysis",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "summary": {"type": "string"},
+                "keywords": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["title", "summary", "keywords"],
+        },
+    },
+}
 
 
 def main() -> None:
-    config = Config(
-        retries={
-            "max_attempts": 5,
-            "mode": "standard",  # Or 'adaptive' for a more sophisticated approach
-        }
-    )
+    start_metrics("generate_analyses_pegasus")
 
     bedrock_runtime_client = boto3.client(
-        service_name="bedrock-runtime", region_name=AWS_REGION, config=config
+        service_name="bedrock-runtime", region_name=AWS_REGION, config=CLIENT_CONFIG
     )
+    count_sdk_throttles(bedrock_runtime_client, stage="pegasus")
 
     s3_client = boto3.client("s3", region_name=AWS_REGION)
 
     sts = boto3.client("sts")
     account_id = sts.get_caller_identity()["Account"]
 
-    # Get the list of MP4 files from the specified S3 bucket
-    video_file_names = Utilities.get_list_of_video_names_from_s3(
+    # Videos already processed with the same ETag are skipped on reruns
+    manifest = Manifest(MANIFEST_FILE_PATH)
+
+    # Stream the MP4 objects from the specified S3 bucket, page by page
+    pending_video_objects = []
+    for video_object in Utilities.iter_video_objects_from_s3(
         s3_client, S3_VIDEO_STORAGE_BUCKET_PEGASUS, S3_SOURCE_PREFIX
-    )
+    ):
+        video_file_name = video_object.file_name
+        if manifest.is_current(video_file_name, video_object.etag):
+            print(f"Skipping {video_file_name}, already processed.")
+            continue
 
-    # Wait for the job to complete and then read the output
-    for video_file_name in video_file_names:
+        # Adopt outputs written before the manifest existed instead of reprocessing them
         local_file_path = (
             f"{LOCAL_DESTINATION_DIRECTORY}/{video_file_name.replace('.mp4', '.json')}"
         )
-        if os.path.exists(local_file_path):
+        if video_file_name not in manifest and os.path.exists(local_file_path):
+            manifest.record(video_file_name, video_object.etag)
             print(f"Skipping {video_file_name}, already processed.")
             continue
 
-        video_path = f"s3://{S3_VIDEO_STORAGE_BUCKET_PEGASUS}/{S3_SOURCE_PREFIX}/{video_file_name}"
-        print(f"Generating analysis for video: {video_file_name}")
+        pending_video_objects.append(video_object)
 
-        # Define the prompts for title, summary, and keywords
-        prompt_summary = "Generate a detailed summary of the video. Consider the visual, audio, textual, spatial, and temporal aspects in the video. Only provide the summary in the response; no pre-text, post-text, or quotation marks."
-        prompt_title = "Generate a descriptive title for the video. Only provide the title in the response; no pre-text, post-text, or quotation marks."
-        prompt_keywords = """Extract keywords from the video content as a list of strings, for example: ["keyword1", "keyword2", "keyword3", "keyword4"]. Only provide the list keywords in the response; no pre-text, post-text."""
+    analyze_videos(
+        bedrock_runtime_client, account_id, pending_video_objects, manifest
+    )
+    export_metrics("generate_analyses_pegasus")
 
-        response_title = generate_video_analysis(
-            bedrock_runtime_client, account_id, video_path, prompt_title
-        )
 
-        response_summary = generate_video_analysis(
-            bedrock_runtime_client, account_id, video_path, prompt_summary
+def analyze_videos(
+    client: boto3.client,
+    account_id: str,
+    video_objects: List[S3Object],
+    manifest: Manifest,
+    on_complete: Optional[Callable[[S3Object], None]] = None,
+    on_failure: Optional[Callable[[S3Object, Exception], None]] = None,
+) -> None:
+    """
+    Generate the analyses of a set of videos and record each in the manifest.
+
+    Re-uploads found by dedupe_videos.py are linked to their original video's
+    analysis; the other videos run concurrently, sharing one rate limiter.
+
+    Args:
+        client (boto3.client): The Bedrock runtime client.
+        account_id (str): The AWS account ID.
+        video_objects (List[S3Object]): The videos to analyze.
+        manifest (Manifest): The analyses manifest.
+        on_complete (Callable, optional): Called with each video analyzed or linked.
+        on_failure (Callable, optional): Called with each video that failed, and its error.
+    """
+    duplicates = load_duplicates()
+
+    pending_video_objects = []
+    for video_object in video_objects:
+        video_file_name = video_object.file_name
+        canonical = duplicates.get(video_file_name)
+        if canonical and link_pegasus_analysis(
+            video_file_name, canonical, LOCAL_DESTINATION_DIRECTORY
+        ):
+            manifest.record(video_file_name, video_object.etag, linkedTo=canonical)
+            METRICS.increment("analyses_linked", stage="pegasus")
+            if on_complete:
+                on_complete(video_object)
+            continue
+        pending_video_objects.append(video_object)
+
+    # One limiter is shared by every worker, so a throttle anywhere slows everyone down
+    rate_limiter = AdaptiveRateLimiter(
+        initial_rate=INITIAL_REQUESTS_PER_SECOND,
+        max_rate=MAX_REQUESTS_PER_SECOND,
+    )
+
+    # Videos run concurrently, and each video fans its prompts out to a separate pool
+    with (
+        ThreadPoolExecutor(max_workers=MAX_VIDEO_WORKERS) as video_executor,
+        ThreadPoolExecutor(
+            max_workers=MAX_VIDEO_WORKERS * len(PROMPTS)
+        ) as prompt_executor,
+    ):
+        futures = {
+            video_executor.submit(
+                analyze_video,
+                client,
+                account_id,
+                video_object.file_name,
+                prompt_executor,
+                rate_limiter,
+            ): video_object
+            for video_object in pending_video_objects
+        }
+        for future in as_completed(futures):
+            video_object = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(
+                    f"Error generating analysis for video {video_object.file_name}: {e}"
+                )
+                METRICS.increment("videos_failed", stage="pegasus")
+                if on_failure:
+                    on_failure(video_object, e)
+                continue
+            manifest.record(video_object.file_name, video_object.etag)
+            METRICS.increment("video_bytes", video_object.size, stage="pegasus")
+            if on_complete:
+                on_complete(video_object)
+
+    print(f"Throttles across all workers: {rate_limiter.throttle_count}")
+
+
+def analyze_video(
+    client: boto3.client,
+    account_id: str,
+    video_file_name: str,
+    prompt_executor: ThreadPoolExecutor,
+    rate_limiter: AdaptiveRateLimiter,
+) -> VideoAnalysis:
+    """Generate the title, summary, and keywords for a video and write them to a local file.
+
+    Args:
+        client (boto3.client): The Boto3 client for the Bedrock service.
+        account_id (str): The AWS account ID.
+        video_file_name (str): The name of the video file.
+        prompt_executor (ThreadPoolExecutor): The pool used to run the prompts concurrently.
+        rate_limiter (AdaptiveRateLimiter): The rate limiter shared by all workers.
+
+    Returns:
+        VideoAnalysis: The video analysis object.
+    """
+    local_file_path = (
+        f"{LOCAL_DESTINATION_DIRECTORY}/{video_file_name.replace('.mp4', '.json')}"
+    )
+    video_path = (
+        f"s3://{S3_VIDEO_STORAGE_BUCKET_PEGASUS}/{S3_SOURCE_PREFIX}/{video_file_name}"
+    )
+    print(f"Generating analysis for video: {video_file_name}")
+    started = time.perf_counter()
+    date_created = time.strftime("%Y-%m-%dT%H:%M:%S %Z", time.gmtime())
+
+    video_analysis = None
+    if USE_STRUCTURED_OUTPUT:
+        # Errors from the call itself (e.g., access denied or exhausted throttling retries) would
+        # fail the per-field prompts the same way, so they fail the video; only a response that
+        # does not parse falls back
+        response = generate_video_analysis(
+            client,
+            account_id,
+            video_path,
+            PROMPT_STRUCTURED,
+            rate_limiter=rate_limiter,
+            response_format=RESPONSE_FORMAT_STRUCTURED,
+        )
+        video_analysis = parse_structured_analysis(
+            response.get("message", ""), video_file_name, video_path, date_created
         )
+        if video_analysis is None:
+            print(
+                f"Structured response for {video_file_name} did not parse, falling back to per-field prompts."
+            )
+            METRICS.increment("pegasus_fallbacks", stage="pegasus")
+
+    if video_analysis is None:
+        futures = {
+            field: prompt_executor.submit(
+                generate_video_analysis,
+                client,
+                account_id,
+                video_path,
+                prompt,
+                rate_limiter=rate_limiter,
+            )
+            for field, prompt in PROMPTS.items()
+        }
+        responses = {field: future.result() for field, future in futures.items()}
 
-        response_keywords = generate_video_analysis(
-            bedrock_runtime_client, account_id, video_path, prompt_keywords
+        video_analysis = VideoAnalysis(
+            videoName=video_file_name,
+            s3URI=video_path,
+            title=responses["title"]["message"],
+            summary=responses["summary"]["message"],
+            keywords=parse_keywords(responses["keywords"]["message"]),
+            dateCreated=date_created,
         )
 
+    # Write the video analysis to a local file
+    write_video_analysis_to_file(video_analysis, local_file_path)
+    print(f"Video analysis written to: {local_file_path}")
+
+    METRICS.record_span(
+        "pegasus_video",
+        time.perf_counter() - started,
+        stage="pegasus",
+        video=video_file_name,
+    )
+    METRICS.increment("videos_processed", stage="pegasus")
+    return video_analysis
+
+
+def parse_structured_analysis(
+    message: str, video_file_name: str, video_path: str, date_created: str
+) -> Optional[VideoAnalysis]:
+    """Parse a structured (JSON schema) Pegasus response into a video analysis.
+
+    Args:
+        message (str): The message returned by the model.
+        video_file_name (str): The name of the video file.
+        video_path (str): The S3 path to the video file.
+        date_created (str): The creation timestamp for the analysis.
+
+    Returns:
+        Optional[VideoAnalysis]: The video analysis, or None if the message is not valid.
+    """
+    try:
+        fields = json.loads(message)
         video_analysis = VideoAnalysis(
             videoName=video_file_name,
             s3URI=video_path,
-            title=response_title["message"],
-            summary=response_summary["message"],
-            keywords=json.loads(response_keywords["message"]),
-            dateCreated=time.strftime("%Y-%m-%dT%H:%M:%S %Z", time.gmtime()),
+            title=fields["title"],
+            summary=fields["summary"],
+            keywords=fields["keywords"],
+            dateCreated=date_created,
         )
+    except (ValueError, TypeError, KeyError, ValidationError):
+        return None
+
+    if not video_analysis.title.strip() or not video_analysis.summary.strip():
+        return None
+    return video_analysis
 
-        # Write the video analysis to a local file
-        write_video_analysis_to_file(video_analysis, local_file_path)
-        print(f"Video analysis written to: {local_file_path}")
+
+def parse_keywords(message: str) -> List[str]:
+    """Parse the keywords from a per-field Pegasus response without failing the run.
+
+    Args:
+        message (str): The message returned by the model, ideally a JSON list of strings.
+
+    Returns:
+        List[str]: The keywords; a comma-separated fallback is used if the message is not a JSON list.
+    """
+    try:
+        keywords = json.loads(message)
+        if isinstance(keywords, list):
+            return [str(keyword).strip() for keyword in keywords if str(keyword).strip()]
+    except ValueError:
+        pass
+
+    print(f"Keywords response is not a JSON list, splitting on commas: {message[:80]}")
+    keywords = message.strip().strip("[]").split(",")
+    return [keyword.strip().strip("\"'") for keyword in keywords if keyword.strip().strip("\"'")]
 
 
 def generate_video_analysis(
@@ -98,6 +348,8 @@ def generate_video_analysis(
     video_path: str,
     prompt: str,
     max_retries: int = 5,
+    rate_limiter: Optional[AdaptiveRateLimiter] = None,
+    response_format: Optional[dict] = None,
 ) -> dict:
     """Start the video analysis job.
 
@@ -106,7 +358,10 @@ def generate_video_analysis(
         account_id (str): The AWS account ID.
         video_path (str): The S3 path to the video file.
         prompt (str): The prompt to use for the video analysis.
-        max_retries (int, optional): The maximum number of retry attempts. Defaults to 3.
+        max_retries (int, optional): The maximum number of retry attempts. Defaults to 5.
+        rate_limiter (AdaptiveRateLimiter, optional): A rate limiter shared across workers. When
+            provided, it paces every attempt and absorbs throttling instead of the per-call sleep.
+        response_format (dict, optional): A `responseFormat` JSON schema block for structured output.
 
     Raises:
         e: An error occurred while starting the video analysis job.
@@ -125,27 +380,21 @@ def generate_video_analysis(
             }
         },
         "temperature": 0.2,
-        # "maxOutputTokens": 2048,
-        # "responseFormat": {
-        #     "type": "json_schema",
-        #     "json_schema": {
-        #         "name": "video_analysis",
-        #         "schema": {
-        #             "type": "object",
-        #             "properties": {
-        #                 "summary": {"type": "string"},
-        #                 "key_scenes": {"type": "array", "items": {"type": "string"}},
-        #                 "duration": {"type": "string"},
-        #             },
-        #             "required": ["summary", "key_scenes"],
-        #         },
-        #     },
-        # },
     }
+    if response_format is not None:
+        request_body["maxOutputTokens"] = 2048
+        request_body["responseFormat"] = response_format
 
+    video_name = video_path.split("/")[-1]
     retries = 0
     while True:
+        if rate_limiter is not None:
+            # Time spent waiting for the shared rate limiter is the request's queue time
+            with METRICS.span("pegasus_queue", stage="pegasus", video=video_name):
+                rate_limiter.acquire()
+        started = time.perf_counter()
         try:
+            METRICS.increment("bedrock_requests", operation="invoke_model", stage="pegasus")
             response = client.invoke_model(
                 modelId=MODEL_ID,
                 body=json.dumps(request_body),
@@ -153,21 +402,63 @@ def generate_video_analysis(
                 accept="application/json",
             )
             response_body = json.loads(response["body"].read())
+            METRICS.record_span(
+                "pegasus_invoke",
+                time.perf_counter() - started,
+                stage="pegasus",
+                video=video_name,
+                attempt=retries + 1,
+            )
+            record_token_counts(response, stage="pegasus")
+            if rate_limiter is not None:
+                rate_limiter.on_success()
             return response_body
         except Exception as e:
-            if "ThrottlingException" in str(e) and retries < max_retries:
+            METRICS.record_span(
+                "pegasus_invoke",
+                time.perf_counter() - started,
+                stage="pegasus",
+                video=video_name,
+                attempt=retries + 1,
+                status="error",
+                error=type(e).__name__,
+            )
+            throttled = "ThrottlingException" in str(e)
+            transient = any(error in str(e) for error in TRANSIENT_ERRORS)
+            if (throttled or transient) and retries < max_retries:
                 retries += 1
+                if throttled:
+                    METRICS.increment("throttle_retries", stage="pegasus")
+                    if rate_limiter is not None:
+                        rate_limiter.on_throttle()
+                        continue
+                else:
+                    METRICS.increment("transient_retries", stage="pegasus")
                 backoff_time = (2**retries) + random.uniform(
                     0, 1
                 )  # Exponential backoff with jitter
                 print(
-                    f"Throttled. Retrying in {backoff_time:.2f} seconds (attempt {retries})..."
+                    f"{type(e).__name__}. Retrying in {backoff_time:.2f} seconds (attempt {retries})..."
                 )
                 time.sleep(backoff_time)
             else:
                 raise e  # Re-raise the exception if it's not a retryable error or max retries reached
 
 
+def record_token_counts(response: dict, stage: str) -> None:
+    """Count the input and output tokens that Amazon Bedrock reports in the response headers.
+
+    Args:
+        response (dict): The `invoke_model` response.
+        stage (str): The stage label of the counters.
+    """
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    for direction in ("input", "output"):
+        count = headers.get(f"x-amzn-bedrock-{direction}-token-count")
+        if count is not None:
+            METRICS.increment(f"{direction}_tokens", int(count), stage=stage)
+
+
 # method that writes the video analysis response to a local file
 def write_video_analysis_to_file(
     video_analysis: VideoAnalysis, local_file_path: str
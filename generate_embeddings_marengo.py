@@ -1,20 +1,34 @@
 # Summary: This script generates video embeddings using the Amazon Bedrock Marengo model.
 #          It retrieves video files from an S3 bucket, processes each video to generate embeddings,
-#          and saves the results in a local directory.
+#          and saves the results in a local directory. Long videos are split into time windows
+#          processed as parallel jobs, and each job's output is streamed to disk segment by segment.
 # Author: Gary A. Stafford
 # Date: 2025-07-23
 # License: MIT License
 
 import os
 import time
-import json
+import mimetypes
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
 
 import boto3
 from botocore.config import Config
 from dotenv import load_dotenv
 
-from utilities import Utilities
-from data import VideoEmbeddings
+from async_job_scheduler import AsyncJobScheduler
+from embedding_store import embeddings_exist
+from embedding_stream import (
+    SegmentSpool,
+    iter_output_segments,
+    plan_windows,
+    write_spooled_video_embeddings,
+)
+from ffmpeg_extract_keyframe import get_video_duration
+from instrumentation import METRICS, count_sdk_throttles, export_metrics, start_metrics
+from manifest import Manifest
+from utilities import S3Object, Utilities
+from data import VideoEmbeddingSegment
 
 load_dotenv()  # Loads variables from .env file
 
@@ -27,9 +41,40 @@ MODEL_ID = "twelvelabs.marengo-embed-2-7-v1:0"
 S3_SOURCE_PREFIX = "commercials"
 S3_DESTINATION_PREFIX = "embeddings"
 LOCAL_DESTINATION_DIRECTORY = "bedrock_marengo_embeddings"
+MANIFEST_FILE_PATH = f"{LOCAL_DESTINATION_DIRECTORY}/_manifest.jsonl"
+SPOOL_DIRECTORY = f"{LOCAL_DESTINATION_DIRECTORY}/_spool"
+
+# Local embeddings format: json (pretty-printed) or npy (memory-mappable vectors plus a metadata sidecar)
+EMBEDDINGS_FORMAT = os.getenv("MARENGO_EMBEDDINGS_FORMAT", "json")
+EMBEDDINGS_DTYPE = os.getenv("MARENGO_EMBEDDINGS_DTYPE", "float32")
+
+# Async invocation scheduling; tune to the account's Bedrock quotas
+MAX_JOBS_IN_FLIGHT = int(os.getenv("MARENGO_MAX_JOBS_IN_FLIGHT", "5"))
+MAX_SUBMITS_PER_SECOND = float(os.getenv("MARENGO_MAX_SUBMITS_PER_SECOND", "1.0"))
+POLL_INTERVAL_SECONDS = 5.0
+
+# Videos longer than a window are split into windows processed as parallel jobs; 0 disables splitting
+WINDOW_SECONDS = float(os.getenv("MARENGO_WINDOW_SECONDS", "900"))
+# Smaller videos are assumed to fit in one window, so their duration is not probed
+PROBE_MIN_BYTES = 100 * 1024 * 1024
+
+
+class MarengoJob(NamedTuple):
+    video_object: S3Object
+    window: int = 0
+    windows: int = 1
+    startSec: float = 0.0
+    lengthSec: float = 0.0  # 0 for the whole video
+
+    @property
+    def name(self) -> str:
+        if self.windows == 1:
+            return self.video_object.file_name
+        return f"{self.video_object.file_name}#{self.window + 1}/{self.windows}"
 
 
 def main() -> None:
+    start_metrics("generate_embeddings_marengo")
 
     config = Config(
         retries={
@@ -41,87 +86,275 @@ def main() -> None:
     bedrock_runtime_client = boto3.client(
         service_name="bedrock-runtime", region_name=AWS_REGION, config=config
     )
+    count_sdk_throttles(bedrock_runtime_client, stage="marengo")
 
     s3_client = boto3.client("s3", region_name=AWS_REGION)
 
     sts = boto3.client("sts")
     account_id = sts.get_caller_identity()["Account"]
 
-    # Get the list of MP4 files from the specified S3 bucket
-    video_file_names = Utilities.get_list_of_video_names_from_s3(
+    # Videos already processed with the same ETag are skipped on reruns
+    manifest = Manifest(MANIFEST_FILE_PATH)
+
+    # Stream the MP4 objects from the specified S3 bucket, page by page
+    pending_video_objects = []
+    for video_object in Utilities.iter_video_objects_from_s3(
         s3_client, S3_VIDEO_STORAGE_BUCKET_MARENGO, S3_SOURCE_PREFIX
-    )
+    ):
+        video_file_name = video_object.file_name
+        if manifest.is_current(video_file_name, video_object.etag):
+            print(f"Skipping {video_file_name}, already processed.")
+            continue
 
-    # Wait for the job to complete and then read the output
-    for video_file_name in video_file_names:
-        local_file_path = (
-            f"{LOCAL_DESTINATION_DIRECTORY}/{video_file_name.replace('.mp4', '.json')}"
-        )
-        if os.path.exists(local_file_path):
+        # Adopt outputs written before the manifest existed instead of reprocessing them
+        if video_file_name not in manifest and embeddings_exist(
+            LOCAL_DESTINATION_DIRECTORY, video_file_name
+        ):
+            manifest.record(video_file_name, video_object.etag, sizeBytes=video_object.size)
             print(f"Skipping {video_file_name}, already processed.")
             continue
+        pending_video_objects.append(video_object)
+
+    # Split long videos into time windows, each submitted as its own job
+    jobs: List[MarengoJob] = []
+    for video_object in pending_video_objects:
+        jobs.extend(plan_jobs(s3_client, video_object))
+
+    statuses = generate_video_embeddings(
+        bedrock_runtime_client, s3_client, account_id, jobs, manifest
+    )
+    failed = [arn for arn, status in statuses.items() if status != "Completed"]
+    print(f"Jobs completed: {len(statuses) - len(failed)}, failed: {len(failed)}")
+    export_metrics("generate_embeddings_marengo")
 
-        video_key = f"{S3_SOURCE_PREFIX}/{video_file_name}"
-        video_s3_uri = f"s3://{S3_VIDEO_STORAGE_BUCKET_MARENGO}/{video_key}"
-        print(f"Generating analysis for video: {video_file_name}")
 
-        # Get metadata for the S3 object
-        metadata = Utilities.get_s3_object_metadata(
-            s3_client, S3_VIDEO_STORAGE_BUCKET_MARENGO, video_key
+def generate_video_embeddings(
+    bedrock_client: boto3.client,
+    s3_client: boto3.client,
+    account_id: str,
+    jobs: List[MarengoJob],
+    manifest: Manifest,
+    resume: Optional[Dict[str, MarengoJob]] = None,
+    on_submit: Optional[Callable[[MarengoJob, str], None]] = None,
+    on_video_complete: Optional[Callable[[S3Object], None]] = None,
+    on_video_failure: Optional[Callable[[S3Object, str], None]] = None,
+) -> Dict[str, str]:
+    """Run the Marengo jobs of a set of videos, write each video's embeddings file, and record it in the manifest.
+    Each window's output is streamed to a spool as soon as its job completes; when every window of a
+    video is done, the spools are combined in time order into the video's embeddings file.
+    Args:
+        bedrock_client (boto3.client): The Boto3 client for the Bedrock service.
+        s3_client (boto3.client): The Boto3 S3 client.
+        account_id (str): The AWS account ID.
+        jobs (List[MarengoJob]): The jobs to submit, e.g., from `plan_jobs`.
+        manifest (Manifest): The embeddings manifest.
+        resume (Dict[str, MarengoJob], optional): Jobs already in flight, keyed by invocation ARN;
+            they are polled without being resubmitted.
+        on_submit (Callable, optional): Called with each job and its invocation ARN once submitted.
+        on_video_complete (Callable, optional): Called with each video whose embeddings file was written.
+        on_video_failure (Callable, optional): Called once with each video that has a failed window,
+            and the failure message.
+    Returns:
+        Dict[str, str]: The final status of each invocation, keyed by invocation ARN.
+    """
+    # The finished windows of each video, keyed by window index, until all of them are done
+    finished_windows: Dict[str, Dict[int, SegmentSpool]] = defaultdict(dict)
+    invocation_arns: Dict[str, List[str]] = defaultdict(list)
+    failed_videos = set()
+
+    def submit(job: MarengoJob) -> str:
+        video_s3_uri = f"s3://{S3_VIDEO_STORAGE_BUCKET_MARENGO}/{job.video_object.key}"
+        print(f"Generating embeddings for video: {job.name}")
+        response = generate_embeddings(
+            bedrock_client, account_id, video_s3_uri, job.startSec, job.lengthSec
         )
+        if on_submit:
+            on_submit(job, response["invocationArn"])
+        return response["invocationArn"]
+
+    def on_complete(job: MarengoJob, response: dict) -> None:
+        video_object = job.video_object
+        if video_object.file_name in failed_videos:
+            return
 
-        # Generate embeddings for the video
-        response = generate_embeddings(bedrock_runtime_client, account_id, video_s3_uri)
+        spools = finished_windows[video_object.file_name]
+        spools[job.window] = download_window(s3_client, job, response["invocationArn"])
+        invocation_arns[video_object.file_name].append(response["invocationArn"])
+        if len(spools) < job.windows:
+            return
 
-        # Wait for the job to complete
-        print(f"Job started with invocation ARN: {response['invocationArn']}")
-        invocation_arn = response["invocationArn"]
-        final_job_status = Utilities.poll_job_status(
-            bedrock_runtime_client, invocation_arn
+        # Every window is done; combine them in time order into the video's embeddings file
+        write_embeddings(video_object, [spools[window] for window in range(job.windows)])
+        del finished_windows[video_object.file_name]
+        arns = invocation_arns.pop(video_object.file_name)
+        manifest.record(
+            video_object.file_name,
+            video_object.etag,
+            sizeBytes=video_object.size,
+            **({"invocationArn": arns[0]} if len(arns) == 1 else {"invocationArns": arns}),
         )
-        print(f"Final job status: {final_job_status}")
-
-        # Download the output file from S3
-        s3_prefix = invocation_arn.split("/")[-1]
-        s3_key = f"{S3_DESTINATION_PREFIX}/{s3_prefix}/output.json"
-        embeddings = download_embeddings_from_s3(s3_client, s3_key)
-        video_embeddings = VideoEmbeddings(
-            videoName=video_file_name,
-            s3URI=video_s3_uri,
-            keyframeURL=f"{CLOUDFRONT_URL}/{video_file_name.replace('.mp4', '.jpg')}",
-            dateCreated=time.strftime("%Y-%m-%dT%H:%M:%S %Z", time.gmtime()),
-            sizeBytes=metadata["ContentLength"],
-            contentType=metadata["ContentType"],
-            durationSec=round(embeddings["data"][-1]["endSec"], 2),
-            embeddings=embeddings["data"],
+        if on_video_complete:
+            on_video_complete(video_object)
+
+    def on_failure(job: MarengoJob, response: dict) -> None:
+        # Without every window the video is incomplete; its pending windows are skipped
+        # and it is reprocessed on the next run
+        if job.video_object.file_name in failed_videos:
+            return
+        failed_videos.add(job.video_object.file_name)
+        for spool in finished_windows.pop(job.video_object.file_name, {}).values():
+            spool.remove()
+        invocation_arns.pop(job.video_object.file_name, None)
+        if on_video_failure:
+            on_video_failure(job.video_object, response.get("failureMessage") or "")
+
+    # Keep several async invocations in flight and download each output as it completes
+    scheduler = AsyncJobScheduler(
+        bedrock_client,
+        max_in_flight=MAX_JOBS_IN_FLIGHT,
+        max_submits_per_second=MAX_SUBMITS_PER_SECOND,
+        poll_interval=POLL_INTERVAL_SECONDS,
+        stage="marengo",
+    )
+    return scheduler.run(
+        jobs,
+        submit,
+        on_complete,
+        on_failure,
+        resume=resume,
+        job_name=lambda job: job.name,
+        skip=lambda job: job.video_object.file_name in failed_videos,
+    )
+
+
+def plan_jobs(s3_client: boto3.client, video_object: S3Object) -> List[MarengoJob]:
+    """Plan the Marengo jobs of a video: one per time window, or one for the whole video.
+    Args:
+        s3_client (boto3.client): The Boto3 S3 client.
+        video_object (S3Object): The S3 listing entry for the video.
+    Returns:
+        List[MarengoJob]: The jobs, in time order.
+    """
+    duration_sec = None
+    if WINDOW_SECONDS > 0 and video_object.size >= PROBE_MIN_BYTES:
+        # FFprobe reads only the container header, over ranged requests to a presigned URL
+        url = s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": S3_VIDEO_STORAGE_BUCKET_MARENGO, "Key": video_object.key},
+            ExpiresIn=300,
         )
+        duration_sec = get_video_duration(url)
+        if duration_sec is None:
+            print(f"Cannot read the duration of {video_object.file_name}, processing it whole")
+
+    windows = plan_windows(duration_sec, WINDOW_SECONDS)
+    return [
+        MarengoJob(video_object, window, len(windows), start_sec, length_sec)
+        for window, (start_sec, length_sec) in enumerate(windows)
+    ]
+
+
+def download_window(
+    s3_client: boto3.client, job: MarengoJob, invocation_arn: str
+) -> SegmentSpool:
+    """Stream the output of a completed job to a local spool, one segment at a time.
+    Args:
+        s3_client (boto3.client): The Boto3 S3 client.
+        job (MarengoJob): The completed job.
+        invocation_arn (str): The ARN of the completed job invocation.
+    Returns:
+        SegmentSpool: The closed spool of the job's segments.
+    """
+    s3_prefix = invocation_arn.split("/")[-1]
+    s3_key = f"{S3_DESTINATION_PREFIX}/{s3_prefix}/output.json"
+    stem = os.path.splitext(job.video_object.file_name)[0]
+    spool = SegmentSpool(os.path.join(SPOOL_DIRECTORY, f"{stem}.{job.window:04d}"))
+
+    # Marengo reports segment times as offsets from the start of the video, not of the
+    # window (startSec), so the windows' segments are spooled as they are
+    try:
+        with METRICS.span("marengo_download", stage="marengo", video=job.video_object.file_name):
+            for segment in stream_embeddings_from_s3(s3_client, s3_key):
+                spool.append(segment)
+    except Exception:
+        spool.remove()
+        raise
+    spool.close()
+    return spool
+
+
+def write_embeddings(video_object: S3Object, spools: List[SegmentSpool]) -> None:
+    """Write the video embeddings from the spools of its windows to a local file, then delete the spools.
+    Args:
+        video_object (S3Object): The S3 listing entry for the video.
+        spools (List[SegmentSpool]): The spools of the video's windows, in time order.
+    """
+    video_file_name = video_object.file_name
+    metadata = {
+        "videoName": video_file_name,
+        "s3URI": f"s3://{S3_VIDEO_STORAGE_BUCKET_MARENGO}/{video_object.key}",
+        "keyframeURL": f"{CLOUDFRONT_URL}/{video_file_name.replace('.mp4', '.jpg')}",
+        "dateCreated": time.strftime("%Y-%m-%dT%H:%M:%S %Z", time.gmtime()),
+        "sizeBytes": video_object.size,
+        "durationSec": round(max(spool.end_sec for spool in spools), 2),
+        "contentType": mimetypes.guess_type(video_file_name)[0] or "video/mp4",
+    }
 
-        # Write the video embedding to a local file
-        write_video_analysis_to_file(video_embeddings, local_file_path)
-        print(f"Video embeddings written to: {local_file_path}")
+    # Write the video embedding to a local file
+    local_file_path = write_spooled_video_embeddings(
+        metadata,
+        spools,
+        LOCAL_DESTINATION_DIRECTORY,
+        file_format=EMBEDDINGS_FORMAT,
+        dtype=EMBEDDINGS_DTYPE,
+    )
+    for spool in spools:
+        spool.remove()
+    print(f"Video embeddings written to: {local_file_path}")
+
+    # Marengo is billed by the minute of video, so video seconds drive the cost
+    METRICS.increment("videos_processed", stage="marengo")
+    METRICS.increment("video_seconds", metadata["durationSec"], stage="marengo")
+    METRICS.increment("video_bytes", video_object.size, stage="marengo")
+    METRICS.increment("segments", sum(spool.count for spool in spools), stage="marengo")
 
 
-def generate_embeddings(client: boto3.client, account_id: str, video_path: str) -> dict:
+def generate_embeddings(
+    client: boto3.client,
+    account_id: str,
+    video_path: str,
+    start_sec: float = 0.0,
+    length_sec: float = 0.0,
+) -> dict:
     """Start the video analysis job.
     Args:
         client (boto3.client): The Boto3 client for the Bedrock service.
         account_id (str): The AWS account ID.
         video_path (str): The S3 path to the video file.
+        start_sec (float): The start of the time window to process, in seconds.
+        length_sec (float): The length of the time window to process, in seconds; 0 for the rest of the video.
     Returns:
         dict: The response from the video analysis job.
     """
+    model_input = {
+        "inputType": "video",
+        "mediaSource": {
+            "s3Location": {
+                "uri": video_path,
+                "bucketOwner": account_id,
+            }
+        },
+        "embeddingOption": ["visual-image", "visual-text", "audio"],
+    }
+    if start_sec:
+        model_input["startSec"] = start_sec
+    if length_sec:
+        model_input["lengthSec"] = length_sec
+
+    METRICS.increment("bedrock_requests", operation="start_async_invoke", stage="marengo")
     response = client.start_async_invoke(
         modelId=MODEL_ID,
-        modelInput={
-            "inputType": "video",
-            "mediaSource": {
-                "s3Location": {
-                    "uri": video_path,
-                    "bucketOwner": account_id,
-                }
-            },
-            "embeddingOption": ["visual-image", "visual-text", "audio"],
-        },
+        modelInput=model_input,
         outputDataConfig={
             "s3OutputDataConfig": {
                 "s3Uri": f"s3://{S3_VIDEO_STORAGE_BUCKET_MARENGO}/{S3_DESTINATION_PREFIX}/",
@@ -132,33 +365,27 @@ def generate_embeddings(client: boto3.client, account_id: str, video_path: str)
     return response
 
 
-def download_embeddings_from_s3(client: boto3.client, s3_key: str) -> VideoEmbeddings:
-    """Download the output file from S3 and save it locally.
+def stream_embeddings_from_s3(client: boto3.client, s3_key: str) -> Iterator[VideoEmbeddingSegment]:
+    """Stream the segments of an output file from S3 without reading the whole file into memory.
     Args:
         client (boto3.client): The Boto3 S3 client.
         s3_key (str): The S3 key of the output file.
-    Returns:
-        VideoEmbeddings: The video embedding object.
+    Yields:
+        VideoEmbeddingSegment: Each segment of the output file, in order.
     """
+    METRICS.increment(
+        "s3_requests", operation="get_object", bucket=S3_VIDEO_STORAGE_BUCKET_MARENGO
+    )
     s3_object = client.get_object(
         Bucket=S3_VIDEO_STORAGE_BUCKET_MARENGO,
         Key=s3_key,
     )
-    embeddings = json.loads(s3_object["Body"].read().decode("utf-8"))
-
-    return embeddings
-
-
-def write_video_analysis_to_file(
-    video_embeddings: VideoEmbeddings, local_file_path: str
-) -> None:
-    """Write the video analysis response to a local file.
-    Args:
-        video_analysis (VideoEmbeddings): The video analysis object containing the response.
-        local_file_path (str): The local file path where the response will be written.
-    """
-    with open(local_file_path, "w") as f:
-        f.write(video_embeddings.model_dump_json(indent=2))
+    METRICS.increment("s3_bytes_downloaded", s3_object["ContentLength"], stage="marengo")
+    body = s3_object["Body"]
+    try:
+        yield from iter_output_segments(body)
+    finally:
+        body.close()
 
 
 if __name__ == "__main__":
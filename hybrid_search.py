@@ -0,0 +1,204 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import time
+
+from search_queries import knn_query, lexical_query
+
+FUSION_METHODS = ("rrf", "weighted")
+
+
+class HybridSearcher:
+    """Combine BM25 search on the Pegasus text fields with nested k-NN search.
+
+    The lexical search and the query embedding run concurrently, and the two
+    ranked lists are fused client side, with reciprocal rank fusion (RRF) or a
+    weighted sum of min-max normalized scores, so it works with any OpenSearch
+    deployment (or a `LocalVectorIndex`). In lexical-first mode, the lexical
+    search runs alone first and the embedding call is skipped when enough hits
+    score above a confidence threshold.
+    """
+
+    def __init__(
+        self,
+        os_client,
+        os_index: str,
+        encode: Callable[[str], List[float]],
+        fusion: str = "rrf",
+        rrf_k: int = 60,
+        lexical_weight: float = 0.5,
+        vector_weight: float = 0.5,
+        lexical_first: bool = False,
+        min_lexical_hits: int = 3,
+        min_lexical_score: float = 10.0,
+        window: int = 20,
+    ) -> None:
+        """Initialize the searcher.
+
+        Args:
+            os_client (OpenSearch): The OpenSearch client instance (or a `LocalVectorIndex`).
+            os_index (str): The name of the OpenSearch index.
+            encode (Callable[[str], List[float]]): Embeds query text, e.g., `QueryEncoder.encode`.
+            fusion (str): The fusion method: rrf or weighted.
+            rrf_k (int): The RRF rank constant; larger values flatten the rank weights.
+            lexical_weight (float): The weight of the lexical results in the fusion.
+            vector_weight (float): The weight of the vector results in the fusion.
+            lexical_first (bool): Try lexical search alone before embedding the query.
+            min_lexical_hits (int): The number of confident lexical hits needed to skip the embedding.
+            min_lexical_score (float): The BM25 score of a confident lexical hit; depends on the corpus,
+                so tune it with the benchmark.
+            window (int): The number of candidates fetched from each search before fusion.
+        """
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unsupported fusion method: {fusion}")
+
+        self.os_client = os_client
+        self.os_index = os_index
+        self.encode = encode
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        self.lexical_weight = lexical_weight
+        self.vector_weight = vector_weight
+        self.lexical_first = lexical_first
+        self.min_lexical_hits = min_lexical_hits
+        self.min_lexical_score = min_lexical_score
+        self.window = window
+        self.embeddings_skipped = 0
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    def search(self, text: str, size: int = 6, inner_hits: bool = False) -> dict:
+        """Run a hybrid search.
+
+        Args:
+            text (str): The query text.
+            size (int): The number of videos to return.
+            inner_hits (bool): Include the matching segments of each video from the k-NN search.
+
+        Returns:
+            dict: An OpenSearch-shaped response; each hit has a `_ranks` entry with its
+                [lexical, vector] ranks (None if absent), and the response has `skipped_embedding`.
+        """
+        start = time.perf_counter()
+        window = max(self.window, size)
+        lexical_body = lexical_query(text, size=window)
+
+        if self.lexical_first:
+            lexical_response = self.os_client.search(body=lexical_body, index=self.os_index)
+            confident = [
+                hit
+                for hit in lexical_response["hits"]["hits"]
+                if hit["_score"] >= self.min_lexical_score
+            ]
+            if len(confident) >= self.min_lexical_hits:
+                self.embeddings_skipped += 1
+                # Fused without a vector list, so the scores are on the same scale as a full search
+                hits = self._fuse([lexical_response["hits"]["hits"], []])
+                return _response(hits[:size], start, skipped_embedding=True)
+            vector_response = self._vector_search(text, window, inner_hits)
+        else:
+            # Embed the query while the lexical search runs
+            lexical_future = self._executor.submit(
+                self.os_client.search, body=lexical_body, index=self.os_index
+            )
+            vector_response = self._vector_search(text, window, inner_hits)
+            lexical_response = lexical_future.result()
+
+        hits = self._fuse([lexical_response["hits"]["hits"], vector_response["hits"]["hits"]])
+        return _response(hits[:size], start, skipped_embedding=False)
+
+    def close(self) -> None:
+        """Shut down the worker thread."""
+        self._executor.shutdown()
+
+    def _fuse(self, result_lists: List[List[dict]]) -> List[dict]:
+        """Fuse the [lexical, vector] hit lists with the configured method and weights."""
+        weights = [self.lexical_weight, self.vector_weight]
+        if self.fusion == "rrf":
+            return reciprocal_rank_fusion(result_lists, weights, self.rrf_k)
+        return weighted_score_fusion(result_lists, weights)
+
+    def _vector_search(self, text: str, size: int, inner_hits: bool) -> dict:
+        body = knn_query(self.encode(text), k=size, inner_hits=inner_hits)
+        return self.os_client.search(body=body, index=self.os_index)
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[dict]],
+    weights: Optional[List[float]] = None,
+    rrf_k: int = 60,
+) -> List[dict]:
+    """Fuse ranked hit lists by summing each list's weight / (rrf_k + rank).
+
+    Args:
+        result_lists (List[List[dict]]): The hits of each search, best first.
+        weights (List[float], optional): The weight of each list. Defaults to 1.0 each.
+        rrf_k (int): The rank constant.
+
+    Returns:
+        List[dict]: The fused hits, best first, with the fused `_score` and each list's rank in `_ranks`.
+    """
+    weights = weights or [1.0] * len(result_lists)
+    return _fuse(
+        result_lists,
+        [
+            [weight / (rrf_k + rank) for rank in range(1, len(hits) + 1)]
+            for hits, weight in zip(result_lists, weights)
+        ],
+    )
+
+
+def weighted_score_fusion(
+    result_lists: List[List[dict]], weights: Optional[List[float]] = None
+) -> List[dict]:
+    """Fuse hit lists by a weighted sum of each list's min-max normalized scores.
+
+    Args:
+        result_lists (List[List[dict]]): The hits of each search, best first.
+        weights (List[float], optional): The weight of each list. Defaults to 1.0 each.
+
+    Returns:
+        List[dict]: The fused hits, best first, with the fused `_score` and each list's rank in `_ranks`.
+    """
+    weights = weights or [1.0] * len(result_lists)
+    contributions = []
+    for hits, weight in zip(result_lists, weights):
+        scores = [hit["_score"] for hit in hits]
+        low, high = (min(scores), max(scores)) if scores else (0.0, 0.0)
+        contributions.append(
+            [
+                weight * ((score - low) / (high - low) if high > low else 1.0)
+                for score in scores
+            ]
+        )
+    return _fuse(result_lists, contributions)
+
+
+def _fuse(result_lists: List[List[dict]], contributions: List[List[float]]) -> List[dict]:
+    """Sum each video's contributions across lists, keeping the first copy of each hit."""
+    fused: Dict[str, dict] = {}
+    for list_number, (hits, scores) in enumerate(zip(result_lists, contributions)):
+        for rank, (hit, score) in enumerate(zip(hits, scores), 1):
+            entry = fused.get(hit["_id"])
+            if entry is None:
+                entry = fused[hit["_id"]] = {
+                    **hit,
+                    "_score": 0.0,
+                    "_ranks": [None] * len(result_lists),
+                }
+            elif "inner_hits" in hit:
+                entry["inner_hits"] = hit["inner_hits"]
+            entry["_score"] += score
+            entry["_ranks"][list_number] = rank
+    return sorted(fused.values(), key=lambda hit: -hit["_score"])
+
+
+def _response(hits: List[dict], start: float, skipped_embedding: bool) -> dict:
+    return {
+        "took": int((time.perf_counter() - start) * 1000),
+        "timed_out": False,
+        "skipped_embedding": skipped_embedding,
+        "hits": {
+            "total": {"value": len(hits), "relation": "eq"},
+            "max_score": hits[0]["_score"] if hits else None,
+            "hits": hits,
+        },
+    }
@@ -0,0 +1,223 @@
+# Summary: This script estimates the native (off-heap) memory needed for the k-NN segment vectors under each
+#          OpenSearch index profile, using the number of segment vectors in the local Marengo embedding files.
+#          Each profile pairs HNSW graph parameters with an optional quantization or on-disk mode and the
+#          shard and replica counts, and builds the matching index settings and mappings.
+# Author: Gary A. Stafford
+# Date: 2025-07-23
+# License: MIT License
+
+import os
+from typing import Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+from embedding_store import iter_video_embeddings
+
+LOCAL_EMBEDDINGS_DIRECTORY = "bedrock_marengo_embeddings"
+
+# Overhead factor used by the OpenSearch k-NN memory estimates
+MEMORY_OVERHEAD = 1.1
+
+QUANTIZATIONS = (None, "fp16", "byte", "pq")
+COMPRESSION_LEVELS = ("2x", "4x", "8x", "16x", "32x")
+
+
+class IndexProfile(BaseModel):
+    name: str
+    dimension: int = 1024
+    space_type: str = "cosinesimil"  # Use l2 for Amazon OpenSearch Serverless
+    m: int = 16
+    ef_construction: int = 100
+    ef_search: int = 100
+    quantization: Optional[str] = None  # None (float32), fp16, byte, or pq
+    pq_m: int = 64  # PQ sub-vectors; must divide the dimension
+    pq_code_size: int = 8  # PQ bits per sub-vector code
+    pq_model_id: Optional[str] = None  # Trained k-NN model for PQ
+    on_disk: bool = False
+    compression_level: str = "32x"  # Only used on disk
+    number_of_shards: int = 2
+    number_of_replicas: Optional[int] = None  # None keeps the cluster default
+
+    def to_index_body(self) -> dict:
+        """Build the index settings and mappings for the nested segment embeddings."""
+        self._validate()
+
+        settings = {"knn": True, "number_of_shards": self.number_of_shards}
+        if self.number_of_replicas is not None:
+            settings["number_of_replicas"] = self.number_of_replicas
+
+        return {
+            "settings": {"index": settings},
+            "mappings": {
+                "properties": {
+                    "embeddings": {
+                        "type": "nested",
+                        "properties": {"embedding": self._vector_mapping()},
+                    }
+                }
+            },
+        }
+
+    def to_train_model_body(self, training_index: str, training_field: str) -> dict:
+        """Build the body for training the PQ model with `POST /_plugins/_knn/models/<model_id>/_train`.
+        Args:
+            training_index (str): An index holding a representative sample of the vectors.
+            training_field (str): The knn_vector field in the training index.
+        Returns:
+            dict: The train API request body.
+        """
+        if self.quantization != "pq":
+            raise ValueError(f"Profile '{self.name}' does not use PQ")
+        return {
+            "training_index": training_index,
+            "training_field": training_field,
+            "dimension": self.dimension,
+            "description": f"PQ model for index profile '{self.name}'",
+            "method": {
+                "name": "hnsw",
+                "engine": "faiss",
+                "space_type": self.space_type,
+                "parameters": {
+                    "m": self.m,
+                    "ef_construction": self.ef_construction,
+                    "ef_search": self.ef_search,
+                    "encoder": {
+                        "name": "pq",
+                        "parameters": {"m": self.pq_m, "code_size": self.pq_code_size},
+                    },
+                },
+            },
+        }
+
+    def bytes_per_vector(self) -> float:
+        """Estimate the native memory of one vector: its encoding plus its HNSW graph links."""
+        if self.on_disk:
+            # Only the compressed vectors and the graph are kept in memory
+            vector_bytes = self.dimension * 4 / int(self.compression_level.rstrip("x"))
+        elif self.quantization == "fp16":
+            vector_bytes = self.dimension * 2
+        elif self.quantization == "byte":
+            vector_bytes = self.dimension
+        elif self.quantization == "pq":
+            vector_bytes = self.pq_code_size / 8 * self.pq_m + 24
+        else:
+            vector_bytes = self.dimension * 4
+        return MEMORY_OVERHEAD * (vector_bytes + 8 * self.m)
+
+    def estimate_memory(self, num_vectors: int, num_segments: int = 1) -> Dict[str, float]:
+        """Estimate the native memory for a number of vectors, across all shard copies.
+        Args:
+            num_vectors (int): The number of segment vectors.
+            num_segments (int): The number of Lucene segments; each holds a copy of the PQ code books.
+        Returns:
+            Dict[str, float]: The bytes per vector and the total, primary, and per-shard memory in bytes.
+        """
+        primary_bytes = self.bytes_per_vector() * num_vectors
+        if self.quantization == "pq":
+            primary_bytes += (
+                MEMORY_OVERHEAD * num_segments * (2**self.pq_code_size) * 4 * self.dimension
+            )
+        copies = 1 + (self.number_of_replicas if self.number_of_replicas is not None else 1)
+        return {
+            "bytes_per_vector": round(self.bytes_per_vector(), 1),
+            "primary_bytes": primary_bytes,
+            "total_bytes": primary_bytes * copies,
+            "bytes_per_shard": primary_bytes / self.number_of_shards,
+        }
+
+    def _vector_mapping(self) -> dict:
+        mapping = {"type": "knn_vector", "dimension": self.dimension}
+        if self.quantization == "pq":
+            # PQ vectors are encoded with a trained model, which carries the method definition
+            if self.pq_model_id is None:
+                raise ValueError(f"Profile '{self.name}' needs a trained pq_model_id")
+            return {"type": "knn_vector", "model_id": self.pq_model_id}
+
+        parameters = {"m": self.m, "ef_construction": self.ef_construction}
+        engine = "faiss"
+        if self.quantization == "fp16":
+            parameters["encoder"] = {"name": "sq", "parameters": {"type": "fp16"}}
+        elif self.quantization == "byte":
+            # Lucene quantizes float vectors to bytes itself, so documents stay unchanged
+            engine = "lucene"
+            parameters["encoder"] = {"name": "sq"}
+        if engine == "faiss":
+            parameters["ef_search"] = self.ef_search
+
+        mapping["method"] = {
+            "engine": engine,
+            "name": "hnsw",
+            "space_type": self.space_type,
+            "parameters": parameters,
+        }
+        if self.on_disk:
+            mapping["mode"] = "on_disk"
+            mapping["compression_level"] = self.compression_level
+        return mapping
+
+    def _validate(self) -> None:
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {self.quantization}")
+        if self.on_disk and self.quantization is not None:
+            raise ValueError("The on-disk mode does its own quantization")
+        if self.compression_level not in COMPRESSION_LEVELS:
+            raise ValueError(f"Unsupported compression level: {self.compression_level}")
+        if self.quantization == "pq" and self.dimension % self.pq_m:
+            raise ValueError("pq_m must divide the dimension")
+
+
+# Profiles from most accurate and memory-hungry to most compact
+PROFILES: Dict[str, IndexProfile] = {
+    profile.name: profile
+    for profile in [
+        IndexProfile(name="default"),
+        IndexProfile(name="high-recall", m=32, ef_construction=256, ef_search=256),
+        IndexProfile(name="fp16", quantization="fp16"),
+        IndexProfile(name="byte", quantization="byte"),
+        IndexProfile(name="on-disk-8x", on_disk=True, compression_level="8x"),
+        IndexProfile(name="on-disk-32x", on_disk=True),
+        IndexProfile(name="pq", quantization="pq", pq_model_id="tv-commercials-pq"),
+    ]
+}
+
+
+def count_local_vectors(directory: str) -> Tuple[int, int]:
+    """Count the segment vectors, and their dimension, in the local embedding files.
+    Args:
+        directory (str): The local embeddings directory.
+    Returns:
+        Tuple[int, int]: The number of vectors and their dimension (0 if there are none).
+    """
+    num_vectors, dimension = 0, 0
+    for video_embeddings in iter_video_embeddings(directory):
+        vectors = video_embeddings.vectors  # Memory-mapped for .npy files
+        num_vectors += vectors.shape[0]
+        if vectors.size:
+            dimension = vectors.shape[1]
+    return num_vectors, dimension
+
+
+def main() -> None:
+    if not os.path.exists(LOCAL_EMBEDDINGS_DIRECTORY):
+        raise FileNotFoundError(f"Directory not found: {LOCAL_EMBEDDINGS_DIRECTORY}")
+
+    num_vectors, dimension = count_local_vectors(LOCAL_EMBEDDINGS_DIRECTORY)
+    print(f"Segment vectors: {num_vectors}, dimension: {dimension or 'unknown'}")
+
+    print(
+        f"{'Profile':<14}{'Bytes/vector':>14}{'Primary MiB':>14}{'Total MiB':>12}{'MiB/shard':>12}"
+    )
+    for profile in PROFILES.values():
+        if dimension:
+            profile = profile.model_copy(update={"dimension": dimension})
+        estimate = profile.estimate_memory(num_vectors)
+        print(
+            f"{profile.name:<14}{estimate['bytes_per_vector']:>14,.1f}"
+            f"{estimate['primary_bytes'] / 2**20:>14,.2f}"
+            f"{estimate['total_bytes'] / 2**20:>12,.2f}"
+            f"{estimate['bytes_per_shard'] / 2**20:>12,.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional, TextIO, Tuple
+import json
+import os
+import threading
+import time
+import uuid
+
+# Export format of the scripts' metrics: jsonl, prometheus, or none
+METRICS_FORMAT = os.getenv("METRICS_FORMAT", "jsonl")
+METRICS_DIRECTORY = os.getenv("METRICS_DIRECTORY", "metrics")
+# The most recent spans kept in memory, per registry and per span name for the p95 in the summary;
+# spans are aggregated as they arrive, so the totals cover every span however long the process runs
+MAX_RETAINED_SPANS = int(os.getenv("METRICS_MAX_RETAINED_SPANS", "10000"))
+
+# Labels dropped from the Prometheus export, which aggregates over them to keep the series count small
+HIGH_CARDINALITY_LABELS = ("video", "job")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """Thread-safe registry of timing spans and counters.
+
+    A span records how long one unit of work took (a Bedrock invocation, an S3
+    download, a bulk request), with labels such as the stage and the video; a
+    counter accumulates a quantity (retries, bytes, tokens, video seconds) per
+    label set. Spans are aggregated per name and low-cardinality labels as they
+    arrive; only the most recent ones are kept individually, so memory stays
+    bounded in long-running processes. `stream_spans` appends every span to a
+    JSON lines file as it is recorded.
+    """
+
+    def __init__(
+        self,
+        run_id: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+        timer: Callable[[], float] = time.perf_counter,
+        max_spans: int = MAX_RETAINED_SPANS,
+    ) -> None:
+        """Initialize the registry.
+        Args:
+            run_id (str, optional): Identifies this run in the exported records. Defaults to a random ID.
+            clock (Callable[[], float]): Wall clock for span start times, in epoch seconds.
+            timer (Callable[[], float]): Monotonic timer for span durations, in seconds.
+            max_spans (int): The number of most recent spans kept in memory.
+        """
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.clock = clock
+        self.timer = timer
+        self.max_spans = max_spans
+        self._spans: Deque[dict] = deque(maxlen=max_spans)
+        # [total seconds, count, longest seconds] per span name and low-cardinality labels
+        self._span_stats: Dict[str, Dict[LabelKey, List[float]]] = defaultdict(dict)
+        self._recent_seconds: Dict[str, Deque[float]] = {}
+        self._sink: Optional[TextIO] = None
+        self._counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **labels) -> Iterator[dict]:
+        """Time a block of work as a span.
+        Args:
+            name (str): The span name, e.g., pegasus_invoke.
+            **labels: Labels of the span, e.g., stage and video.
+        Yields:
+            dict: The span's labels; add entries (e.g., bytes or attempts) inside the block.
+        """
+        start, started = self.clock(), self.timer()
+        status = "ok"
+        try:
+            yield labels
+        except BaseException as e:
+            status = "error"
+            labels.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            self.record_span(name, self.timer() - started, start=start, status=status, **labels)
+
+    def record_span(
+        self, name: str, seconds: float, start: Optional[float] = None, **labels
+    ) -> None:
+        """Record a span measured elsewhere, e.g., the time a job waited in a queue.
+        Args:
+            name (str): The span name.
+            seconds (float): The span duration, in seconds.
+            start (float, optional): The span start time, in epoch seconds. Defaults to now minus the duration.
+            **labels: Labels of the span.
+        """
+        record = {
+            "type": "span",
+            "run": self.run_id,
+            "name": name,
+            "start": round(start if start is not None else self.clock() - seconds, 3),
+            "seconds": round(seconds, 6),
+            **labels,
+        }
+        record.setdefault("status", "ok")
+        labels = {
+            key: value
+            for key, value in record.items()
+            if key not in ("type", "run", "name", "start", "seconds")
+            and key not in HIGH_CARDINALITY_LABELS
+            and isinstance(value, str)
+        }
+        with self._lock:
+            self._spans.append(record)
+            stats = self._span_stats[name].setdefault(_label_key(labels), [0.0, 0, 0.0])
+            stats[0] += record["seconds"]
+            stats[1] += 1
+            stats[2] = max(stats[2], record["seconds"])
+            self._recent_seconds.setdefault(name, deque(maxlen=self.max_spans)).append(
+                record["seconds"]
+            )
+            if self._sink is not None:
+                self._sink.write(json.dumps(record, default=str) + "\n")
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        """Add to a counter.
+        Args:
+            name (str): The counter name, e.g., s3_bytes_downloaded.
+            value (float): The amount to add.
+            **labels: Labels of the counter, e.g., stage.
+        """
+        with self._lock:
+            self._counters[name][_label_key(labels)] += value
+
+    def spans(self) -> List[dict]:
+        """Return a copy of the most recent spans, at most `max_spans` of them."""
+        with self._lock:
+            return list(self._spans)
+
+    def has_spans(self) -> bool:
+        """Check whether any span has been recorded."""
+        with self._lock:
+            return bool(self._span_stats)
+
+    def stream_spans(self, file_path: str) -> None:
+        """Append every span recorded from now on to a JSON lines file as it is recorded.
+        Streamed spans are left out of `to_jsonl`, so exporting to the same file does not repeat them.
+        Args:
+            file_path (str): The JSON lines file.
+        """
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        sink = open(file_path, "a", buffering=1)
+        with self._lock:
+            if self._sink is not None:
+                self._sink.close()
+            self._sink = sink
+
+    def stop_streaming(self) -> None:
+        """Close the span stream, if any."""
+        with self._lock:
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+
+    def counter(self, name: str, **labels) -> float:
+        """Return a counter's total over every label set that includes the given labels."""
+        wanted = set(_label_key(labels))
+        with self._lock:
+            return sum(
+                value
+                for key, value in self._counters.get(name, {}).items()
+                if wanted <= set(key)
+            )
+
+    def to_jsonl(self) -> str:
+        """Render the retained spans not already streamed, and each counter's total per label set, as JSON lines."""
+        with self._lock:
+            records = list(self._spans) if self._sink is None else []
+            for name, series in self._counters.items():
+                for key, value in series.items():
+                    records.append(
+                        {"type": "counter", "run": self.run_id, "name": name, "value": value, **dict(key)}
+                    )
+        return "".join(json.dumps(record, default=str) + "\n" for record in records)
+
+    def to_prometheus(self, prefix: str = "tl_") -> str:
+        """Render the counters and span aggregates in the Prometheus text exposition format.
+        Spans become a `<name>_seconds` summary (`_sum` and `_count`) and a `<name>_seconds_max` gauge.
+        Args:
+            prefix (str): The metric name prefix.
+        Returns:
+            str: The exposition text, e.g., for the node exporter's textfile collector.
+        """
+        with self._lock:
+            spans = {
+                name: {key: list(stats) for key, stats in series.items()}
+                for name, series in self._span_stats.items()
+            }
+            counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+            for name, series in self._counters.items():
+                for key, value in series.items():
+                    labels = {k: v for k, v in key if k not in HIGH_CARDINALITY_LABELS}
+                    counters[name][_label_key(labels)] += value
+
+        lines = []
+        for name, series in sorted(counters.items()):
+            metric = f"{prefix}{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{metric}{_format_labels(key)} {value:g}")
+        for name, series in sorted(spans.items()):
+            metric = f"{prefix}{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for key, (total, count, _) in sorted(series.items()):
+                labels = _format_labels(key)
+                lines.append(f"{metric}_sum{labels} {total:.6f}")
+                lines.append(f"{metric}_count{labels} {count:g}")
+            # A summary has no max series, so the longest span is its own gauge
+            lines.append(f"# TYPE {metric}_max gauge")
+            for key, (_, _, longest) in sorted(series.items()):
+                lines.append(f"{metric}_max{_format_labels(key)} {longest:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Summarize each span's count, total, mean, p95, and longest duration, slowest total first.
+        The p95 is computed over the most recent `max_spans` spans of each name; the rest are exact.
+        """
+        with self._lock:
+            totals = {
+                name: (
+                    sum(stats[0] for stats in series.values()),
+                    sum(stats[1] for stats in series.values()),
+                    max(stats[2] for stats in series.values()),
+                    sorted(self._recent_seconds[name]),
+                )
+                for name, series in self._span_stats.items()
+            }
+
+        lines = [f"{'Span':<28}{'Count':>8}{'Total s':>12}{'Mean s':>10}{'p95 s':>10}{'Max s':>10}"]
+        for name, (total, count, longest, recent) in sorted(
+            totals.items(), key=lambda item: -item[1][0]
+        ):
+            p95 = recent[min(len(recent) - 1, int(0.95 * len(recent)))]
+            lines.append(
+                f"{name:<28}{count:>8}{total:>12.2f}"
+                f"{total / count:>10.3f}{p95:>10.3f}{longest:>10.3f}"
+            )
+        return "\n".join(lines)
+
+    def clear(self) -> None:
+        """Drop every recorded span and counter."""
+        with self._lock:
+            self._spans.clear()
+            self._span_stats.clear()
+            self._recent_seconds.clear()
+            self._counters.clear()
+
+
+# The registry shared by the scripts and the modules they use
+METRICS = Metrics()
+
+
+def export_metrics(
+    script_name: str,
+    metrics: Metrics = METRICS,
+    metrics_format: str = METRICS_FORMAT,
+    directory: str = METRICS_DIRECTORY,
+) -> Optional[str]:
+    """Print the span summary and export the metrics of a script run.
+    JSON lines are appended to `<directory>/<script_name>.jsonl`, so runs accumulate, after any spans
+    streamed there by `start_metrics`; the Prometheus text replaces `<directory>/<script_name>.prom`.
+    Args:
+        script_name (str): The script name, used as the file name.
+        metrics (Metrics): The registry to export.
+        metrics_format (str): jsonl, prometheus, or none.
+        directory (str): The metrics directory.
+    Returns:
+        Optional[str]: The path of the file written, or None if the export is disabled.
+    """
+    if metrics.has_spans():
+        print(metrics.summary())
+    if metrics_format == "none":
+        return None
+    if metrics_format not in ("jsonl", "prometheus"):
+        raise ValueError(f"Unsupported metrics format: {metrics_format}")
+
+    os.makedirs(directory, exist_ok=True)
+    if metrics_format == "jsonl":
+        file_path = os.path.join(directory, f"{script_name}.jsonl")
+        records = metrics.to_jsonl()
+        metrics.stop_streaming()
+        with open(file_path, "a") as f:
+            f.write(records)
+    else:
+        file_path = os.path.join(directory, f"{script_name}.prom")
+        with open(file_path, "w") as f:
+            f.write(metrics.to_prometheus())
+    print(f"Metrics written to: {file_path}")
+    return file_path
+
+
+def start_metrics(
+    script_name: str,
+    metrics: Metrics = METRICS,
+    metrics_format: str = METRICS_FORMAT,
+    directory: str = METRICS_DIRECTORY,
+) -> None:
+    """Stream the spans of a script run to its JSON lines file as they are recorded.
+    Only the most recent spans are kept in memory, so without the stream a long run would export
+    only those; `export_metrics` later appends the counters to the same file.
+    Args:
+        script_name (str): The script name, used as the file name.
+        metrics (Metrics): The registry to stream.
+        metrics_format (str): The export format; spans are only streamed for jsonl.
+        directory (str): The metrics directory.
+    """
+    if metrics_format == "jsonl":
+        metrics.stream_spans(os.path.join(directory, f"{script_name}.jsonl"))
+
+
+def count_sdk_throttles(client, stage: str, metrics: Metrics = METRICS) -> None:
+    """Count every throttled attempt of a Boto3 client, including those botocore retries itself.
+    The `throttles` counter is incremented from botocore's `needs-retry` event, which fires after
+    every attempt, so it sees throttles that never reach the caller as an exception.
+    Args:
+        client: The Boto3 client, e.g., for bedrock-runtime.
+        stage (str): The stage label of the counter.
+        metrics (Metrics): The registry to count in.
+    """
+
+    def on_attempt(response=None, **kwargs) -> None:
+        if response is None:
+            return
+        error_code = response[1].get("Error", {}).get("Code", "")
+        if "Throttling" in error_code or "TooManyRequests" in error_code:
+            metrics.increment("throttles", stage=stage)
+
+    client.meta.events.register("needs-retry", on_attempt)
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in key
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
@@ -0,0 +1,598 @@
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import json
+import math
+import os
+import re
+import time
+
+import numpy as np
+
+from data import VideoAnalysis, VideoEmbeddings
+from embedding_store import iter_video_embeddings
+
+NESTED_PATH = "embeddings"
+VECTOR_FIELD = "embeddings.embedding"
+SEGMENT_FIELDS = ("embeddingOption", "startSec", "endSec")
+
+# BM25 parameters, as in the OpenSearch defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class LocalVectorIndex:
+    """In-process stand-in for the nested k-NN OpenSearch index.
+
+    Every segment vector is held in one contiguous float32 matrix, with an
+    offsets array mapping each video to its range of rows. `search` accepts the
+    same nested k-NN query bodies as the notebook (k-NN with filters, inner
+    hits, `expand_nested_docs`, and radial `max_distance`/`min_score` search)
+    and returns OpenSearch-shaped responses, scored like the `cosinesimil`
+    space: score = (1 + cosine similarity) / 2. A `multi_match` query on the
+    text fields is scored with BM25 for lexical and hybrid search.
+    """
+
+    def __init__(
+        self,
+        sources: List[dict],
+        vectors: np.ndarray,
+        offsets: np.ndarray,
+        segment_options: np.ndarray,
+        segment_start: np.ndarray,
+        segment_end: np.ndarray,
+        index_name: str = "local-index",
+    ) -> None:
+        """Initialize the index from prepared arrays; use `from_documents` or `from_embeddings` instead.
+
+        Args:
+            sources (List[dict]): Each video's document source without the `embeddings` field.
+            vectors (np.ndarray): The (segments, dimensions) float32 matrix of all segment vectors.
+            offsets (np.ndarray): The (videos + 1) row offsets of each video's segments in `vectors`.
+            segment_options (np.ndarray): The embedding option of each segment.
+            segment_start (np.ndarray): The start time of each segment, in seconds.
+            segment_end (np.ndarray): The end time of each segment, in seconds.
+            index_name (str): The index name reported in the hits.
+        """
+        self.sources = sources
+        self.ids = [source.get("videoName", str(i)) for i, source in enumerate(sources)]
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.offsets = offsets.astype(np.int64)
+        self.segment_options = segment_options
+        self.segment_start = segment_start.astype(np.float32)
+        self.segment_end = segment_end.astype(np.float32)
+        self.index_name = index_name
+
+        counts = np.diff(self.offsets)
+        self.segment_video = np.repeat(np.arange(len(sources)), counts)
+        self.norms = np.linalg.norm(self.vectors, axis=1)
+        self.norms[self.norms == 0] = 1.0
+        self._term_stats: Dict[str, Tuple[List[Counter], np.ndarray, Counter]] = {}
+
+    @classmethod
+    def from_videos(
+        cls, videos: Iterable[Tuple[dict, np.ndarray, List[dict]]], **kwargs
+    ) -> "LocalVectorIndex":
+        """Build the index from (source, vectors, segments) tuples, one per video.
+
+        Args:
+            videos (Iterable[Tuple[dict, np.ndarray, List[dict]]]): Each video's source without embeddings,
+                its (segments, dimensions) vectors, and its segment metadata dicts.
+            **kwargs: Passed to the constructor.
+
+        Returns:
+            LocalVectorIndex: The index.
+        """
+        sources, matrices, segments = [], [], []
+        offsets = [0]
+        for source, vectors, video_segments in videos:
+            if len(video_segments) == 0:
+                continue  # A video without segments can never match
+            sources.append(source)
+            matrices.append(vectors)
+            segments.extend(video_segments)
+            offsets.append(offsets[-1] + len(video_segments))
+
+        if not matrices:
+            raise ValueError("No segment embeddings found to index")
+
+        # One copy into a single contiguous float32 matrix
+        vectors = np.concatenate(matrices).astype(np.float32, copy=False)
+        return cls(
+            sources=sources,
+            vectors=vectors,
+            offsets=np.asarray(offsets),
+            segment_options=np.asarray([s["embeddingOption"] for s in segments]),
+            segment_start=np.asarray([s["startSec"] for s in segments]),
+            segment_end=np.asarray([s["endSec"] for s in segments]),
+            **kwargs,
+        )
+
+    @classmethod
+    def from_documents(cls, document_path: str, **kwargs) -> "LocalVectorIndex":
+        """Build the index from the OpenSearch document JSON files.
+
+        Args:
+            document_path (str): Directory containing the document JSON files.
+            **kwargs: Passed to the constructor.
+
+        Returns:
+            LocalVectorIndex: The index.
+        """
+
+        def videos():
+            for file in sorted(os.listdir(document_path)):
+                if not file.endswith(".json"):
+                    continue
+                with open(os.path.join(document_path, file), "r") as f:
+                    document = json.load(f)
+                video_segments = document.pop("embeddings")
+                vectors = np.asarray(
+                    [segment.pop("embedding") for segment in video_segments],
+                    dtype=np.float32,
+                )
+                yield document, vectors, video_segments
+
+        return cls.from_videos(videos(), **kwargs)
+
+    @classmethod
+    def from_embeddings(
+        cls,
+        embeddings_path: str,
+        analysis_path: Optional[str] = None,
+        **kwargs,
+    ) -> "LocalVectorIndex":
+        """Build the index from the Marengo embedding files (JSON or .npy), without OpenSearch documents.
+
+        Args:
+            embeddings_path (str): The local Marengo embeddings directory.
+            analysis_path (str, optional): The local Pegasus analyses directory; its title, summary,
+                and keywords are added to the sources when present.
+            **kwargs: Passed to the constructor.
+
+        Returns:
+            LocalVectorIndex: The index.
+        """
+
+        def videos():
+            for video_embeddings in iter_video_embeddings(embeddings_path):
+                yield video_to_index_entry(video_embeddings, analysis_path)
+
+        return cls.from_videos(videos(), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def count(self, index: Optional[str] = None, **kwargs) -> dict:
+        """Return the document count, like `OpenSearch.count`."""
+        return {"count": len(self.sources)}
+
+    def segment_scores(self, embedding: List[float]) -> np.ndarray:
+        """Score every segment against a query vector.
+
+        Args:
+            embedding (List[float]): The query vector.
+
+        Returns:
+            np.ndarray: The cosine similarity of each segment, as float32.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query) or 1.0
+        return (self.vectors @ query) / (self.norms * query_norm)
+
+    def video_scores(self, similarities: np.ndarray) -> np.ndarray:
+        """Reduce segment scores to each video's best segment score (-inf for videos with no match)."""
+        return np.maximum.reduceat(similarities, self.offsets[:-1])
+
+    def search(self, body: dict, index: Optional[str] = None, **kwargs) -> dict:
+        """Run a nested k-NN query body, like `OpenSearch.search`.
+
+        Args:
+            body (dict): The query body, as built in the notebook or by `search_queries`.
+            index (str, optional): Ignored; accepted for compatibility with the OpenSearch client.
+
+        Returns:
+            dict: The OpenSearch-shaped search response.
+        """
+        return self._search(body)
+
+    def msearch(self, body, index: Optional[str] = None, **kwargs) -> dict:
+        """Run several query bodies, like `OpenSearch.msearch`.
+
+        The k-NN query vectors are scored against every segment in a single
+        matrix product, rather than one matrix-vector product per query.
+
+        Args:
+            body: The NDJSON string of header and body lines, or a list of alternating header and body dicts.
+            index (str, optional): Ignored; accepted for compatibility with the OpenSearch client.
+
+        Returns:
+            dict: The OpenSearch-shaped multi-search response, one response per query body.
+        """
+        start = time.perf_counter()
+        lines = body
+        if isinstance(body, str):
+            lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        bodies = lines[1::2]
+
+        # A malformed body gets its own error response, as in OpenSearch, instead of failing the batch
+        errors: Dict[int, Exception] = {}
+        knn_rows, knn_vectors = [], []
+        for i, query_body in enumerate(bodies):
+            try:
+                if "nested" not in query_body.get("query", {}):
+                    continue
+                vector = np.asarray(
+                    query_body["query"]["nested"]["query"]["knn"][VECTOR_FIELD]["vector"],
+                    dtype=np.float32,
+                )
+                if vector.shape != self.vectors.shape[1:]:
+                    raise ValueError(
+                        f"Query vector has {vector.size} dimensions, expected {self.vectors.shape[1]}"
+                    )
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                errors[i] = e
+                continue
+            knn_rows.append(i)
+            knn_vectors.append(vector)
+
+        similarities = None
+        if knn_rows:
+            queries = np.stack(knn_vectors)
+            query_norms = np.linalg.norm(queries, axis=1)
+            query_norms[query_norms == 0] = 1.0
+            similarities = (self.vectors @ queries.T) / np.outer(self.norms, query_norms)
+        columns = {row: column for column, row in enumerate(knn_rows)}
+
+        responses = []
+        for i, query_body in enumerate(bodies):
+            try:
+                if i in errors:
+                    raise errors[i]
+                column = similarities[:, columns[i]] if i in columns else None
+                response = self._search(query_body, column)
+                response["status"] = 200
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                response = {"error": {"type": type(e).__name__, "reason": str(e)}, "status": 400}
+            responses.append(response)
+        return {"took": int((time.perf_counter() - start) * 1000), "responses": responses}
+
+    def _search(self, body: dict, similarities: Optional[np.ndarray] = None) -> dict:
+        """Run a query body, reusing the segment similarities if already computed."""
+        start = time.perf_counter()
+        if "multi_match" in body["query"]:
+            return self._lexical_search(body, start)
+        nested = body["query"]["nested"]
+        if nested.get("path") != NESTED_PATH:
+            raise ValueError(f"Only nested queries on '{NESTED_PATH}' are supported")
+        knn = nested["query"]["knn"][VECTOR_FIELD]
+        size = body.get("size", 10)
+
+        if similarities is None:
+            similarities = self.segment_scores(knn["vector"])
+        scores = (1.0 + similarities) / 2.0
+
+        # Segments eligible to match: filtered and, for radial search, within range
+        eligible = np.ones(len(scores), dtype=bool)
+        if "filter" in knn:
+            eligible &= self._filter_mask(knn["filter"])
+        radial = "max_distance" in knn or "min_score" in knn
+        if "max_distance" in knn:
+            eligible &= (1.0 - similarities) <= knn["max_distance"]
+        if "min_score" in knn:
+            eligible &= scores >= knn["min_score"]
+        masked = np.where(eligible, scores, -np.inf).astype(np.float32)
+
+        # Each video scores as its best eligible segment; keep the top k videos
+        best = self.video_scores(masked)
+        candidates = np.flatnonzero(np.isfinite(best))
+        if not radial:
+            candidates = candidates[_top_k(best[candidates], knn.get("k", 10))]
+        expand = knn.get("expand_nested_docs", False)
+        score_mode = nested.get("score_mode", "avg")
+
+        video_hits = []
+        for video in candidates:
+            lo, hi = self.offsets[video], self.offsets[video + 1]
+            matched = np.flatnonzero(np.isfinite(masked[lo:hi]))
+            if not expand:
+                matched = matched[[int(np.argmax(masked[lo:hi][matched]))]]
+            video_hits.append((_score_mode(masked[lo:hi][matched], score_mode), video, matched))
+        video_hits.sort(key=lambda hit: -hit[0])
+
+        hits = []
+        for score, video, matched in video_hits[:size]:
+            hit = {
+                "_index": self.index_name,
+                "_id": self.ids[video],
+                "_score": float(score),
+            }
+            source = self._source(video, body.get("_source", True))
+            if source is not None:
+                hit["_source"] = source
+            if "inner_hits" in nested:
+                hit["inner_hits"] = {
+                    NESTED_PATH: self._inner_hits(
+                        video, matched, masked, nested["inner_hits"]
+                    )
+                }
+            hits.append(hit)
+
+        return {
+            "took": int((time.perf_counter() - start) * 1000),
+            "timed_out": False,
+            "hits": {
+                "total": {"value": len(video_hits), "relation": "eq"},
+                "max_score": hits[0]["_score"] if hits else None,
+                "hits": hits,
+            },
+        }
+
+    def _lexical_search(self, body: dict, start: float) -> dict:
+        """Score a `multi_match` (best_fields) query with BM25 over the video-level text fields."""
+        multi_match = body["query"]["multi_match"]
+        terms = _tokenize(multi_match["query"])
+        scores = np.zeros(len(self.sources))
+        for field_spec in multi_match.get("fields", ["title", "summary", "keywords"]):
+            field, _, boost = field_spec.partition("^")
+            field_scores = self._bm25(field, terms) * float(boost or 1.0)
+            # best_fields: each video scores as its best-matching field
+            scores = np.maximum(scores, field_scores)
+
+        matched = np.flatnonzero(scores > 0)
+        ranked = matched[_top_k(scores[matched], body.get("size", 10))]
+        hits = []
+        for video in ranked:
+            hit = {
+                "_index": self.index_name,
+                "_id": self.ids[video],
+                "_score": float(scores[video]),
+            }
+            source = self._source(video, body.get("_source", True))
+            if source is not None:
+                hit["_source"] = source
+            hits.append(hit)
+
+        return {
+            "took": int((time.perf_counter() - start) * 1000),
+            "timed_out": False,
+            "hits": {
+                "total": {"value": len(matched), "relation": "eq"},
+                "max_score": hits[0]["_score"] if hits else None,
+                "hits": hits,
+            },
+        }
+
+    def _bm25(self, field: str, terms: List[str]) -> np.ndarray:
+        """Score every video's field against the query terms with BM25."""
+        if field not in self._term_stats:
+            term_counts = [
+                Counter(_tokenize(_field_text(source.get(field)))) for source in self.sources
+            ]
+            lengths = np.asarray([sum(counts.values()) for counts in term_counts], dtype=float)
+            document_frequency = Counter(term for counts in term_counts for term in counts)
+            self._term_stats[field] = (term_counts, lengths, document_frequency)
+        term_counts, lengths, document_frequency = self._term_stats[field]
+
+        scores = np.zeros(len(self.sources))
+        average_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+        for term in set(terms):
+            df = document_frequency.get(term, 0)
+            if not df:
+                continue
+            idf = math.log(1 + (len(self.sources) - df + 0.5) / (df + 0.5))
+            tf = np.asarray([counts.get(term, 0) for counts in term_counts], dtype=float)
+            scores += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def _inner_hits(
+        self, video: int, matched: np.ndarray, masked: np.ndarray, spec: dict
+    ) -> dict:
+        """Build the inner hits for a video's matched segments, best first."""
+        lo = self.offsets[video]
+        order = matched[np.argsort(-masked[lo + matched], kind="stable")]
+        order = order[: spec.get("size", 3)]
+        fields = spec.get("fields", [])
+
+        hits = []
+        for offset in order:
+            row = lo + offset
+            inner_hit = {
+                "_index": self.index_name,
+                "_id": self.ids[video],
+                "_nested": {"field": NESTED_PATH, "offset": int(offset)},
+                "_score": float(masked[row]),
+            }
+            if spec.get("_source", True) is not False:
+                inner_hit["_source"] = self._segment(row, include_vector=False)
+            if fields:
+                segment = self._segment(row, include_vector=VECTOR_FIELD in fields)
+                inner_hit["fields"] = {
+                    field: _as_field_values(segment[field.split(".", 1)[1]])
+                    for field in fields
+                    if field.startswith(f"{NESTED_PATH}.")
+                }
+            hits.append(inner_hit)
+
+        return {
+            "hits": {
+                "total": {"value": len(matched), "relation": "eq"},
+                "max_score": hits[0]["_score"] if hits else None,
+                "hits": hits,
+            }
+        }
+
+    def _segment(self, row: int, include_vector: bool) -> dict:
+        segment = {
+            "embeddingOption": str(self.segment_options[row]),
+            "startSec": float(self.segment_start[row]),
+            "endSec": float(self.segment_end[row]),
+        }
+        if include_vector:
+            segment["embedding"] = self.vectors[row].tolist()
+        return segment
+
+    def _source(self, video: int, spec) -> Optional[dict]:
+        """Build a video's `_source`, applying the query's `_source` includes and excludes."""
+        if spec is False:
+            return None
+        includes, excludes = [], []
+        if isinstance(spec, dict):
+            includes = spec.get("includes", [])
+            excludes = spec.get("excludes", [])
+        elif isinstance(spec, (list, str)):
+            includes = [spec] if isinstance(spec, str) else spec
+
+        def wanted(path: str) -> bool:
+            if any(_path_matches(path, pattern) for pattern in excludes):
+                return False
+            return not includes or any(
+                _path_matches(path, pattern) or pattern.startswith(f"{path}.")
+                for pattern in includes
+            )
+
+        source = {key: value for key, value in self.sources[video].items() if wanted(key)}
+        if wanted(NESTED_PATH):
+            include_vector = wanted(VECTOR_FIELD)
+            lo, hi = self.offsets[video], self.offsets[video + 1]
+            segments = []
+            for row in range(lo, hi):
+                segment = self._segment(row, include_vector)
+                segments.append(
+                    {
+                        key: value
+                        for key, value in segment.items()
+                        if wanted(f"{NESTED_PATH}.{key}")
+                    }
+                )
+            source[NESTED_PATH] = segments
+        return source
+
+    def _filter_mask(self, clause: dict) -> np.ndarray:
+        """Evaluate a k-NN filter clause into a per-segment boolean mask."""
+        (kind, spec), = clause.items()
+        if kind == "bool":
+            mask = np.ones(len(self.vectors), dtype=bool)
+            for sub in _as_list(spec.get("must", [])) + _as_list(spec.get("filter", [])):
+                mask &= self._filter_mask(sub)
+            for sub in _as_list(spec.get("must_not", [])):
+                mask &= ~self._filter_mask(sub)
+            should = _as_list(spec.get("should", []))
+            if should:
+                any_should = np.zeros(len(self.vectors), dtype=bool)
+                for sub in should:
+                    any_should |= self._filter_mask(sub)
+                mask &= any_should
+            return mask
+        if kind in ("term", "terms", "range"):
+            (field, condition), = spec.items()
+            values = self._field_values(field)
+            if kind == "term":
+                condition = condition["value"] if isinstance(condition, dict) else condition
+                return values == condition
+            if kind == "terms":
+                return np.isin(values, condition)
+            mask = np.ones(len(values), dtype=bool)
+            for operator, compare in _RANGE_OPERATORS.items():
+                if operator in condition:
+                    mask &= compare(values.astype(float), condition[operator])
+            return mask
+        if kind == "match_all":
+            return np.ones(len(self.vectors), dtype=bool)
+        raise ValueError(f"Unsupported filter clause: {kind}")
+
+    def _field_values(self, field: str) -> np.ndarray:
+        """Get a field's value for every segment; video-level fields are broadcast to their segments."""
+        if field.startswith(f"{NESTED_PATH}."):
+            name = field.split(".", 1)[1]
+            return {
+                "embeddingOption": self.segment_options,
+                "startSec": self.segment_start,
+                "endSec": self.segment_end,
+            }[name]
+        video_values = np.asarray([source.get(field, np.nan) for source in self.sources])
+        return video_values[self.segment_video]
+
+
+def video_to_index_entry(
+    video_embeddings: VideoEmbeddings, analysis_path: Optional[str] = None
+) -> Tuple[dict, np.ndarray, List[dict]]:
+    """Convert a video's embeddings (and optional Pegasus analysis) into a (source, vectors, segments) tuple.
+
+    Args:
+        video_embeddings (VideoEmbeddings): The video embeddings object.
+        analysis_path (str, optional): The local Pegasus analyses directory.
+
+    Returns:
+        Tuple[dict, np.ndarray, List[dict]]: The source without embeddings, the vectors, and the segment metadata.
+    """
+    source = video_embeddings.model_dump(exclude={"embeddings"})
+    if analysis_path is not None:
+        analysis_file_path = os.path.join(
+            analysis_path, f"{os.path.splitext(video_embeddings.videoName)[0]}.json"
+        )
+        if os.path.exists(analysis_file_path):
+            with open(analysis_file_path, "r") as f:
+                analysis = VideoAnalysis.model_validate_json(f.read())
+            source.update(analysis.model_dump(include={"title", "summary", "keywords"}))
+
+    segments = [
+        segment.model_dump(include=set(SEGMENT_FIELDS))
+        for segment in video_embeddings.embeddings
+    ]
+    return source, video_embeddings.vectors, segments
+
+
+_RANGE_OPERATORS: Dict[str, Callable[[np.ndarray, float], np.ndarray]] = {
+    "gte": lambda values, bound: values >= bound,
+    "gt": lambda values, bound: values > bound,
+    "lte": lambda values, bound: values <= bound,
+    "lt": lambda values, bound: values < bound,
+}
+
+
+def _top_k(values: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the k largest values, best first, using a partial sort."""
+    if k <= 0 or len(values) == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(values):
+        top = np.argpartition(-values, k - 1)[:k]
+    else:
+        top = np.arange(len(values))
+    return top[np.argsort(-values[top], kind="stable")]
+
+
+def _score_mode(scores: np.ndarray, score_mode: str) -> float:
+    if score_mode == "avg":
+        return float(scores.mean())
+    if score_mode == "sum":
+        return float(scores.sum())
+    if score_mode == "min":
+        return float(scores.min())
+    return float(scores.max())
+
+
+def _path_matches(path: str, pattern: str) -> bool:
+    if pattern.endswith("*"):
+        return path.startswith(pattern[:-1])
+    return path == pattern or path.startswith(f"{pattern}.")
+
+
+def _as_field_values(value) -> list:
+    # OpenSearch returns `fields` values as lists; a vector is returned as its list of floats
+    return value if isinstance(value, list) else [value]
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def _tokenize(text: str) -> List[str]:
+    # Lowercased word tokens, close to the OpenSearch standard analyzer
+    return re.findall(r"\w+", text.lower())
+
+
+def _field_text(value) -> str:
+    if value is None:
+        return ""
+    return " ".join(value) if isinstance(value, list) else str(value)
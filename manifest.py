@@ -0,0 +1,88 @@
+from typing import Dict, Iterator, Optional
+import json
+import os
+import threading
+import time
+
+
+class Manifest:
+    """Append-only JSON Lines record of the objects a stage has already processed.
+
+    Each line maps a key (e.g., a video file name) to a fingerprint (e.g., the
+    S3 ETag) plus any extra fields. When a key appears more than once, the last
+    line wins, so a rerun only needs to handle keys whose fingerprint is new or
+    has changed. Appends are flushed per record, so a crash loses at most the
+    object being processed.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        """Load the manifest from disk, if it exists.
+        Args:
+            file_path (str): The path to the manifest file.
+        """
+        self.file_path = file_path
+        self._records: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(file_path):
+            with open(file_path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        print(f"Skipping malformed manifest line in {file_path}")
+                        continue
+                    self._records[record["key"]] = record
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._records))
+
+    def get(self, key: str) -> Optional[dict]:
+        """Get the latest record for a key.
+        Args:
+            key (str): The key of the record.
+        Returns:
+            Optional[dict]: The record, or None if the key has not been recorded.
+        """
+        return self._records.get(key)
+
+    def is_current(self, key: str, fingerprint: str) -> bool:
+        """Check whether a key has already been processed with the same fingerprint.
+        Args:
+            key (str): The key of the record.
+            fingerprint (str): The current fingerprint of the object (e.g., its ETag).
+        Returns:
+            bool: True if the recorded fingerprint matches.
+        """
+        record = self._records.get(key)
+        return record is not None and record["fingerprint"] == fingerprint
+
+    def record(self, key: str, fingerprint: str, **fields) -> None:
+        """Record that a key has been processed and append it to the manifest file.
+        Args:
+            key (str): The key of the record.
+            fingerprint (str): The fingerprint of the processed object.
+            **fields: Extra JSON-serializable fields to store with the record.
+        """
+        record = {
+            "key": key,
+            "fingerprint": fingerprint,
+            "dateRecorded": time.strftime("%Y-%m-%dT%H:%M:%S %Z", time.gmtime()),
+            **fields,
+        }
+        with self._lock:
+            self._records[key] = record
+            directory = os.path.dirname(self.file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.file_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
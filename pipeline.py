@@ -0,0 +1,365 @@
+# Summary: This script runs the whole video pipeline: keyframes, Marengo embeddings, Pegasus analyses,
+#          OpenSearch documents, and indexing. The stages form a DAG and independent stages run in parallel.
+#          Each video's state in each stage is kept in a local SQLite journal, so a rerun skips finished work
+#          and resumes in-flight Bedrock jobs by their invocation ARN instead of resubmitting them.
+# Author: Gary A. Stafford
+# Date: 2025-07-23
+# License: MIT License
+
+import json
+import os
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from dotenv import load_dotenv
+
+import ffmpeg_extract_keyframe as keyframes
+import generate_analyses_pegasus as pegasus
+import generate_embeddings_marengo as marengo
+import prepare_opensearch_documents as documents
+from bulk_indexer import BulkIndexer
+from embedding_store import embeddings_exist
+from instrumentation import count_sdk_throttles, export_metrics, start_metrics
+from manifest import Manifest
+from pipeline_journal import (
+    COMPLETED,
+    FAILED,
+    INDEXED,
+    SUBMITTED,
+    PipelineJournal,
+)
+from utilities import S3Object, Utilities
+
+load_dotenv()  # Loads variables from .env file
+
+OPENSEARCH_ENDPOINT = os.getenv("OPENSEARCH_ENDPOINT")
+INDEX_NAME = "tv-commercials-index"
+
+JOURNAL_PATH = os.getenv("PIPELINE_JOURNAL_PATH", "pipeline_journal.db")
+
+# Comma-separated stages to run; stages left out are treated as done if the journal says so
+ALL_STAGES = ["keyframe", "marengo", "pegasus", "documents", "index"]
+STAGES = os.getenv("PIPELINE_STAGES", ",".join(ALL_STAGES)).split(",")
+
+
+class Stage(NamedTuple):
+    name: str
+    depends_on: Tuple[str, ...]
+    run: Callable[[List[S3Object]], None]
+    output_exists: Optional[Callable[[S3Object], bool]] = None
+
+
+def main() -> None:
+    unknown = set(STAGES) - set(ALL_STAGES)
+    if unknown:
+        raise ValueError(f"Unknown pipeline stages: {', '.join(sorted(unknown))}")
+    start_metrics("pipeline")
+
+    config = Config(
+        retries={
+            "max_attempts": 5,
+            "mode": "standard",  # Or 'adaptive' for a more sophisticated approach
+        }
+    )
+
+    marengo_client = boto3.client(
+        service_name="bedrock-runtime", region_name=marengo.AWS_REGION, config=config
+    )
+    # Pegasus throttles go straight to the shared rate limiter, without SDK retries
+    pegasus_client = boto3.client(
+        service_name="bedrock-runtime",
+        region_name=pegasus.AWS_REGION,
+        config=pegasus.CLIENT_CONFIG,
+    )
+    count_sdk_throttles(marengo_client, stage="marengo")
+    count_sdk_throttles(pegasus_client, stage="pegasus")
+    s3_client = boto3.client("s3", region_name=marengo.AWS_REGION)
+
+    sts = boto3.client("sts")
+    account_id = sts.get_caller_identity()["Account"]
+
+    journal = PipelineJournal(JOURNAL_PATH)
+
+    stages = [
+        Stage(
+            "keyframe",
+            # Per-segment keyframes need the segment boundaries from Marengo
+            ("marengo",) if keyframes.KEYFRAME_MODE == "segments" else (),
+            lambda videos: run_keyframe_stage(journal, videos),
+            lambda video: keyframes.keyframes_exist(video.file_name, keyframes.KEYFRAME_MODE),
+        ),
+        Stage(
+            "marengo",
+            (),
+            lambda videos: run_marengo_stage(
+                journal, marengo_client, s3_client, account_id, videos
+            ),
+            lambda video: embeddings_exist(
+                marengo.LOCAL_DESTINATION_DIRECTORY, video.file_name
+            ),
+        ),
+        Stage(
+            "pegasus",
+            (),
+            lambda videos: run_pegasus_stage(journal, pegasus_client, account_id, videos),
+            lambda video: os.path.exists(
+                os.path.join(
+                    pegasus.LOCAL_DESTINATION_DIRECTORY, document_file_name(video)
+                )
+            ),
+        ),
+        Stage(
+            "documents",
+            ("marengo", "pegasus"),
+            lambda videos: run_documents_stage(journal, videos),
+            lambda video: os.path.exists(
+                os.path.join(
+                    documents.LOCAL_OPENSEARCH_DIRECTORY, document_file_name(video)
+                )
+            ),
+        ),
+        Stage(
+            "index",
+            ("documents",),
+            lambda videos: run_index_stage(journal, videos),
+        ),
+    ]
+
+    # Stream the MP4 objects from the specified S3 bucket, page by page
+    videos = list(
+        Utilities.iter_video_objects_from_s3(
+            s3_client, marengo.S3_VIDEO_STORAGE_BUCKET_MARENGO, marengo.S3_SOURCE_PREFIX
+        )
+    )
+    print(f"Videos found: {len(videos)}")
+
+    run_pipeline(journal, [stage for stage in stages if stage.name in STAGES], videos)
+
+    for stage, counts in journal.summary().items():
+        print(f"{stage}: {counts}")
+    journal.close()
+    export_metrics("pipeline")
+
+
+def run_pipeline(
+    journal: PipelineJournal, stages: List[Stage], videos: List[S3Object]
+) -> None:
+    """Run the stages in dependency order, running independent stages in parallel.
+    Args:
+        journal (PipelineJournal): The journal of each video's state in each stage.
+        stages (List[Stage]): The stages to run.
+        videos (List[S3Object]): The S3 listing entries of the videos.
+    """
+    for video in videos:
+        for stage in stages:
+            done = stage.output_exists is not None and stage.output_exists(video)
+            journal.register(video.file_name, stage.name, video.etag, done=done)
+
+    stage_names = {stage.name for stage in stages}
+    finished = set()
+    running: Dict = {}
+    with ThreadPoolExecutor(max_workers=len(stages) or 1) as executor:
+        while len(finished) < len(stages):
+            for stage in stages:
+                if stage.name in finished or stage.name in running.values():
+                    continue
+                # Only dependencies selected in this run gate the stage; the journal gates each video
+                if any(
+                    dependency in stage_names and dependency not in finished
+                    for dependency in stage.depends_on
+                ):
+                    continue
+                ready = [
+                    video
+                    for video in videos
+                    if not journal.is_done(video.file_name, stage.name)
+                    and all(
+                        journal.is_done(video.file_name, dependency)
+                        for dependency in stage.depends_on
+                    )
+                ]
+                print(f"Starting stage '{stage.name}' for {len(ready)} videos")
+                running[executor.submit(stage.run, ready)] = stage.name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    print(f"Stage '{name}' finished")
+                except Exception as e:
+                    print(f"Stage '{name}' stopped with an error: {e}")
+                finished.add(name)
+
+
+def run_keyframe_stage(journal: PipelineJournal, videos: List[S3Object]) -> None:
+    """Extract keyframes from the local copies of the videos."""
+    os.makedirs(keyframes.LOCAL_KEYFRAMES_DIRECTORY, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=keyframes.MAX_WORKERS) as executor:
+        futures = {}
+        for video in videos:
+            video_path = os.path.join(keyframes.LOCAL_VIDEOS_DIRECTORY, video.file_name)
+            if not os.path.exists(video_path):
+                journal.set(
+                    video.file_name, "keyframe", FAILED, error="No local copy of the video"
+                )
+                continue
+            future = executor.submit(
+                keyframes.process_video, video.file_name, keyframes.KEYFRAME_MODE
+            )
+            futures[future] = video
+        for future in as_completed(futures):
+            video = futures[future]
+            try:
+                future.result()
+                journal.set(video.file_name, "keyframe", COMPLETED)
+            except Exception as e:
+                print(f"Error extracting keyframes from {video.file_name}: {e}")
+                journal.set(video.file_name, "keyframe", FAILED, error=str(e))
+
+
+def run_marengo_stage(
+    journal: PipelineJournal,
+    bedrock_client: boto3.client,
+    s3_client: boto3.client,
+    account_id: str,
+    videos: List[S3Object],
+) -> None:
+    """Generate embeddings window by window as in the standalone script, resuming each window's invocation from the last run."""
+    resume: Dict[str, marengo.MarengoJob] = {}
+    jobs = []
+    for video in videos:
+        invocations = {
+            row["window_index"]: row
+            for row in journal.invocations(video.file_name, "marengo")
+        }
+        record = journal.get(video.file_name, "marengo")
+        for job in marengo.plan_jobs(s3_client, video):
+            invocation = invocations.get(job.window)
+            if invocation is not None and invocation["windows"] == job.windows:
+                invocation_arn = invocation["invocation_arn"]
+            elif (
+                job.windows == 1
+                and record
+                and record["state"] == SUBMITTED
+                and record["invocation_arn"]
+            ):
+                invocation_arn = record["invocation_arn"]  # Recorded before windows had rows
+            else:
+                invocation_arn = None
+            if invocation_arn:
+                try:
+                    bedrock_client.get_async_invoke(invocationArn=invocation_arn)
+                    print(f"Resuming job for {job.name}: {invocation_arn}")
+                    resume[invocation_arn] = job
+                    continue
+                except ClientError as e:
+                    # The invocation has expired or is unknown; start a new one
+                    print(f"Cannot resume job for {job.name}, resubmitting: {e}")
+            jobs.append(job)
+
+    def on_submit(job: marengo.MarengoJob, invocation_arn: str) -> None:
+        # Record the ARN before polling, so a restart resumes this window
+        file_name = job.video_object.file_name
+        journal.set_invocation(file_name, "marengo", job.window, job.windows, invocation_arn)
+        journal.set(file_name, "marengo", SUBMITTED, invocation_arn=invocation_arn)
+
+    def on_video_complete(video: S3Object) -> None:
+        journal.set(video.file_name, "marengo", COMPLETED)
+        journal.clear_invocations(video.file_name, "marengo")
+
+    def on_video_failure(video: S3Object, message: str) -> None:
+        journal.set(video.file_name, "marengo", FAILED, error=message)
+        journal.clear_invocations(video.file_name, "marengo")
+
+    marengo.generate_video_embeddings(
+        bedrock_client,
+        s3_client,
+        account_id,
+        jobs,
+        Manifest(marengo.MANIFEST_FILE_PATH),
+        resume=resume,
+        on_submit=on_submit,
+        on_video_complete=on_video_complete,
+        on_video_failure=on_video_failure,
+    )
+
+
+def run_pegasus_stage(
+    journal: PipelineJournal,
+    bedrock_client: boto3.client,
+    account_id: str,
+    videos: List[S3Object],
+) -> None:
+    """Generate the video analyses the same way as the standalone script, linking duplicates and recording the manifest."""
+    pegasus.analyze_videos(
+        bedrock_client,
+        account_id,
+        videos,
+        Manifest(pegasus.MANIFEST_FILE_PATH),
+        on_complete=lambda video: journal.set(video.file_name, "pegasus", COMPLETED),
+        on_failure=lambda video, e: journal.set(
+            video.file_name, "pegasus", FAILED, error=str(e)
+        ),
+    )
+
+
+def run_documents_stage(journal: PipelineJournal, videos: List[S3Object]) -> None:
+    """Prepare the OpenSearch document of each video whose embeddings and analysis are ready."""
+    manifest = Manifest(documents.MANIFEST_FILE_PATH)
+    for video in videos:
+        try:
+            documents.prepare_opensearch_document_if_changed(
+                document_file_name(video), manifest
+            )
+            journal.set(video.file_name, "documents", COMPLETED)
+        except Exception as e:
+            print(f"Error preparing OpenSearch document for {video.file_name}: {e}")
+            journal.set(video.file_name, "documents", FAILED, error=str(e))
+
+
+def run_index_stage(journal: PipelineJournal, videos: List[S3Object]) -> None:
+    """Index the prepared documents, keyed by video name so a rerun replaces rather than duplicates them."""
+    if not videos:
+        return
+    if not OPENSEARCH_ENDPOINT:
+        raise ValueError("OPENSEARCH_ENDPOINT is not set")
+
+    def iter_ready_documents():
+        for video in videos:
+            file_path = os.path.join(
+                documents.LOCAL_OPENSEARCH_DIRECTORY, document_file_name(video)
+            )
+            with open(file_path, "r") as f:
+                yield json.load(f)
+
+    os_client = Utilities.create_opensearch_client(
+        OPENSEARCH_ENDPOINT, marengo.AWS_REGION
+    )
+    indexer = BulkIndexer(os_client, INDEX_NAME, action="index", id_field="videoName")
+    result = indexer.index_documents(iter_ready_documents())
+    failed_ids = set(result.failed_ids)
+    for video in videos:
+        if video.file_name in failed_ids:
+            journal.set(video.file_name, "index", FAILED, error="Rejected by OpenSearch")
+        else:
+            journal.set(video.file_name, "index", INDEXED)
+
+
+def document_file_name(video: S3Object) -> str:
+    """Return the name of a video's analysis and OpenSearch document files."""
+    return video.file_name.replace(".mp4", ".json")
+
+
+if __name__ == "__main__":
+    main()
+    print("Pipeline run completed successfully.")
@@ -0,0 +1,193 @@
+from typing import Dict, List, Optional
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_PATH = "pipeline_journal.db"
+
+# Per-video, per-stage states
+PENDING = "pending"
+SUBMITTED = "submitted"  # An async Bedrock invocation is in flight; its ARN is recorded
+COMPLETED = "completed"
+INDEXED = "indexed"
+FAILED = "failed"
+
+DONE_STATES = (COMPLETED, INDEXED)
+
+
+class PipelineJournal:
+    """SQLite journal of each video's state in each pipeline stage.
+
+    One row per (video, stage) holds the state, the video's fingerprint (e.g.,
+    its S3 ETag), and the invocation ARN of an in-flight async job. A video
+    split into time windows has one invocation row per window. Every change is
+    committed immediately, so after a crash or restart the pipeline picks up
+    where it stopped and polls in-flight jobs instead of resubmitting them.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH) -> None:
+        """Open (or create) the journal.
+        Args:
+            db_path (str): The SQLite database path; use ":memory:" for a process-local journal.
+        """
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS stage_state (
+                video TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                state TEXT NOT NULL,
+                fingerprint TEXT,
+                invocation_arn TEXT,
+                error TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (video, stage)
+            )"""
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS window_invocation (
+                video TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                window_index INTEGER NOT NULL,
+                windows INTEGER NOT NULL,
+                invocation_arn TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (video, stage, window_index)
+            )"""
+        )
+        self._db.commit()
+
+    def register(self, video: str, stage: str, fingerprint: str, done: bool = False) -> str:
+        """Add a video to a stage, or reset it to pending if the video has changed.
+        Args:
+            video (str): The video file name.
+            stage (str): The stage name.
+            fingerprint (str): The current fingerprint of the video (e.g., its ETag).
+            done (bool): Whether the stage's output already exists, e.g., from a standalone script run.
+        Returns:
+            str: The video's state in the stage.
+        """
+        record = self.get(video, stage)
+        if record is not None and record["fingerprint"] == fingerprint:
+            return record["state"]
+        state = COMPLETED if done and record is None else PENDING
+        self.set(video, stage, state, fingerprint=fingerprint)
+        # The invocations of a changed video's windows belong to its old content
+        self.clear_invocations(video, stage)
+        return state
+
+    def get(self, video: str, stage: str) -> Optional[dict]:
+        """Get a video's record for a stage.
+        Args:
+            video (str): The video file name.
+            stage (str): The stage name.
+        Returns:
+            Optional[dict]: The record, or None if the video has not been registered in the stage.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM stage_state WHERE video = ? AND stage = ?", (video, stage)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def set(
+        self,
+        video: str,
+        stage: str,
+        state: str,
+        fingerprint: Optional[str] = None,
+        invocation_arn: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        """Record a video's state in a stage; the fingerprint is kept if not given.
+        Args:
+            video (str): The video file name.
+            stage (str): The stage name.
+            state (str): The new state.
+            fingerprint (str, optional): The fingerprint of the video.
+            invocation_arn (str, optional): The ARN of the stage's async invocation, if any.
+            error (str, optional): The reason the stage failed, if it did.
+        """
+        with self._lock:
+            self._db.execute(
+                """INSERT INTO stage_state VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (video, stage) DO UPDATE SET
+                    state = excluded.state,
+                    fingerprint = COALESCE(excluded.fingerprint, fingerprint),
+                    invocation_arn = excluded.invocation_arn,
+                    error = excluded.error,
+                    updated = excluded.updated""",
+                (video, stage, state, fingerprint, invocation_arn, error, time.time()),
+            )
+            self._db.commit()
+
+    def set_invocation(
+        self, video: str, stage: str, window: int, windows: int, invocation_arn: str
+    ) -> None:
+        """Record the invocation ARN of one time window of a video.
+        Args:
+            video (str): The video file name.
+            stage (str): The stage name.
+            window (int): The window index, from 0.
+            windows (int): The number of windows the video was split into.
+            invocation_arn (str): The ARN of the window's async invocation.
+        """
+        with self._lock:
+            self._db.execute(
+                """INSERT OR REPLACE INTO window_invocation VALUES (?, ?, ?, ?, ?, ?)""",
+                (video, stage, window, windows, invocation_arn, time.time()),
+            )
+            self._db.commit()
+
+    def invocations(self, video: str, stage: str) -> List[dict]:
+        """List the recorded window invocations of a video, in window order.
+        Returns:
+            List[dict]: The rows, with `window_index`, `windows`, and `invocation_arn`.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                """SELECT window_index, windows, invocation_arn FROM window_invocation
+                WHERE video = ? AND stage = ? ORDER BY window_index""",
+                (video, stage),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def clear_invocations(self, video: str, stage: str) -> None:
+        """Forget the window invocations of a video, e.g., once it has completed or failed."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM window_invocation WHERE video = ? AND stage = ?", (video, stage)
+            )
+            self._db.commit()
+
+    def is_done(self, video: str, stage: str) -> bool:
+        """Check whether a video has finished a stage."""
+        record = self.get(video, stage)
+        return record is not None and record["state"] in DONE_STATES
+
+    def videos_in_state(self, stage: str, *states: str) -> List[str]:
+        """List the videos in any of the given states for a stage."""
+        placeholders = ", ".join("?" for _ in states)
+        with self._lock:
+            rows = self._db.execute(
+                f"""SELECT video FROM stage_state
+                WHERE stage = ? AND state IN ({placeholders}) ORDER BY video""",
+                (stage, *states),
+            ).fetchall()
+        return [row["video"] for row in rows]
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """Count the videos in each state, per stage."""
+        counts: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT stage, state, COUNT(*) AS count FROM stage_state GROUP BY stage, state"
+            ).fetchall()
+        for row in rows:
+            counts.setdefault(row["stage"], {})[row["state"]] = row["count"]
+        return counts
+
+    def close(self) -> None:
+        """Close the SQLite connection."""
+        self._db.close()
@@ -1,44 +1,127 @@
 # Summary: This script prepares OpenSearch documents from video analyses and embeddings.
 #          It reads video analysis and embedding data from local JSON files, constructs OpenSearch documents,
-#          and saves them in a specified directory.
+#          and saves them in a specified directory. Documents whose input files have not changed since the
+#          last run are skipped, so only new or changed documents need to be (re)indexed.
 # Author: Gary A. Stafford
 # Date: 2025-07-23
 # License: MIT License
 
+import hashlib
 import json
 import os
 import time
+from typing import Optional
 
 from data import OpenSearchDocument, VideoAnalysis, VideoEmbeddings
+from embedding_store import get_embeddings_source_files, read_video_embeddings
+from instrumentation import METRICS, export_metrics, start_metrics
+from manifest import Manifest
 
 LOCAL_EMBEDDINGS_DIRECTORY = "bedrock_marengo_embeddings"
 LOCAL_ANALYSIS_DIRECTORY = "bedrock_pegasus_analyses"
 LOCAL_OPENSEARCH_DIRECTORY = "documents"
+MANIFEST_FILE_PATH = f"{LOCAL_OPENSEARCH_DIRECTORY}/_manifest.jsonl"
 
 
 def main():
-    for analysis_file in os.listdir(LOCAL_ANALYSIS_DIRECTORY):
+    start_metrics("prepare_opensearch_documents")
+
+    # Documents are fingerprinted by a hash of their input files; unchanged ones are skipped
+    manifest = Manifest(MANIFEST_FILE_PATH)
+    prepared, unchanged = 0, 0
+    for analysis_file in sorted(os.listdir(LOCAL_ANALYSIS_DIRECTORY)):
         if not analysis_file.endswith(".json"):
             print(f"Skipping {analysis_file}, not a JSON file.")
             continue
 
-        print(f"Generating OpenSearch document for: {analysis_file}")
+        if prepare_opensearch_document_if_changed(analysis_file, manifest):
+            prepared += 1
+        else:
+            unchanged += 1
+    print(f"Documents prepared: {prepared}, unchanged: {unchanged}")
+    export_metrics("prepare_opensearch_documents")
+
+
+def prepare_opensearch_document_if_changed(
+    analysis_file: str, manifest: Manifest
+) -> bool:
+    """Prepare a video's OpenSearch document only if its input files have changed.
+    :param analysis_file: Name of the analysis file (used for naming the input embeddings and output).
+    :param manifest: Manifest of the input hash of each document already prepared.
+    :return: True if the document was (re)written, False if it was unchanged.
+    """
+    input_hash = compute_input_hash(analysis_file)
+    output_file_path = os.path.join(LOCAL_OPENSEARCH_DIRECTORY, analysis_file)
+    if manifest.is_current(analysis_file, input_hash) and os.path.exists(
+        output_file_path
+    ):
+        print(f"Skipping {analysis_file}, inputs unchanged.")
+        METRICS.increment("documents_unchanged", stage="documents")
+        return False
+
+    print(f"Generating OpenSearch document for: {analysis_file}")
+    # Keep the date the document was first created, so reruns do not change it
+    record = manifest.get(analysis_file)
+    date_created = record.get("documentDateCreated") if record else None
+    with METRICS.span("prepare_document", stage="documents", video=analysis_file):
+        document = prepare_opensearch_document_file(analysis_file, date_created)
+    METRICS.increment("documents_prepared", stage="documents")
+    manifest.record(
+        analysis_file,
+        input_hash,
+        videoName=document.videoName,
+        documentDateCreated=document.dateCreated,
+    )
+    return True
+
 
-        # Construct file paths for embeddings and analysis
-        embeddings_file_path = os.path.join(LOCAL_EMBEDDINGS_DIRECTORY, analysis_file)
-        analysis_file_path = os.path.join(LOCAL_ANALYSIS_DIRECTORY, analysis_file)
+def compute_input_hash(analysis_file: str) -> str:
+    """Hash the Pegasus analysis file and the Marengo embeddings file(s) a document is built from.
+    :param analysis_file: Name of the analysis file.
+    :return: Hex SHA-256 digest of the input files' names and contents.
+    :raises FileNotFoundError: If the analysis or embeddings file does not exist.
+    """
+    embeddings_files = get_embeddings_source_files(
+        LOCAL_EMBEDDINGS_DIRECTORY, analysis_file
+    )
+    if not embeddings_files:
+        raise FileNotFoundError(f"No embeddings found for: {analysis_file}")
+
+    digest = hashlib.sha256()
+    for file_path in [
+        os.path.join(LOCAL_ANALYSIS_DIRECTORY, analysis_file),
+        *embeddings_files,
+    ]:
+        digest.update(os.path.basename(file_path).encode("utf-8") + b"\0")
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def prepare_opensearch_document_file(
+    analysis_file: str, date_created: Optional[str] = None
+) -> OpenSearchDocument:
+    """Read a video's embeddings and analysis files and write its OpenSearch document.
+    :param analysis_file: Name of the analysis file (used for naming the input embeddings and output).
+    :param date_created: Creation date to keep for the document; defaults to now.
+    :return: OpenSearchDocument object that was written.
+    """
+    # Construct file path for analysis
+    analysis_file_path = os.path.join(LOCAL_ANALYSIS_DIRECTORY, analysis_file)
 
-        # Read the JSON files
-        embeddings = VideoEmbeddings(**read_json_file(embeddings_file_path))
-        analysis = VideoAnalysis(**read_json_file(analysis_file_path))
+    # Read the embeddings (JSON or memory-mapped .npy) and analysis files
+    embeddings = read_video_embeddings(LOCAL_EMBEDDINGS_DIRECTORY, analysis_file)
+    analysis = VideoAnalysis(**read_json_file(analysis_file_path))
 
-        # Prepare OpenSearch document
-        opensearch_document: OpenSearchDocument = prepare_opensearch_documents(
-            embeddings, analysis
-        )
+    # Prepare OpenSearch document
+    opensearch_document: OpenSearchDocument = prepare_opensearch_documents(
+        embeddings, analysis, date_created
+    )
 
-        # Write the OpenSearch document to a file
-        write_opensearch_document(analysis_file, opensearch_document)
+    # Write the OpenSearch document to a file
+    write_opensearch_document(analysis_file, opensearch_document)
+    return opensearch_document
 
 
 def write_opensearch_document(
@@ -53,6 +136,7 @@ def write_opensearch_document(
     output_file_path = os.path.join(LOCAL_OPENSEARCH_DIRECTORY, analysis_file)
     with open(output_file_path, "w") as output_file:
         json.dump(opensearch_document.model_dump(), output_file, indent=2)
+        METRICS.increment("bytes_written", output_file.tell(), stage="documents")
 
 
 def read_json_file(file_path: str) -> dict:
@@ -71,11 +155,14 @@ def read_json_file(file_path: str) -> dict:
 
 
 def prepare_opensearch_documents(
-    embeddings: VideoEmbeddings, analysis: VideoAnalysis
+    embeddings: VideoEmbeddings,
+    analysis: VideoAnalysis,
+    date_created: Optional[str] = None,
 ) -> OpenSearchDocument:
     """Prepare OpenSearch document from video embeddings and analysis data.
     :param embeddings: VideoEmbeddings object containing vector embeddings.
     :param analysis: VideoAnalysis object containing video analysis data.
+    :param date_created: Creation date to keep for the document; defaults to now.
     :return: OpenSearchDocument object ready for indexing.
     """
     document = OpenSearchDocument(
@@ -85,11 +172,12 @@ def prepare_opensearch_documents(
         title=analysis.title,
         summary=analysis.summary,
         keywords=analysis.keywords,
-        dateCreated=time.strftime("%Y-%m-%dT%H:%M:%S %Z", time.gmtime()),
+        dateCreated=date_created
+        or time.strftime("%Y-%m-%dT%H:%M:%S %Z", time.gmtime()),
         contentType=embeddings.contentType,
         sizeBytes=embeddings.sizeBytes,
         durationSec=embeddings.durationSec,
-        embeddings=embeddings.embeddings,
+        embeddings=embeddings.materialize().embeddings,
     )
 
     return document
@@ -0,0 +1,186 @@
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_DB_PATH = "query_embeddings.db"
+
+
+class QueryEmbeddingCache:
+    """Two-level cache of text query embeddings, keyed by normalized text plus model ID.
+
+    An in-memory LRU sits over an on-disk SQLite store of float32 blobs, so
+    repeated and popular queries skip Bedrock entirely, across runs. Entries
+    older than the TTL are treated as misses and evicted.
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        capacity: int = 1024,
+        ttl_seconds: float = 30 * 24 * 60 * 60,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Open (or create) the cache.
+        Args:
+            db_path (str): The SQLite database path; use ":memory:" for a process-local cache.
+            capacity (int): The maximum number of embeddings held in the in-memory LRU.
+            ttl_seconds (float): How long an embedding stays valid, in seconds.
+            clock (Callable[[], float]): Wall clock, in seconds since the epoch.
+        """
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS query_embeddings (
+                key TEXT PRIMARY KEY,
+                model_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                embedding BLOB NOT NULL,
+                created REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Normalize query text so trivially different spellings share an entry."""
+        return " ".join(text.casefold().split())
+
+    @classmethod
+    def make_key(cls, text: str, model_id: str) -> str:
+        """Build the cache key for a query text and model ID."""
+        normalized = cls.normalize_text(text)
+        return hashlib.sha256(f"{model_id}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str, model_id: str) -> Optional[np.ndarray]:
+        """Get a cached embedding.
+        Args:
+            text (str): The query text.
+            model_id (str): The embedding model ID.
+        Returns:
+            Optional[np.ndarray]: The float32 embedding, or None on a miss.
+        """
+        key = self.make_key(text, model_id)
+        now = self.clock()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                embedding, created = entry
+                if now - created <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return embedding
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT embedding, created FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] <= self.ttl_seconds:
+                embedding = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, embedding, row[1])
+                self.disk_hits += 1
+                return embedding
+
+            self.misses += 1
+            return None
+
+    def put(self, text: str, model_id: str, embedding: List[float]) -> np.ndarray:
+        """Store an embedding in memory and on disk.
+        Args:
+            text (str): The query text.
+            model_id (str): The embedding model ID.
+            embedding (List[float]): The embedding vector.
+        Returns:
+            np.ndarray: The stored float32 embedding.
+        """
+        key = self.make_key(text, model_id)
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        created = self.clock()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    model_id,
+                    self.normalize_text(text),
+                    len(vector),
+                    vector.tobytes(),
+                    created,
+                ),
+            )
+            self._db.commit()
+            self._remember(key, vector, created)
+        return vector
+
+    def get_or_compute(
+        self, text: str, model_id: str, compute: Callable[[str], List[float]]
+    ) -> np.ndarray:
+        """Get a cached embedding, or compute and cache it on a miss.
+        Args:
+            text (str): The query text.
+            model_id (str): The embedding model ID.
+            compute (Callable[[str], List[float]]): Generates the embedding for the text, e.g., via Bedrock.
+        Returns:
+            np.ndarray: The float32 embedding.
+        """
+        embedding = self.get(text, model_id)
+        if embedding is None:
+            embedding = self.put(text, model_id, compute(text))
+        return embedding
+
+    def evict_expired(self) -> int:
+        """Delete every expired embedding from memory and disk.
+        Returns:
+            int: The number of embeddings deleted from disk.
+        """
+        cutoff = self.clock() - self.ttl_seconds
+        with self._lock:
+            for key in [k for k, (_, created) in self._memory.items() if created < cutoff]:
+                del self._memory[key]
+            cursor = self._db.execute(
+                "DELETE FROM query_embeddings WHERE created < ?", (cutoff,)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    @property
+    def stats(self) -> dict:
+        """Return the hit and miss counters and the number of cached embeddings."""
+        with self._lock:
+            disk_size = self._db.execute(
+                "SELECT COUNT(*) FROM query_embeddings"
+            ).fetchone()[0]
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_size": len(self._memory),
+            "disk_size": disk_size,
+        }
+
+    def close(self) -> None:
+        """Close the SQLite connection."""
+        self._db.close()
+
+    def _remember(self, key: str, embedding: np.ndarray, created: float) -> None:
+        """Add an embedding to the in-memory LRU, evicting the least recently used entry if full."""
+        self._memory[key] = (embedding, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
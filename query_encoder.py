@@ -0,0 +1,191 @@
+from collections import deque
+from typing import Callable, List, Optional
+import json
+import re
+import time
+
+import boto3
+import numpy as np
+from botocore.exceptions import ClientError
+
+from query_cache import QueryEmbeddingCache
+from utilities import Utilities
+
+MODEL_ID = "twelvelabs.marengo-embed-2-7-v1:0"
+
+# Latency targets for encoding one text query, in milliseconds
+LATENCY_TARGET_P50_MS = 500.0
+LATENCY_TARGET_P99_MS = 2000.0
+
+# ValidationException messages meaning the model cannot be invoked synchronously, as opposed
+# to a bad request (e.g., an empty or over-long query), which must not disable the fast path
+SYNC_UNSUPPORTED_PATTERN = re.compile(
+    r"on-demand throughput"
+    r"|(doesn't|does not) support the model"
+    r"|model .*(isn't|is not|not) supported"
+    r"|(InvokeModel|synchronous invocation) .*not supported",
+    re.IGNORECASE,
+)
+
+
+class QueryEncoder:
+    """Turn text queries into Marengo embeddings with the lowest available latency.
+
+    Short text is embedded with a synchronous `invoke_model` call when the model
+    supports it. Otherwise the encoder falls back to `start_async_invoke` and
+    watches the S3 output key with sub-second exponential backoff. An optional
+    `QueryEmbeddingCache` is checked first. Each call's latency is recorded so
+    p50/p99 can be compared with the targets.
+    """
+
+    def __init__(
+        self,
+        bedrock_client: boto3.client,
+        s3_client: Optional[boto3.client] = None,
+        model_id: str = MODEL_ID,
+        bucket: Optional[str] = None,
+        output_prefix: str = "embeddings",
+        cache: Optional[QueryEmbeddingCache] = None,
+        use_sync: bool = True,
+        initial_poll_interval: float = 0.25,
+        max_poll_interval: float = 4.0,
+        timeout: float = 300.0,
+        latency_window: int = 1000,
+        clock: Callable[[], float] = time.perf_counter,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Initialize the encoder.
+
+        Args:
+            bedrock_client (boto3.client): The Boto3 client for the Bedrock runtime service.
+            s3_client (boto3.client, optional): The Boto3 S3 client; required for the async path.
+            model_id (str): The Marengo model ID (or inference profile ID).
+            bucket (str, optional): The S3 bucket for async outputs; required for the async path.
+            output_prefix (str): The S3 prefix for async outputs.
+            cache (QueryEmbeddingCache, optional): Checked before calling Bedrock.
+            use_sync (bool): Try synchronous invocation first.
+            initial_poll_interval (float): The first async polling interval, in seconds.
+            max_poll_interval (float): The longest async polling interval, in seconds.
+            timeout (float): The maximum time to wait for an async job, in seconds.
+            latency_window (int): The number of recent calls kept for latency percentiles.
+            clock (Callable[[], float]): Monotonic clock, in seconds.
+            sleep (Callable[[float], None]): Sleep function, in seconds.
+        """
+        self.bedrock_client = bedrock_client
+        self.s3_client = s3_client
+        self.model_id = model_id
+        self.bucket = bucket
+        self.output_prefix = output_prefix
+        self.cache = cache
+        self.use_sync = use_sync
+        self.initial_poll_interval = initial_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.sync_calls = 0
+        self.async_calls = 0
+        self.latencies = deque(maxlen=latency_window)
+
+    def encode(self, text: str) -> List[float]:
+        """Encode a text query into an embedding.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            List[float]: The embedding vector.
+        """
+        start = self.clock()
+        try:
+            if self.cache is not None:
+                return self.cache.get_or_compute(text, self.model_id, self._invoke).tolist()
+            return self._invoke(text)
+        finally:
+            self.latencies.append(self.clock() - start)
+
+    def latency_stats(self) -> dict:
+        """Return p50/p99 latency over the recent calls and whether they meet the targets."""
+        if not self.latencies:
+            return {"count": 0}
+        latencies_ms = np.asarray(self.latencies) * 1000
+        p50, p99 = np.percentile(latencies_ms, [50, 99])
+        return {
+            "count": len(latencies_ms),
+            "p50_ms": round(float(p50), 1),
+            "p99_ms": round(float(p99), 1),
+            "meets_target": bool(
+                p50 <= LATENCY_TARGET_P50_MS and p99 <= LATENCY_TARGET_P99_MS
+            ),
+            "sync_calls": self.sync_calls,
+            "async_calls": self.async_calls,
+        }
+
+    def _invoke(self, text: str) -> List[float]:
+        """Embed text with Bedrock, synchronously when possible."""
+        if self.use_sync:
+            try:
+                return self._invoke_sync(text)
+            except ClientError as e:
+                error = e.response["Error"]
+                if error["Code"] != "ValidationException" or not SYNC_UNSUPPORTED_PATTERN.search(
+                    error.get("Message", "")
+                ):
+                    raise
+                # The model (or Region) does not support synchronous invocation; stop trying
+                print(f"Synchronous invocation unavailable, using async jobs: {e}")
+                self.use_sync = False
+        return self._invoke_async(text)
+
+    def _invoke_sync(self, text: str) -> List[float]:
+        response = self.bedrock_client.invoke_model(
+            modelId=self.model_id,
+            body=json.dumps({"inputType": "text", "inputText": text}),
+            contentType="application/json",
+            accept="application/json",
+        )
+        self.sync_calls += 1
+        return _embedding_from_output(json.loads(response["body"].read()))
+
+    def _invoke_async(self, text: str) -> List[float]:
+        if self.s3_client is None or self.bucket is None:
+            raise ValueError("The async path requires an S3 client and bucket")
+
+        response = self.bedrock_client.start_async_invoke(
+            modelId=self.model_id,
+            modelInput={"inputType": "text", "inputText": text},
+            outputDataConfig={
+                "s3OutputDataConfig": {
+                    "s3Uri": f"s3://{self.bucket}/{self.output_prefix}/",
+                }
+            },
+        )
+        self.async_calls += 1
+        invocation_arn = response["invocationArn"]
+        s3_key = f"{self.output_prefix}/{invocation_arn.split('/')[-1]}/output.json"
+
+        status = Utilities.wait_for_async_output(
+            self.bedrock_client,
+            self.s3_client,
+            invocation_arn,
+            self.bucket,
+            s3_key,
+            initial_interval=self.initial_poll_interval,
+            max_interval=self.max_poll_interval,
+            timeout=self.timeout,
+            sleep=self.sleep,
+            clock=self.clock,
+        )
+        if status != "Completed":
+            raise RuntimeError(f"Query embedding job {status.lower()}: {invocation_arn}")
+
+        s3_object = self.s3_client.get_object(Bucket=self.bucket, Key=s3_key)
+        return _embedding_from_output(json.loads(s3_object["Body"].read()))
+
+
+def _embedding_from_output(output: dict) -> List[float]:
+    # Async outputs (and some sync responses) wrap the vector in a "data" list
+    if "data" in output:
+        data = output["data"]
+        return (data[0] if isinstance(data, list) else data)["embedding"]
+    return output["embedding"]
@@ -0,0 +1,86 @@
+from typing import Callable
+import threading
+import time
+
+
+class AdaptiveRateLimiter:
+    """Thread-safe token bucket whose rate adapts with AIMD.
+
+    Every worker calls `acquire()` before a request. Each successful request
+    raises the rate additively; a `ThrottlingException` seen by any worker cuts
+    the shared rate multiplicatively, so all workers back off together and the
+    rate settles close to the account's quota without hand tuning.
+    """
+
+    def __init__(
+        self,
+        initial_rate: float = 1.0,
+        min_rate: float = 0.1,
+        max_rate: float = 10.0,
+        increase_step: float = 0.1,
+        decrease_factor: float = 0.5,
+        burst: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Initialize the rate limiter.
+        Args:
+            initial_rate (float): The starting rate, in requests per second.
+            min_rate (float): The lowest rate the limiter backs off to.
+            max_rate (float): The highest rate the limiter ramps up to.
+            increase_step (float): Requests per second added after each success.
+            decrease_factor (float): Multiplier applied to the rate after a throttle.
+            burst (float): The bucket capacity, in requests.
+            clock (Callable[[], float]): Monotonic clock, in seconds.
+            sleep (Callable[[float], None]): Sleep function, in seconds.
+        """
+        if not 0 < min_rate <= initial_rate <= max_rate:
+            raise ValueError("Rates must satisfy 0 < min_rate <= initial_rate <= max_rate")
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between 0 and 1")
+
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.throttle_count = 0
+
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+
+    def on_success(self) -> None:
+        """Additively increase the shared rate after a successful request."""
+        with self._lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self) -> None:
+        """Multiplicatively decrease the shared rate after a throttled request."""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self._tokens = min(self._tokens, 0)  # Drain the bucket so waiting workers slow down too
+            self.throttle_count += 1
+            print(f"Throttled. Shared request rate reduced to {self.rate:.2f}/s")
+
+    def _refill(self) -> None:
+        """Add tokens for the time elapsed since the last update."""
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
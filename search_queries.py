@@ -0,0 +1,134 @@
+# Builders for the nested k-NN query bodies used in the notebook, so the same
+# query shapes can be sent to OpenSearch or to the local vector engine.
+# Reference: https://docs.opensearch.org/docs/latest/vector-search/specialized-operations/nested-search-knn/
+
+from typing import List, Optional
+
+INNER_HITS_FIELDS = [
+    "embeddings.startSec",
+    "embeddings.endSec",
+    "embeddings.embeddingOption",
+]
+
+# Pegasus fields for lexical search; a title or keyword match counts more than a summary match
+LEXICAL_FIELDS = ["title^3", "keywords^2", "summary"]
+
+
+def knn_query(
+    embedding: List[float],
+    k: int = 6,
+    size: Optional[int] = None,
+    filter: Optional[dict] = None,
+    inner_hits: bool = False,
+    inner_hits_size: Optional[int] = None,
+    expand_nested_docs: bool = False,
+    include_vectors: bool = False,
+) -> dict:
+    """Build a nested k-NN query on the segment embeddings.
+
+    Args:
+        embedding (List[float]): The embedding vector to use for the query.
+        k (int): The number of nearest neighbors to return.
+        size (int, optional): The number of videos to return. Defaults to k.
+        filter (dict, optional): An efficient k-NN filter, e.g., a term on `embeddings.embeddingOption`.
+        inner_hits (bool): Include the matching segments of each video.
+        inner_hits_size (int, optional): The number of matching segments to return per video.
+        expand_nested_docs (bool): Score every segment of each video, not only the best one.
+        include_vectors (bool): Return the segment vectors in the inner hits and `_source`.
+
+    Returns:
+        dict: The query body.
+    """
+    knn = {"vector": embedding, "k": k}
+    if filter is not None:
+        knn["filter"] = filter
+    if expand_nested_docs:
+        knn["expand_nested_docs"] = True
+        knn["rescore"] = True
+
+    nested = {
+        "path": "embeddings",
+        "query": {"knn": {"embeddings.embedding": knn}},
+    }
+    if inner_hits:
+        fields = INNER_HITS_FIELDS + (["embeddings.embedding"] if include_vectors else [])
+        nested["inner_hits"] = {"_source": False, "fields": fields}
+        if inner_hits_size is not None:
+            nested["inner_hits"]["size"] = inner_hits_size
+    if expand_nested_docs:
+        nested["score_mode"] = "max"
+
+    query = {"query": {"nested": nested}, "size": size if size is not None else k}
+    if not include_vectors:
+        query["_source"] = {"excludes": ["embeddings.embedding"]}
+    return query
+
+
+def radial_query(
+    embedding: List[float], max_distance: float = 1.0, size: int = 6
+) -> dict:
+    """Build a nested radial search query returning every video with a segment within a maximum distance.
+
+    Args:
+        embedding (List[float]): The embedding vector to use for the query.
+        max_distance (float): The maximum distance from the query vector.
+        size (int): The number of videos to return.
+
+    Returns:
+        dict: The query body.
+    """
+    return {
+        "query": {
+            "nested": {
+                "path": "embeddings",
+                "query": {
+                    "knn": {
+                        "embeddings.embedding": {
+                            "vector": embedding,
+                            "max_distance": max_distance,
+                        }
+                    }
+                },
+            }
+        },
+        "size": size,
+        "_source": {"excludes": ["embeddings.embedding"]},
+    }
+
+
+def lexical_query(
+    text: str,
+    size: int = 6,
+    fields: Optional[List[str]] = None,
+) -> dict:
+    """Build a BM25 multi_match query on the Pegasus title, summary, and keywords.
+
+    Args:
+        text (str): The query text.
+        size (int): The number of videos to return.
+        fields (List[str], optional): The fields to match, with optional boosts. Defaults to LEXICAL_FIELDS.
+
+    Returns:
+        dict: The query body.
+    """
+    return {
+        "query": {
+            "multi_match": {
+                "query": text,
+                "fields": fields if fields is not None else LEXICAL_FIELDS,
+                "type": "best_fields",
+            }
+        },
+        "size": size,
+        "_source": {"excludes": ["embeddings"]},
+    }
+
+
+def duration_filter(gte: float, lte: float) -> dict:
+    """Build a k-NN filter on the video duration, in seconds."""
+    return {"bool": {"must": [{"range": {"durationSec": {"gte": gte, "lte": lte}}}]}}
+
+
+def embedding_option_filter(embedding_option: str) -> dict:
+    """Build a k-NN filter on the segment embedding option (visual-text, visual-image, or audio)."""
+    return {"term": {"embeddings.embeddingOption": embedding_option}}
@@ -0,0 +1,292 @@
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import copy
+
+import numpy as np
+
+from local_search import NESTED_PATH, VECTOR_FIELD, LocalVectorIndex
+
+# Video-level fields returned when the caller does not ask for specific ones
+DEFAULT_SOURCE_FIELDS = ["videoName", "title", "durationSec", "keyframeURL"]
+
+# Videos per follow-up vector read
+VECTOR_BATCH_SIZE = 100
+
+SegmentKey = Tuple[str, int]
+
+
+class SegmentHit:
+    """A matching segment (nested inner hit) of a video search hit.
+
+    Wraps the raw inner hit and reads its fields on access; no vector is held.
+    """
+
+    __slots__ = ("video", "_raw")
+
+    def __init__(self, video: "VideoHit", raw: dict) -> None:
+        self.video = video
+        self._raw = raw
+
+    @property
+    def offset(self) -> int:
+        return self._raw["_nested"]["offset"]
+
+    @property
+    def score(self) -> float:
+        return self._raw["_score"]
+
+    @property
+    def embeddingOption(self) -> str:
+        return self._field("embeddingOption")
+
+    @property
+    def startSec(self) -> float:
+        return self._field("startSec")
+
+    @property
+    def endSec(self) -> float:
+        return self._field("endSec")
+
+    @property
+    def key(self) -> SegmentKey:
+        """The (video ID, segment offset) pair identifying the segment's vector."""
+        return self.video.id, self.offset
+
+    def _field(self, name: str):
+        fields = self._raw.get("fields")
+        if fields is not None and f"{NESTED_PATH}.{name}" in fields:
+            return fields[f"{NESTED_PATH}.{name}"][0]
+        return self._raw["_source"][name]
+
+    def __repr__(self) -> str:
+        return (
+            f"SegmentHit(videoName={self.video.videoName!r}, offset={self.offset}, "
+            f"score={self.score:.4f}, startSec={self.startSec}, endSec={self.endSec})"
+        )
+
+
+class VideoHit:
+    """A video search hit.
+
+    Wraps the raw hit; the `_source` fields are read on access and the segment
+    hits are built the first time they are used.
+    """
+
+    __slots__ = ("_raw", "_segments")
+
+    def __init__(self, raw: dict) -> None:
+        self._raw = raw
+        self._segments: Optional[List[SegmentHit]] = None
+
+    @property
+    def id(self) -> str:
+        return self._raw["_id"]
+
+    @property
+    def score(self) -> float:
+        return self._raw["_score"]
+
+    @property
+    def source(self) -> dict:
+        """The returned `_source` fields; empty if the query excluded `_source`."""
+        return self._raw.get("_source", {})
+
+    @property
+    def videoName(self) -> str:
+        return self.source.get("videoName", self.id)
+
+    @property
+    def segments(self) -> List[SegmentHit]:
+        """The matching segments, best first; empty if the query did not request inner hits."""
+        if self._segments is None:
+            inner_hits = self._raw.get("inner_hits", {}).get(NESTED_PATH, {})
+            self._segments = [
+                SegmentHit(self, raw) for raw in inner_hits.get("hits", {}).get("hits", [])
+            ]
+        return self._segments
+
+    def __getitem__(self, field: str):
+        return self.source[field]
+
+    def get(self, field: str, default=None):
+        return self.source.get(field, default)
+
+    def __repr__(self) -> str:
+        return f"VideoHit(id={self.id!r}, score={self.score:.4f})"
+
+
+class SearchResults:
+    """A typed, lazily built view of an OpenSearch (or local index) search response."""
+
+    __slots__ = ("raw", "_hits")
+
+    def __init__(self, raw: dict) -> None:
+        """Wrap a search response.
+
+        Args:
+            raw (dict): The search response; an empty dict (e.g., after a failed query) has no hits.
+        """
+        self.raw = raw
+        self._hits: Optional[List[VideoHit]] = None
+
+    @property
+    def hits(self) -> List[VideoHit]:
+        if self._hits is None:
+            self._hits = [VideoHit(raw) for raw in self.raw.get("hits", {}).get("hits", [])]
+        return self._hits
+
+    @property
+    def total(self) -> int:
+        return self.raw.get("hits", {}).get("total", {}).get("value", 0)
+
+    def __len__(self) -> int:
+        return len(self.hits)
+
+    def __iter__(self) -> Iterator[VideoHit]:
+        return iter(self.hits)
+
+    def __getitem__(self, index: int) -> VideoHit:
+        return self.hits[index]
+
+    def segments(self) -> List[SegmentHit]:
+        """List the matching segments of every video, best score first."""
+        segments = [segment for hit in self.hits for segment in hit.segments]
+        segments.sort(key=lambda segment: -segment.score)
+        return segments
+
+
+def lean_query(body: dict, fields: Optional[Sequence[str]] = None) -> dict:
+    """Restrict a query body to the fields the caller needs, never returning segment vectors.
+
+    The `_source` is limited to the given video-level fields, and the segment
+    vectors are removed from the inner hits of every nested query in the tree;
+    fetch vectors on demand with `fetch_vectors` instead.
+
+    Args:
+        body (dict): The query body, e.g., from `search_queries.knn_query`; it is not modified.
+        fields (Sequence[str], optional): The video-level `_source` fields to return. Defaults to
+            DEFAULT_SOURCE_FIELDS; pass an empty list to return no `_source` at all.
+
+    Returns:
+        dict: The lean query body.
+    """
+    body = copy.copy(body)
+    fields = DEFAULT_SOURCE_FIELDS if fields is None else list(fields)
+    body["_source"] = {"includes": fields} if fields else False
+    if "query" in body:
+        body["query"] = _lean_inner_hits(body["query"])
+    return body
+
+
+def _lean_inner_hits(node):
+    """Copy a query clause, removing the segment vectors from every nested query's inner hits.
+
+    The nested query may sit anywhere in the tree, e.g., in a `bool` clause or
+    under a `function_score` or `hybrid` query, so every clause is walked.
+    """
+    if isinstance(node, list):
+        return [_lean_inner_hits(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+
+    lean = {key: _lean_inner_hits(value) for key, value in node.items()}
+    nested = lean.get("nested")
+    if isinstance(nested, dict) and "inner_hits" in nested:
+        inner_hits = dict(nested["inner_hits"])
+        inner_hits["_source"] = False
+        inner_hits["fields"] = [
+            field for field in inner_hits.get("fields", []) if field != VECTOR_FIELD
+        ]
+        lean["nested"] = {**nested, "inner_hits": inner_hits}
+    return lean
+
+
+def search(
+    client,
+    body: dict,
+    index: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> SearchResults:
+    """Run a lean query and wrap the response.
+
+    Args:
+        client: The OpenSearch client or a LocalVectorIndex.
+        body (dict): The query body.
+        index (str, optional): The index name.
+        fields (Sequence[str], optional): The video-level `_source` fields to return; see `lean_query`.
+
+    Returns:
+        SearchResults: The typed search results.
+    """
+    return SearchResults(client.search(body=lean_query(body, fields), index=index))
+
+
+def fetch_vectors(
+    client,
+    keys: Sequence[SegmentKey],
+    index: Optional[str] = None,
+    batch_size: int = VECTOR_BATCH_SIZE,
+) -> np.ndarray:
+    """Fetch segment vectors in batched follow-up reads, into one preallocated float32 matrix.
+
+    From OpenSearch, each batch is one `ids` query returning only the videos'
+    segment vectors; from a LocalVectorIndex, the rows are copied directly from
+    its vector matrix.
+
+    Args:
+        client: The OpenSearch client or a LocalVectorIndex.
+        keys (Sequence[SegmentKey]): The (video ID, segment offset) pairs, e.g., `SegmentHit.key`.
+        index (str, optional): The index name.
+        batch_size (int): The number of videos per request.
+
+    Returns:
+        np.ndarray: The (len(keys), dimensions) float32 matrix, in key order.
+
+    Raises:
+        KeyError: If a video is not in the index, or has no segment at the offset.
+    """
+    if isinstance(client, LocalVectorIndex):
+        rows = {video_id: row for row, video_id in enumerate(client.ids)}
+        missing = sorted({video_id for video_id, _ in keys if video_id not in rows})
+        if missing:
+            raise KeyError(f"Videos not found in the index: {missing}")
+        positions = []
+        for video_id, offset in keys:
+            lo, hi = client.offsets[rows[video_id]], client.offsets[rows[video_id] + 1]
+            if not 0 <= offset < hi - lo:
+                raise KeyError(f"Segment {offset} not found in video {video_id}")
+            positions.append(lo + offset)
+        return client.vectors[np.asarray(positions, dtype=np.int64)]
+
+    # Group the wanted offsets by video, so each video is read once
+    wanted: Dict[str, List[Tuple[int, int]]] = {}
+    for position, (video_id, offset) in enumerate(keys):
+        wanted.setdefault(video_id, []).append((position, offset))
+
+    vectors: Optional[np.ndarray] = None
+    video_ids = list(wanted)
+    for start in range(0, len(video_ids), batch_size):
+        batch = video_ids[start : start + batch_size]
+        response = client.search(
+            body={
+                "query": {"ids": {"values": batch}},
+                "size": len(batch),
+                "_source": {"includes": [VECTOR_FIELD]},
+            },
+            index=index,
+            filter_path=["hits.hits._id", f"hits.hits._source.{VECTOR_FIELD}"],
+        )
+        for hit in response.get("hits", {}).get("hits", []):
+            segments = hit.get("_source", {}).get(NESTED_PATH, [])
+            for position, offset in wanted.pop(hit["_id"]):
+                if offset >= len(segments):
+                    raise KeyError(f"Segment {offset} not found in video {hit['_id']}")
+                embedding = segments[offset]["embedding"]
+                if vectors is None:
+                    vectors = np.empty((len(keys), len(embedding)), dtype=np.float32)
+                vectors[position] = embedding
+
+    if wanted:
+        raise KeyError(f"Videos not found in the index: {sorted(wanted)}")
+    if vectors is None:
+        return np.empty((0, 0), dtype=np.float32)
+    return vectors
@@ -0,0 +1,426 @@
+# Summary: This script serves the notebook's nested k-NN video searches over HTTP from a long-running asyncio
+#          process. The OpenSearch and Bedrock clients are created once and kept warm, identical concurrent
+#          queries share one in-flight embedding and search, and the latency of each step is recorded in
+#          histograms. The search backend can be OpenSearch or the local in-process vector engine, and the
+#          query encoder can be Bedrock or a deterministic stub, so load tests do not need AWS.
+# Author: Gary A. Stafford
+# Date: 2025-07-23
+# License: MIT License
+
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import boto3
+import numpy as np
+from dotenv import load_dotenv
+
+from local_search import LocalVectorIndex
+from query_cache import QueryEmbeddingCache
+from query_encoder import QueryEncoder
+from search_queries import embedding_option_filter, knn_query
+from utilities import Utilities
+
+load_dotenv()  # Loads variables from .env file
+
+AWS_REGION = os.getenv("AWS_REGION_MARENGO")
+S3_VIDEO_STORAGE_BUCKET_MARENGO = os.getenv("S3_VIDEO_STORAGE_BUCKET_MARENGO")
+OPENSEARCH_ENDPOINT = os.getenv("OPENSEARCH_ENDPOINT")
+INDEX_NAME = "tv-commercials-index"
+
+LOCAL_EMBEDDINGS_DIRECTORY = "bedrock_marengo_embeddings"
+LOCAL_ANALYSIS_DIRECTORY = "bedrock_pegasus_analyses"
+
+HOST = os.getenv("SEARCH_SERVICE_HOST", "127.0.0.1")
+PORT = int(os.getenv("SEARCH_SERVICE_PORT", "8080"))
+# Search backend: opensearch or local (the in-process engine over the local embedding files)
+BACKEND = os.getenv("SEARCH_SERVICE_BACKEND", "opensearch")
+# Query encoder: bedrock, or stub (a deterministic vector per text, with an optional simulated latency)
+ENCODER = os.getenv("SEARCH_SERVICE_ENCODER", "bedrock")
+STUB_LATENCY_MS = float(os.getenv("SEARCH_SERVICE_STUB_LATENCY_MS", "0"))
+MAX_WORKERS = int(os.getenv("SEARCH_SERVICE_MAX_WORKERS", "16"))
+
+MAX_K = 100
+MAX_BODY_BYTES = 1024 * 1024
+
+# Histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed buckets, in the Prometheus style."""
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, milliseconds: float) -> None:
+        """Record one latency, in milliseconds."""
+        self.counts[bisect.bisect_left(self.buckets_ms, milliseconds)] += 1
+        self.count += 1
+        self.sum_ms += milliseconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Estimate a percentile as the upper bound of the bucket it falls in (None if empty or in +Inf)."""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets_ms, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum_ms / self.count, 2) if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": dict(
+                zip([*map(str, self.buckets_ms), "+Inf"], self.counts)
+            ),
+        }
+
+    def to_prometheus(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip([*self.buckets_ms, "+Inf"], self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum_ms:.3f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RequestCoalescer:
+    """Share one in-flight computation among identical concurrent requests.
+
+    The first request for a key starts the computation; requests for the same
+    key that arrive before it finishes await the same future instead of
+    starting their own. The key is forgotten as soon as the result is ready,
+    so later requests see fresh results.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Run the computation for a key, or join the one already in flight.
+        Args:
+            key (Hashable): Identifies identical requests.
+            compute (Callable[[], Awaitable[Any]]): Starts the computation.
+        Returns:
+            Any: The computation's result.
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # Shield the shared future, so one cancelled caller does not cancel the others
+            return await asyncio.shield(future)
+
+        self.started += 1
+        future = asyncio.ensure_future(compute())
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+
+class StubEncoder:
+    """Deterministic stand-in for the Marengo text encoder, for load tests without Bedrock."""
+
+    def __init__(self, dimension: int = 1024, latency_ms: float = 0.0) -> None:
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+
+    def encode(self, text: str) -> List[float]:
+        """Return a unit vector seeded by the normalized text, after the simulated latency."""
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        seed = int.from_bytes(
+            hashlib.sha256(" ".join(text.casefold().split()).encode()).digest()[:8], "big"
+        )
+        vector = np.random.default_rng(seed).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+class SearchService:
+    """Nested k-NN video search over warm, shared clients.
+
+    Blocking client calls (the query embedding and the search) run in a thread
+    pool. Identical concurrent queries are coalesced twice: once per query text
+    for the embedding, and once per text and search parameters for the search.
+    """
+
+    def __init__(
+        self,
+        os_client,
+        os_index: str,
+        encode: Callable[[str], List[float]],
+        max_workers: int = MAX_WORKERS,
+    ) -> None:
+        """Initialize the service.
+        Args:
+            os_client: The OpenSearch client, a `LocalVectorIndex`, or any stub with `search`.
+            os_index (str): The name of the OpenSearch index.
+            encode (Callable[[str], List[float]]): Embeds query text, e.g., `QueryEncoder.encode`.
+            max_workers (int): The number of threads for blocking client calls.
+        """
+        self.os_client = os_client
+        self.os_index = os_index
+        self.encode = encode
+        self.embeddings = RequestCoalescer()
+        self.searches = RequestCoalescer()
+        self.histograms: Dict[str, LatencyHistogram] = {
+            step: LatencyHistogram() for step in ("embed", "search", "request")
+        }
+        self.requests = 0
+        self.errors = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def search(
+        self,
+        text: Optional[str] = None,
+        embedding: Optional[List[float]] = None,
+        k: int = 6,
+        inner_hits: bool = False,
+        embedding_option: Optional[str] = None,
+    ) -> dict:
+        """Search by query text or by an embedding.
+        Args:
+            text (str, optional): The query text; embedded with the encoder.
+            embedding (List[float], optional): A query embedding, used instead of text.
+            k (int): The number of videos to return.
+            inner_hits (bool): Include the matching segments of each video.
+            embedding_option (str, optional): Only match segments of this embedding option.
+        Returns:
+            dict: The OpenSearch search response.
+        """
+        if (text is None) == (embedding is None):
+            raise ValueError("Provide exactly one of text or embedding")
+        if not 1 <= k <= MAX_K:
+            raise ValueError(f"k must be between 1 and {MAX_K}")
+
+        if embedding is None:
+            text = " ".join(text.split())
+            embedding = await self.embeddings.run(
+                text, lambda: self._timed("embed", self.encode, text)
+            )
+            search_key = (text, k, inner_hits, embedding_option)
+        else:
+            search_key = (tuple(embedding), k, inner_hits, embedding_option)
+
+        body = knn_query(
+            embedding,
+            k=k,
+            inner_hits=inner_hits,
+            filter=embedding_option_filter(embedding_option) if embedding_option else None,
+        )
+        return await self.searches.run(
+            search_key,
+            lambda: self._timed(
+                "search", lambda: self.os_client.search(body=body, index=self.os_index)
+            ),
+        )
+
+    def stats(self) -> dict:
+        """Return the request counters, the coalescing counters, and the latency histograms."""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "embeddings": {
+                "started": self.embeddings.started,
+                "coalesced": self.embeddings.coalesced,
+            },
+            "searches": {
+                "started": self.searches.started,
+                "coalesced": self.searches.coalesced,
+            },
+            "latency": {step: h.to_dict() for step, h in self.histograms.items()},
+        }
+
+    def prometheus(self) -> str:
+        """Render the counters and latency histograms in the Prometheus text format."""
+        lines = [
+            "# TYPE search_service_requests_total counter",
+            f"search_service_requests_total {self.requests}",
+            "# TYPE search_service_errors_total counter",
+            f"search_service_errors_total {self.errors}",
+            "# TYPE search_service_coalesced_total counter",
+            f'search_service_coalesced_total{{step="embed"}} {self.embeddings.coalesced}',
+            f'search_service_coalesced_total{{step="search"}} {self.searches.coalesced}',
+            "# TYPE search_service_latency_ms histogram",
+        ]
+        for step, histogram in self.histograms.items():
+            lines.extend(histogram.to_prometheus("search_service_latency_ms", f'step="{step}"'))
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        """Shut down the worker threads."""
+        self._executor.shutdown()
+
+    async def _timed(self, step: str, function: Callable, *args) -> Any:
+        """Run a blocking call in the thread pool and record its latency."""
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, function, *args
+            )
+        finally:
+            self.histograms[step].observe((time.perf_counter() - start) * 1000)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve HTTP/1.1 requests on one connection, keeping it alive between requests."""
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, content_type, payload = await self._route(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status}\r\n"
+                        f"Content-Type: {content_type}\r\n"
+                        f"Content-Length: {len(payload)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                    ).encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass  # The client went away or sent a malformed request
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, target: str, body: bytes) -> Tuple[str, str, bytes]:
+        """Dispatch a request to its endpoint."""
+        url = urlsplit(target)
+        if url.path == "/health":
+            return "200 OK", "application/json", b'{"status": "ok"}'
+        if url.path == "/stats":
+            return "200 OK", "application/json", json.dumps(self.stats()).encode()
+        if url.path == "/metrics":
+            return "200 OK", "text/plain; version=0.0.4", self.prometheus().encode()
+        if url.path != "/search":
+            return "404 Not Found", "application/json", b'{"error": "not found"}'
+
+        self.requests += 1
+        start = time.perf_counter()
+        try:
+            if method == "GET":
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                params = {
+                    "text": query.get("q"),
+                    "k": int(query.get("k", 6)),
+                    "inner_hits": query.get("inner_hits", "false").lower() == "true",
+                    "embedding_option": query.get("embedding_option"),
+                }
+            elif method == "POST":
+                params = json.loads(body or b"{}")
+            else:
+                return "405 Method Not Allowed", "application/json", b'{"error": "method not allowed"}'
+            response = await self.search(**params)
+            return "200 OK", "application/json", json.dumps(response).encode()
+        except (ValueError, TypeError) as e:
+            self.errors += 1
+            return "400 Bad Request", "application/json", json.dumps({"error": str(e)}).encode()
+        except Exception as e:
+            self.errors += 1
+            print(f"Error searching: {e}")
+            return "502 Bad Gateway", "application/json", json.dumps({"error": str(e)}).encode()
+        finally:
+            self.histograms["request"].observe((time.perf_counter() - start) * 1000)
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Read one HTTP request, or return None when the client closes the connection."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise ConnectionError("Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+def create_service() -> SearchService:
+    """Create the clients for the configured backend and encoder, once, and wrap them in a service."""
+    if BACKEND == "local":
+        os_client = LocalVectorIndex.from_embeddings(
+            LOCAL_EMBEDDINGS_DIRECTORY, LOCAL_ANALYSIS_DIRECTORY
+        )
+        dimension = os_client.vectors.shape[1]
+        print(f"Local index: {len(os_client)} videos, {len(os_client.vectors)} segments")
+    elif BACKEND == "opensearch":
+        os_client = Utilities.create_opensearch_client(OPENSEARCH_ENDPOINT, AWS_REGION)
+        dimension = 1024
+    else:
+        raise ValueError(f"Unsupported search backend: {BACKEND}")
+
+    if ENCODER == "stub":
+        encode = StubEncoder(dimension, latency_ms=STUB_LATENCY_MS).encode
+    elif ENCODER == "bedrock":
+        encode = QueryEncoder(
+            boto3.client("bedrock-runtime", region_name=AWS_REGION),
+            boto3.client("s3", region_name=AWS_REGION),
+            bucket=S3_VIDEO_STORAGE_BUCKET_MARENGO,
+            cache=QueryEmbeddingCache(),
+        ).encode
+    else:
+        raise ValueError(f"Unsupported query encoder: {ENCODER}")
+
+    return SearchService(os_client, INDEX_NAME, encode)
+
+
+async def serve(service: SearchService, host: str = HOST, port: int = PORT) -> None:
+    """Serve the search service until cancelled."""
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Search service listening on http://{host}:{port} (backend: {BACKEND}, encoder: {ENCODER})")
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    service = create_service()
+    try:
+        asyncio.run(serve(service))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        print(json.dumps(service.stats()["latency"]["request"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+import heapq
+
+from data import VideoClip
+
+# Weight of each embedding option's score in a clip's fused score
+DEFAULT_MODALITY_WEIGHTS = {"visual-text": 1.0, "visual-image": 1.0, "audio": 1.0}
+
+
+def iter_segments(results: dict) -> Iterator[dict]:
+    """Flatten the inner hits of a nested k-NN search response into segments, without their vectors.
+
+    Args:
+        results (dict): The search response, with inner hits returned as `fields` or `_source`.
+
+    Yields:
+        dict: Each segment's videoName, title, offset, score, embeddingOption, startSec, and endSec.
+    """
+    for hit in results["hits"]["hits"]:
+        source = hit.get("_source", {})
+        video_name = source.get("videoName", hit["_id"])
+        inner_hits = hit.get("inner_hits", {}).get("embeddings", {}).get("hits", {})
+        for segment in inner_hits.get("hits", []):
+            fields = segment.get("fields", {})
+            segment_source = segment.get("_source", {})
+
+            def value(name: str):
+                if f"embeddings.{name}" in fields:
+                    return fields[f"embeddings.{name}"][0]
+                return segment_source[name]
+
+            yield {
+                "videoName": video_name,
+                "title": source.get("title"),
+                "offset": segment["_nested"]["offset"],
+                "score": segment["_score"],
+                "embeddingOption": value("embeddingOption"),
+                "startSec": float(value("startSec")),
+                "endSec": float(value("endSec")),
+            }
+
+
+def merge_segments(
+    segments: Iterable[dict],
+    modality_weights: Optional[Dict[str, float]] = None,
+    gap_sec: float = 0.5,
+    max_clip_sec: float = 30.0,
+    min_score: Optional[float] = None,
+) -> Iterator[VideoClip]:
+    """Merge overlapping or adjacent segments of each video into clips with fused modality scores.
+
+    Segments of any embedding option that overlap or are at most `gap_sec` apart
+    join the same clip, up to `max_clip_sec` long. Each clip keeps the best score
+    per embedding option, and its score is the weighted mean of those scores over
+    all weighted options, so a moment matched by several modalities outranks one
+    matched by a single modality.
+
+    Args:
+        segments (Iterable[dict]): Segments as yielded by `iter_segments`.
+        modality_weights (Dict[str, float], optional): The weight of each embedding option.
+            Defaults to DEFAULT_MODALITY_WEIGHTS; options without a weight are ignored.
+        gap_sec (float): The largest gap between segments of the same clip, in seconds.
+        max_clip_sec (float): The longest clip, in seconds.
+        min_score (float, optional): Segments scoring below this are dropped before merging.
+
+    Yields:
+        VideoClip: Each merged clip, in video and time order.
+    """
+    weights = modality_weights if modality_weights is not None else DEFAULT_MODALITY_WEIGHTS
+    total_weight = sum(weights.values())
+    if total_weight <= 0:
+        raise ValueError("At least one modality weight must be positive")
+
+    videos: Dict[str, List[dict]] = {}
+    for segment in segments:
+        if segment["embeddingOption"] not in weights:
+            continue
+        if min_score is not None and segment["score"] < min_score:
+            continue
+        videos.setdefault(segment["videoName"], []).append(segment)
+
+    def to_clip(clip_segments: List[dict]) -> VideoClip:
+        modality_scores: Dict[str, float] = {}
+        for segment in clip_segments:
+            option = segment["embeddingOption"]
+            modality_scores[option] = max(modality_scores.get(option, 0.0), segment["score"])
+        score = sum(weights[option] * s for option, s in modality_scores.items()) / total_weight
+        return VideoClip(
+            videoName=clip_segments[0]["videoName"],
+            title=clip_segments[0]["title"],
+            startSec=round(min(segment["startSec"] for segment in clip_segments), 2),
+            endSec=round(max(segment["endSec"] for segment in clip_segments), 2),
+            score=score,
+            modalityScores=modality_scores,
+            offsets=sorted(segment["offset"] for segment in clip_segments),
+        )
+
+    for video_segments in videos.values():
+        video_segments.sort(key=lambda segment: (segment["startSec"], segment["endSec"]))
+        clip = [video_segments[0]]
+        clip_start, clip_end = video_segments[0]["startSec"], video_segments[0]["endSec"]
+        for segment in video_segments[1:]:
+            joins = segment["startSec"] <= clip_end + gap_sec
+            if joins and max(clip_end, segment["endSec"]) - clip_start <= max_clip_sec:
+                clip.append(segment)
+                clip_end = max(clip_end, segment["endSec"])
+                continue
+            yield to_clip(clip)
+            clip = [segment]
+            clip_start, clip_end = segment["startSec"], segment["endSec"]
+        yield to_clip(clip)
+
+
+def top_clips(
+    results: dict,
+    n: int = 10,
+    modality_weights: Optional[Dict[str, float]] = None,
+    gap_sec: float = 0.5,
+    max_clip_sec: float = 30.0,
+    min_score: Optional[float] = None,
+) -> List[VideoClip]:
+    """Return the n best clips from a nested k-NN search response with inner hits.
+
+    Args:
+        results (dict): The search response.
+        n (int): The number of clips to return.
+        modality_weights (Dict[str, float], optional): The weight of each embedding option.
+        gap_sec (float): The largest gap between segments of the same clip, in seconds.
+        max_clip_sec (float): The longest clip, in seconds.
+        min_score (float, optional): Segments scoring below this are dropped before merging.
+
+    Returns:
+        List[VideoClip]: The best clips, best first.
+    """
+    clips = merge_segments(
+        iter_segments(results), modality_weights, gap_sec, max_clip_sec, min_score
+    )
+    # A heap keeps only the n best clips instead of sorting all of them
+    return heapq.nlargest(n, clips, key=lambda clip: clip.score)
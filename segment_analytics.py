@@ -0,0 +1,386 @@
+from typing import Callable, Iterator, List, Optional
+import hashlib
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+from scipy.sparse import csr_matrix
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from sklearn.manifold import TSNE
+from sklearn.neighbors import NearestNeighbors
+
+from embedding_store import get_embeddings_source_files, iter_video_embeddings
+
+CACHE_DIRECTORY = "analytics_cache"
+
+
+class SegmentCorpus:
+    """Every segment vector in the local embedding store, streamed in fixed-size batches.
+
+    Only the per-segment metadata is held in memory, as compact arrays; the
+    vectors are read one video at a time (memory-mapped for .npy files) each
+    time the batches are iterated, so the corpus can be much larger than memory.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        embedding_option: Optional[str] = None,
+        batch_size: int = 8192,
+    ) -> None:
+        """Scan the segment metadata of every video.
+
+        Args:
+            directory (str): The local embeddings directory.
+            embedding_option (str, optional): Only include segments of this embedding option
+                (visual-text, visual-image, or audio). Defaults to all segments.
+            batch_size (int): The number of vectors in each batch.
+        """
+        self.directory = directory
+        self.embedding_option = embedding_option
+        self.batch_size = batch_size
+
+        self.video_names: List[str] = []
+        self.option_names: List[str] = []
+        self.dimensions = 0
+        video_index, option_index, start_sec, end_sec, offsets = [], [], [], [], []
+        for video_embeddings in iter_video_embeddings(directory):
+            rows = self._rows(video_embeddings)
+            if not len(rows):
+                continue
+            self.video_names.append(video_embeddings.videoName)
+            if not self.dimensions:
+                self.dimensions = video_embeddings.vectors.shape[1]
+            for row in rows:
+                segment = video_embeddings.embeddings[row]
+                if segment.embeddingOption not in self.option_names:
+                    self.option_names.append(segment.embeddingOption)
+                video_index.append(len(self.video_names) - 1)
+                option_index.append(self.option_names.index(segment.embeddingOption))
+                start_sec.append(segment.startSec)
+                end_sec.append(segment.endSec)
+            offsets.extend(rows)
+
+        self.video_index = np.asarray(video_index, dtype=np.int32)
+        self.option_index = np.asarray(option_index, dtype=np.int8)
+        self.start_sec = np.asarray(start_sec, dtype=np.float32)
+        self.end_sec = np.asarray(end_sec, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.video_index)
+
+    def iter_batches(self) -> Iterator[np.ndarray]:
+        """Stream the segment vectors in corpus order.
+
+        Yields:
+            np.ndarray: (batch_size, dimensions) float32 batches; the last one may be smaller.
+        """
+        buffered: List[np.ndarray] = []
+        buffered_rows = 0
+        for video_embeddings in iter_video_embeddings(self.directory):
+            rows = self._rows(video_embeddings)
+            if not len(rows):
+                continue
+            buffered.append(np.asarray(video_embeddings.vectors[rows], dtype=np.float32))
+            buffered_rows += len(rows)
+            while buffered_rows >= self.batch_size:
+                vectors = np.concatenate(buffered)
+                yield vectors[: self.batch_size]
+                buffered = [vectors[self.batch_size :]]
+                buffered_rows -= self.batch_size
+        if buffered_rows:
+            yield np.concatenate(buffered)
+
+    def fingerprint(self) -> str:
+        """Hash the embedding files' names, sizes, and modification times, and the embedding option.
+
+        Returns:
+            str: A key that changes whenever the corpus changes, for caching projections.
+        """
+        digest = hashlib.sha256(str(self.embedding_option).encode())
+        for video_name in self.video_names:
+            for file_path in get_embeddings_source_files(self.directory, video_name):
+                stat = os.stat(file_path)
+                digest.update(f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+
+    def _rows(self, video_embeddings) -> np.ndarray:
+        """Return the rows of a video's segments to include."""
+        options = [segment.embeddingOption for segment in video_embeddings.embeddings]
+        return np.asarray(
+            [
+                row
+                for row, option in enumerate(options)
+                if self.embedding_option in (None, option)
+            ],
+            dtype=np.int64,
+        )
+
+
+def reduce_dimensions(
+    corpus: SegmentCorpus,
+    n_components: int = 50,
+    cache_directory: Optional[str] = CACHE_DIRECTORY,
+) -> np.ndarray:
+    """Project every segment vector onto its principal components with incremental PCA.
+
+    The PCA is fitted one batch at a time, and the projections are written into a
+    preallocated array, so only one batch of full-size vectors is in memory. The
+    components are ordered by explained variance, so the first two columns are the
+    2D PCA projection.
+
+    Args:
+        corpus (SegmentCorpus): The segment corpus.
+        n_components (int): The number of principal components.
+        cache_directory (str, optional): Where to cache the projection; None disables caching.
+
+    Returns:
+        np.ndarray: The (segments, n_components) float32 projection; fewer components
+            when the corpus has fewer segments or dimensions than `n_components`.
+
+    Raises:
+        ValueError: If the corpus has no segments.
+    """
+    if not len(corpus):
+        raise ValueError("The segment corpus is empty")
+    n_components = min(n_components, len(corpus), corpus.dimensions)
+
+    def compute() -> np.ndarray:
+        pca = IncrementalPCA(n_components=n_components)
+        # Each partial fit needs at least n_components rows, so a batch is fitted only once the
+        # next one is known to be large enough; shorter batches are carried into the next fit
+        pending = None
+        for batch in corpus.iter_batches():
+            if pending is None:
+                pending = batch
+            elif len(pending) >= n_components and len(batch) >= n_components:
+                pca.partial_fit(pending)
+                pending = batch
+            else:
+                pending = np.concatenate([pending, batch])
+        pca.partial_fit(pending)
+
+        projected = np.empty((len(corpus), n_components), dtype=np.float32)
+        row = 0
+        for batch in corpus.iter_batches():
+            projected[row : row + len(batch)] = pca.transform(batch)
+            row += len(batch)
+        print(
+            f"Explained variance of {n_components} components: {pca.explained_variance_ratio_.sum():.2%}"
+        )
+        return projected
+
+    return _cached(corpus, f"pca-{n_components}", compute, cache_directory)
+
+
+def neighbor_graph(points: np.ndarray, n_neighbors: int = 15) -> csr_matrix:
+    """Build a sparse k-nearest-neighbor distance graph of the points.
+
+    Run on the PCA projection rather than the full vectors, the neighbors are
+    approximate, but the search is far cheaper and the graph is linear in size.
+
+    Args:
+        points (np.ndarray): The (segments, dimensions) points, e.g., from `reduce_dimensions`.
+        n_neighbors (int): The number of neighbors of each point.
+
+    Returns:
+        csr_matrix: The (segments, segments) graph of Euclidean distances to each point's neighbors.
+    """
+    n_neighbors = min(n_neighbors, len(points) - 1)
+    return (
+        NearestNeighbors(n_neighbors=n_neighbors)
+        .fit(points)
+        .kneighbors_graph(mode="distance")
+    )
+
+
+def tsne_layout(
+    corpus: SegmentCorpus,
+    points: np.ndarray,
+    perplexity: float = 30.0,
+    random_state: int = 42,
+    cache_directory: Optional[str] = CACHE_DIRECTORY,
+) -> np.ndarray:
+    """Lay the segments out in 2D with t-SNE over a sparse neighbor graph.
+
+    Instead of all pairwise distances, t-SNE uses the `3 * perplexity` nearest
+    neighbors of each point, and starts from the first two PCA components, which
+    keeps the global layout stable between runs.
+
+    Args:
+        corpus (SegmentCorpus): The segment corpus, for the cache key.
+        points (np.ndarray): The PCA projection from `reduce_dimensions`.
+        perplexity (float): The t-SNE perplexity.
+        random_state (int): The random seed.
+        cache_directory (str, optional): Where to cache the layout; None disables caching.
+
+    Returns:
+        np.ndarray: The (segments, 2) float32 layout.
+    """
+    perplexity = min(perplexity, (len(points) - 2) / 3)
+
+    def compute() -> np.ndarray:
+        # scikit-learn expects one more neighbor than the 3 * perplexity + 1 it uses
+        graph = neighbor_graph(points, n_neighbors=int(3 * perplexity + 1) + 1)
+        init = points[:, :2] / np.std(points[:, 0]) * 1e-4
+        tsne = TSNE(
+            n_components=2,
+            perplexity=perplexity,
+            metric="precomputed",
+            init=init,
+            random_state=random_state,
+        )
+        return tsne.fit_transform(graph).astype(np.float32)
+
+    return _cached(
+        corpus,
+        f"tsne-{points.shape[1]}-{perplexity:g}-{random_state}",
+        compute,
+        cache_directory,
+    )
+
+
+def cluster_points(
+    points: np.ndarray, n_clusters: int, random_state: int = 0, batch_size: int = 4096
+) -> np.ndarray:
+    """Cluster the points with mini-batch k-means.
+
+    Args:
+        points (np.ndarray): The (segments, dimensions) points.
+        n_clusters (int): The number of clusters.
+        random_state (int): The random seed.
+        batch_size (int): The number of points in each mini-batch.
+
+    Returns:
+        np.ndarray: The cluster label of each point.
+    """
+    kmeans = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        random_state=random_state,
+        batch_size=batch_size,
+        n_init="auto",
+    )
+    return kmeans.fit_predict(points)
+
+
+def scatter_plot(
+    corpus: SegmentCorpus,
+    points: np.ndarray,
+    title: str,
+    axis_title: str,
+    labels: Optional[np.ndarray] = None,
+    width: int = 900,
+    height: int = 600,
+) -> go.Figure:
+    """Plot 2D segment points as a single WebGL scatter trace, colored by video.
+
+    All points share one `Scattergl` trace, with the hover text built from
+    per-point custom data, so the plot scales to millions of segments.
+
+    Args:
+        corpus (SegmentCorpus): The segment corpus, for the hover text.
+        points (np.ndarray): The (segments, 2) points.
+        title (str): The plot title.
+        axis_title (str): The axis title prefix, e.g., "PCA Dimension".
+        labels (np.ndarray, optional): Cluster labels; each cluster is outlined by a circle.
+        width (int): The plot width.
+        height (int): The plot height.
+
+    Returns:
+        go.Figure: The figure.
+    """
+    video_names = np.asarray(corpus.video_names, dtype=object)
+    option_names = np.asarray(corpus.option_names, dtype=object)
+    customdata = np.column_stack(
+        [
+            video_names[corpus.video_index],
+            option_names[corpus.option_index],
+            corpus.start_sec.round(2),
+            corpus.end_sec.round(2),
+            corpus.offsets,
+        ]
+    )
+
+    fig = go.Figure(
+        go.Scattergl(
+            x=points[:, 0],
+            y=points[:, 1],
+            mode="markers",
+            marker=dict(
+                color=corpus.video_index,
+                colorscale="Turbo",
+                size=5,
+                opacity=0.75,
+            ),
+            customdata=customdata,
+            hovertemplate=(
+                "<b>%{customdata[0]}</b><br>embedding_option=%{customdata[1]}<br>"
+                "startSec=%{customdata[2]}<br>endSec=%{customdata[3]}<br>"
+                "offset=%{customdata[4]}<extra></extra>"
+            ),
+        )
+    )
+    fig.update_layout(
+        title=dict(text=title, font=dict(size=16, family="Arial, sans-serif")),
+        xaxis_title=f"{axis_title} 1",
+        yaxis_title=f"{axis_title} 2",
+        width=width,
+        height=height,
+        showlegend=False,
+    )
+    fig.layout.xaxis.scaleanchor = "y"
+    fig.layout.xaxis.scaleratio = 1
+
+    if labels is not None:
+        _add_cluster_circles(fig, points, labels)
+    return fig
+
+
+def _add_cluster_circles(fig: go.Figure, points: np.ndarray, labels: np.ndarray) -> None:
+    """Outline each cluster with a circle around its center, enclosing all its points."""
+    n_clusters = labels.max() + 1
+    counts = np.bincount(labels, minlength=n_clusters)
+    centers = np.column_stack(
+        [np.bincount(labels, weights=points[:, axis], minlength=n_clusters) for axis in (0, 1)]
+    ) / np.maximum(counts, 1)[:, None]
+    distances = np.linalg.norm(points - centers[labels], axis=1)
+    radii = np.zeros(n_clusters)
+    np.maximum.at(radii, labels, distances)
+
+    for center, radius in zip(centers[counts > 0], radii[counts > 0]):
+        # Plotly circles are defined by their bounding box
+        fig.add_shape(
+            type="circle",
+            xref="x",
+            yref="y",
+            x0=center[0] - radius,
+            y0=center[1] - radius,
+            x1=center[0] + radius,
+            y1=center[1] + radius,
+            opacity=0.3,
+            line=dict(color="black", width=1, dash="dot"),
+            fillcolor="rgba(0,0,0,0)",
+        )
+
+
+def _cached(
+    corpus: SegmentCorpus,
+    name: str,
+    compute: Callable[[], np.ndarray],
+    cache_directory: Optional[str],
+) -> np.ndarray:
+    """Load an array cached for the corpus, or compute and cache it."""
+    if cache_directory is None:
+        return compute()
+
+    file_path = os.path.join(cache_directory, f"{name}-{corpus.fingerprint()[:16]}.npy")
+    if os.path.exists(file_path):
+        print(f"Loaded cached {name} projection: {file_path}")
+        return np.load(file_path)
+
+    array = compute()
+    os.makedirs(cache_directory, exist_ok=True)
+    np.save(file_path, array)
+    return array
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules live at the repository root, next to the notebook
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import VideoEmbeddings, VideoEmbeddingSegment
+from local_search import LocalVectorIndex
+
+EMBEDDING_OPTIONS = ("visual-text", "visual-image", "audio")
+
+
+@pytest.fixture
+def make_local_index():
+    """Build a LocalVectorIndex of random vectors, cycling the embedding options per segment."""
+
+    def make(segments_per_video=(3, 5, 2, 4), dimensions: int = 8, seed: int = 0, sources=None):
+        rng = np.random.default_rng(seed)
+        return LocalVectorIndex.from_videos(
+            (
+                (sources[v] if sources else {"videoName": f"video{v}.mp4"}),
+                rng.standard_normal((segments, dimensions)).astype(np.float32),
+                [
+                    {
+                        "embeddingOption": EMBEDDING_OPTIONS[s % len(EMBEDDING_OPTIONS)],
+                        "startSec": 6.0 * s,
+                        "endSec": 6.0 * (s + 1),
+                    }
+                    for s in range(segments)
+                ],
+            )
+            for v, segments in enumerate(segments_per_video)
+        )
+
+    return make
+
+
+@pytest.fixture
+def make_video_embeddings():
+    """Build a VideoEmbeddings of random segment vectors, alternating audio and visual-text segments."""
+    def make(name: str = "video.mp4", segments: int = 4, dimensions: int = 8, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        return VideoEmbeddings(
+            videoName=name,
+            s3URI=f"s3://bucket/commercials/{name}",
+            keyframeURL=f"https://example.com/keyframes/{name[:-4]}.jpg",
+            dateCreated="2025-07-23",
+            sizeBytes=1000,
+            durationSec=6.0 * segments,
+            contentType="video/mp4",
+            embeddings=[
+                VideoEmbeddingSegment(
+                    embedding=rng.normal(size=dimensions).tolist(),
+                    embeddingOption="visual-text" if index % 2 else "audio",
+                    startSec=6.0 * index,
+                    endSec=6.0 * (index + 1),
+                )
+                for index in range(segments)
+            ],
+        )
+
+    return make
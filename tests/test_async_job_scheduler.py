@@ -0,0 +1,163 @@
+import pytest
+
+from async_job_scheduler import AsyncJobScheduler
+from instrumentation import METRICS
+
+
+class FakeBedrock:
+    """Stands in for `get_async_invoke`: each invocation stays InProgress for `polls` polls, then ends."""
+
+    def __init__(self, polls: int = 1, final_status=None, poll_errors=None) -> None:
+        self.polls = polls
+        self.final_status = final_status or {}
+        self.poll_errors = dict(poll_errors or {})
+        self.seen = {}
+
+    def get_async_invoke(self, invocationArn):
+        if self.poll_errors.get(invocationArn, 0) > 0:
+            self.poll_errors[invocationArn] -= 1
+            raise ConnectionError("connection reset")
+        self.seen[invocationArn] = self.seen.get(invocationArn, 0) + 1
+        if self.seen[invocationArn] < self.polls:
+            return {"invocationArn": invocationArn, "status": "InProgress"}
+        status = self.final_status.get(invocationArn, "Completed")
+        response = {"invocationArn": invocationArn, "status": status}
+        if status != "Completed":
+            response["failureMessage"] = "model error"
+        return response
+
+
+def scheduler(client: FakeBedrock, **kwargs) -> AsyncJobScheduler:
+    return AsyncJobScheduler(
+        client, max_submits_per_second=1e9, sleep=lambda seconds: None, **kwargs
+    )
+
+
+def test_submit_and_completion_errors_fail_only_their_job():
+    completed, failed = [], []
+
+    def submit(job):
+        if job == 1:
+            raise RuntimeError("bad input")
+        return f"arn/{job}"
+
+    def on_complete(job, response):
+        if job == 2:
+            raise OSError("output unreadable")
+        completed.append(job)
+
+    statuses = scheduler(FakeBedrock(), max_in_flight=2).run(
+        range(5),
+        submit,
+        on_complete,
+        lambda job, response: failed.append((job, response["failureMessage"])),
+    )
+
+    assert sorted(completed) == [0, 3, 4]
+    assert sorted(failed) == [(1, "bad input"), (2, "output unreadable")]
+    assert statuses["unsubmitted:1"] == "Failed"
+    assert statuses["arn/2"] == "Failed"
+    assert statuses["arn/0"] == "Completed"
+
+
+def test_failed_invocations_reach_on_failure():
+    failed = []
+
+    statuses = scheduler(FakeBedrock(final_status={"arn/1": "Failed"}), max_in_flight=3).run(
+        range(3),
+        lambda job: f"arn/{job}",
+        lambda job, response: None,
+        lambda job, response: failed.append(job),
+    )
+
+    assert failed == [1]
+    assert statuses == {"arn/0": "Completed", "arn/1": "Failed", "arn/2": "Completed"}
+
+
+def test_poll_errors_are_retried_then_fail_only_their_job():
+    METRICS.clear()
+    completed, failed = [], []
+
+    client = FakeBedrock(poll_errors={"arn/0": 2, "arn/1": 10})
+    statuses = scheduler(client, max_in_flight=3, max_poll_errors=3).run(
+        range(3),
+        lambda job: f"arn/{job}",
+        lambda job, response: completed.append(job),
+        lambda job, response: failed.append((job, response["failureMessage"])),
+    )
+
+    assert sorted(completed) == [0, 2]
+    assert failed == [(1, "connection reset")]
+    assert statuses == {"arn/0": "Completed", "arn/1": "Failed", "arn/2": "Completed"}
+    assert METRICS.counter("async_jobs_failed", stage="async_job") == 1
+
+
+def test_failure_callback_errors_do_not_abort_the_batch():
+    METRICS.clear()
+    completed = []
+
+    def on_failure(job, response):
+        raise RuntimeError("journal locked")
+
+    statuses = scheduler(FakeBedrock(final_status={"arn/0": "Stopped"})).run(
+        range(3),
+        lambda job: f"arn/{job}",
+        lambda job, response: completed.append(job),
+        on_failure,
+    )
+
+    assert completed == [1, 2]
+    assert statuses["arn/0"] == "Stopped"
+    assert METRICS.counter("async_jobs_failed", stage="async_job") == 1
+
+
+def test_skip_drops_pending_jobs_after_a_failure():
+    failed_videos, submitted = set(), []
+
+    def submit(job):
+        video, window = job
+        submitted.append(job)
+        if job == ("a", 0):
+            raise RuntimeError("window rejected")
+        return f"arn/{video}/{window}"
+
+    scheduler(FakeBedrock(), max_in_flight=1).run(
+        [("a", 0), ("a", 1), ("a", 2), ("b", 0)],
+        submit,
+        lambda job, response: None,
+        lambda job, response: failed_videos.add(job[0]),
+        skip=lambda job: job[0] in failed_videos,
+    )
+
+    assert submitted == [("a", 0), ("b", 0)]
+
+
+def test_never_exceeds_max_in_flight_and_resumes_without_resubmitting():
+    client = FakeBedrock(polls=3)
+    started = ["arn/0", "arn/1"]
+    most_in_flight = 0
+
+    def submit(job):
+        nonlocal most_in_flight
+        started.append(f"arn/{job}")
+        finished = sum(1 for arn in started if client.seen.get(arn, 0) >= client.polls)
+        most_in_flight = max(most_in_flight, len(started) - finished)
+        return f"arn/{job}"
+
+    statuses = scheduler(client, max_in_flight=2).run(
+        range(2, 6),
+        submit,
+        lambda job, response: None,
+        resume={"arn/0": 0, "arn/1": 1},
+    )
+
+    assert started == [f"arn/{job}" for job in range(6)]
+    assert most_in_flight == 2
+    assert len(statuses) == 6 and set(statuses.values()) == {"Completed"}
+
+
+def test_rejects_invalid_limits():
+    with pytest.raises(ValueError):
+        AsyncJobScheduler(FakeBedrock(), max_in_flight=0)
+    with pytest.raises(ValueError):
+        AsyncJobScheduler(FakeBedrock(), max_submits_per_second=0)
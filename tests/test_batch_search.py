@@ -0,0 +1,133 @@
+import json
+
+import numpy as np
+
+from batch_search import BatchSearcher
+from local_search import LocalVectorIndex
+
+
+def make_index(videos: int = 3, segments: int = 4, dimensions: int = 8) -> LocalVectorIndex:
+    rng = np.random.default_rng(0)
+    return LocalVectorIndex.from_videos(
+        (
+            {"videoName": f"video{v}.mp4"},
+            rng.standard_normal((segments, dimensions)).astype(np.float32),
+            [
+                {"embeddingOption": "visual-text", "startSec": 6.0 * s, "endSec": 6.0 * (s + 1)}
+                for s in range(segments)
+            ],
+        )
+        for v in range(videos)
+    )
+
+
+def msearch_body(*query_bodies: dict) -> str:
+    lines = []
+    for query_body in query_bodies:
+        lines.append(json.dumps({"index": "test"}))
+        lines.append(json.dumps(query_body))
+    return "\n".join(lines) + "\n"
+
+
+def knn_body(vector) -> dict:
+    return {
+        "size": 2,
+        "query": {
+            "nested": {
+                "path": "embeddings",
+                "query": {"knn": {"embeddings.embedding": {"vector": [float(x) for x in vector], "k": 2}}},
+            }
+        },
+    }
+
+
+def test_msearch_returns_an_error_per_malformed_body():
+    index = make_index()
+    body = msearch_body(
+        knn_body(index.vectors[0]),
+        {"query": {"nested": {"path": "embeddings", "query": {"knn": {}}}}},
+        knn_body([1.0, 2.0]),
+        knn_body(index.vectors[5]),
+    )
+
+    responses = index.msearch(body=body)["responses"]
+
+    assert [response["status"] for response in responses] == [200, 400, 400, 200]
+    assert "error" in responses[1] and "error" in responses[2]
+    assert responses[0]["hits"]["hits"][0]["_source"]["videoName"] == "video0.mp4"
+    assert responses[3]["hits"]["hits"][0]["_source"]["videoName"] == "video1.mp4"
+
+
+class FlakyIndex:
+    """Rejects every other query with a 429 on the first attempt, then delegates to a local index."""
+
+    def __init__(self, index: LocalVectorIndex) -> None:
+        self.index = index
+        self.requests = 0
+        self.queries_sent = 0
+
+    def msearch(self, body, index=None):
+        self.requests += 1
+        response = self.index.msearch(body=body)
+        self.queries_sent += len(response["responses"])
+        if self.requests == 1:
+            for i in range(0, len(response["responses"]), 2):
+                response["responses"][i] = {"error": {"type": "rejected"}, "status": 429}
+        return response
+
+
+def test_batch_searcher_retries_only_rejected_queries_and_keeps_order():
+    index = make_index()
+    client = FlakyIndex(index)
+    searcher = BatchSearcher(
+        client,
+        "test",
+        build_query=lambda vector: knn_body(vector),
+        batch_size=4,
+        max_workers=1,
+        sleep=lambda seconds: None,
+    )
+
+    results = searcher.search(index.vectors[[0, 4, 8, 1]])
+
+    assert client.requests == 2
+    assert client.queries_sent == 4 + 2
+    names = [result["hits"]["hits"][0]["_source"]["videoName"] for result in results]
+    assert names == ["video0.mp4", "video1.mp4", "video2.mp4", "video0.mp4"]
+
+
+def test_batch_searcher_returns_the_error_after_the_last_retry():
+    class Rejecting:
+        def msearch(self, body, index=None):
+            queries = len([line for line in body.splitlines() if line]) // 2
+            return {"responses": [{"error": {"type": "rejected"}, "status": 429}] * queries}
+
+    searcher = BatchSearcher(
+        Rejecting(), "test", build_query=knn_body, max_retries=2, sleep=lambda seconds: None
+    )
+
+    results = searcher.search(np.zeros((3, 8), dtype=np.float32))
+
+    assert all(result["status"] == 429 for result in results)
+
+
+def test_queries_missing_from_a_short_response_are_retried():
+    index = make_index()
+
+    class Truncating(FlakyIndex):
+        def msearch(self, body, index=None):
+            response = super().msearch(body, index)
+            if self.requests == 1:
+                response["responses"] = response["responses"][:1]
+            return response
+
+    client = Truncating(index)
+    searcher = BatchSearcher(
+        client, "test", build_query=knn_body, batch_size=3, sleep=lambda seconds: None
+    )
+
+    results = searcher.search(index.vectors[[0, 4, 8]])
+
+    assert client.requests == 2
+    names = [result["hits"]["hits"][0]["_source"]["videoName"] for result in results]
+    assert names == ["video0.mp4", "video1.mp4", "video2.mp4"]
@@ -0,0 +1,125 @@
+import csv
+import json
+
+import pytest
+
+import benchmark
+from benchmark import (
+    STRATEGIES,
+    benchmark_strategy,
+    ndcg_at_k,
+    recall_at_k,
+    segment_keys,
+    write_results,
+)
+
+
+def test_recall_at_k():
+    assert recall_at_k(["a", "b", "c"], ["a", "c", "d"], 2) == 0.5
+    assert recall_at_k(["c", "a"], ["a", "c", "d"], None) == pytest.approx(2 / 3)
+    # Nothing relevant to find counts as a perfect recall
+    assert recall_at_k(["a"], [], 3) == 1.0
+
+
+def test_ndcg_at_k_rewards_the_ideal_order():
+    relevance = {"a": 0.9, "b": 0.5, "c": 0.1}
+
+    assert ndcg_at_k(["a", "b", "c"], relevance, 3) == pytest.approx(1.0)
+    assert 0 < ndcg_at_k(["c", "b", "a"], relevance, 3) < 1
+    assert ndcg_at_k(["x", "y"], relevance, 2) == 0.0
+    assert ndcg_at_k([], {}, 3) == 1.0
+
+
+def test_segment_keys_read_fields_or_source():
+    response = {
+        "hits": {
+            "hits": [
+                {
+                    "_id": "a.mp4",
+                    "inner_hits": {
+                        "embeddings": {
+                            "hits": {
+                                "hits": [
+                                    {"fields": {"embeddings.embeddingOption": ["audio"], "embeddings.startSec": [6.004]}},
+                                    {"_source": {"embeddingOption": "visual-text", "startSec": 12}},
+                                ]
+                            }
+                        }
+                    },
+                },
+                {"_id": "b.mp4"},
+            ]
+        }
+    }
+
+    assert segment_keys(response) == [("a.mp4", "audio", 6.0), ("a.mp4", "visual-text", 12.0)]
+
+
+class DroppingClient:
+    """Answers every search from an index, minus its best hit, to stand in for a lossy ANN index."""
+
+    def __init__(self, index) -> None:
+        self.index = index
+
+    def search(self, body, index):
+        response = self.index.search(body)
+        response["hits"]["hits"] = response["hits"]["hits"][1:]
+        return response
+
+
+@pytest.fixture
+def ground_truth(make_local_index):
+    sources = [
+        {"videoName": f"video{v}.mp4", "durationSec": duration}
+        for v, duration in enumerate((15, 30, 45, 90, 30, 60))
+    ]
+    return make_local_index(segments_per_video=(3, 5, 2, 4, 6, 3), sources=sources)
+
+
+@pytest.fixture
+def queries(ground_truth):
+    return [(f"segment-{row}", ground_truth.vectors[row].tolist()) for row in (0, 7, 15)]
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES, ids=[strategy.name for strategy in STRATEGIES])
+def test_exact_search_scores_perfectly_on_every_strategy(ground_truth, queries, strategy):
+    rows = benchmark_strategy(
+        ground_truth, ground_truth.index_name, ground_truth, queries, strategy, "exact", 3, [1, 2]
+    )
+
+    assert [row["concurrency"] for row in rows] == [1, 2]
+    for row in rows:
+        assert row["strategy"] == strategy.name and row["queries"] == len(queries)
+        assert row["recall@3"] == 1.0 and row["ndcg@3"] == 1.0
+        assert row["segment_recall"] in (1.0, None)
+        assert row["p50_ms"] <= row["p95_ms"] <= row["p99_ms"]
+    inner_hits = "inner_hits" in strategy.build(queries[0][1], 3)["query"]["nested"]
+    assert (rows[0]["segment_recall"] is not None) == inner_hits
+
+
+def test_missed_hits_lower_recall_and_ndcg(ground_truth, queries):
+    knn = next(strategy for strategy in STRATEGIES if strategy.name == "knn")
+
+    (row,) = benchmark_strategy(
+        DroppingClient(ground_truth), "videos", ground_truth, queries, knn, "lossy", 3, [1]
+    )
+
+    assert row["recall@3"] == round(2 / 3, 4)
+    assert row["ndcg@3"] < 1.0
+
+
+def test_results_are_written_as_json_and_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(benchmark, "TARGET", "local")
+    rows = [
+        {"strategy": "knn", "recall@6": 1.0, "segment_recall": None},
+        {"strategy": "inner_hits", "recall@6": 0.9, "segment_recall": 0.8},
+    ]
+
+    json_file_path, csv_file_path = write_results(rows, str(tmp_path / "results"))
+
+    with open(json_file_path) as f:
+        assert json.load(f)["results"] == rows
+    with open(csv_file_path, newline="") as f:
+        written = list(csv.DictReader(f))
+    assert [row["strategy"] for row in written] == ["knn", "inner_hits"]
+    assert written[0]["segment_recall"] == "" and written[1]["segment_recall"] == "0.8"
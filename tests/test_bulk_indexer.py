@@ -0,0 +1,88 @@
+import json
+
+from bulk_indexer import BulkIndexer
+
+
+class FakeBulkEndpoint:
+    """Records every bulk request and answers each item with a status from `statuses`.
+
+    `statuses` maps a document ID to the statuses of its successive attempts; a
+    document not listed, or past its listed attempts, is indexed.
+    """
+
+    def __init__(self, statuses=None, fail_requests: int = 0) -> None:
+        self.statuses = statuses or {}
+        self.fail_requests = fail_requests
+        self.requests = []
+        self.indexed = {}
+
+    def bulk(self, index, body):
+        lines = body.splitlines()
+        ids = [json.loads(line)["create"]["_id"] for line in lines[0::2]]
+        self.requests.append(ids)
+        if len(self.requests) <= self.fail_requests:
+            raise ConnectionError("connection reset")
+
+        items = []
+        for document_id, source in zip(ids, lines[1::2]):
+            attempts = self.statuses.get(document_id, [])
+            status = attempts.pop(0) if attempts else 201
+            item = {"_id": document_id, "status": status}
+            if status >= 300:
+                item["error"] = {"type": "rejected" if status == 429 else "mapper_parsing_exception"}
+            else:
+                self.indexed[document_id] = json.loads(source)
+            items.append({"create": item})
+        return {"errors": any("error" in item["create"] for item in items), "items": items}
+
+
+def documents(count: int):
+    return ({"videoName": f"video{i}.mp4", "title": f"Video {i}"} for i in range(count))
+
+
+def indexer(endpoint: FakeBulkEndpoint, **kwargs) -> BulkIndexer:
+    return BulkIndexer(
+        endpoint, "test", id_field="videoName", sleep=lambda seconds: None, **kwargs
+    )
+
+
+def test_retries_only_the_rejected_items():
+    endpoint = FakeBulkEndpoint({"video1.mp4": [429], "video3.mp4": [429, 503]})
+
+    result = indexer(endpoint, max_chunk_docs=10, max_workers=1).index_documents(documents(5))
+
+    assert result.indexed == 5 and result.failed == 0 and result.retried == 3
+    assert endpoint.requests == [
+        [f"video{i}.mp4" for i in range(5)],
+        ["video1.mp4", "video3.mp4"],
+        ["video3.mp4"],
+    ]
+    assert sorted(endpoint.indexed) == [f"video{i}.mp4" for i in range(5)]
+
+
+def test_fails_permanent_errors_and_items_still_rejected_after_the_last_retry():
+    endpoint = FakeBulkEndpoint({"video0.mp4": [400], "video2.mp4": [429, 429, 429]})
+
+    result = indexer(endpoint, max_retries=2).index_documents(documents(4))
+
+    assert result.indexed == 2 and result.failed == 2 and result.retried == 2
+    assert sorted(result.failed_ids) == ["video0.mp4", "video2.mp4"]
+    assert len(endpoint.requests) == 3
+
+
+def test_retries_every_item_of_a_failed_request():
+    endpoint = FakeBulkEndpoint(fail_requests=1)
+
+    result = indexer(endpoint).index_documents(documents(3))
+
+    assert result.indexed == 3 and result.retried == 3
+    assert endpoint.requests[0] == endpoint.requests[1]
+
+
+def test_splits_documents_into_capped_chunks():
+    endpoint = FakeBulkEndpoint()
+
+    result = indexer(endpoint, max_chunk_docs=4, max_workers=2).index_documents(documents(10))
+
+    assert result.indexed == 10 and result.chunks == 3
+    assert sorted(len(ids) for ids in endpoint.requests) == [2, 4, 4]
@@ -0,0 +1,106 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import dedupe_videos as dedupe
+from data import VideoAnalysis
+
+
+def unit_rows(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def signatures():
+    """Fifty unrelated videos, plus a re-encode of video 0 and two re-encodes of video 1."""
+    rng = np.random.default_rng(3)
+    base = unit_rows(rng.standard_normal((50, 96)))
+    copies = unit_rows(base[[0, 1, 1]] + 0.05 * rng.standard_normal((3, 96)) / np.sqrt(96))
+    names = [f"video{row:02d}.mp4" for row in range(50)] + ["copy0.mp4", "copy1a.mp4", "copy1b.mp4"]
+    return names, np.vstack([base, copies]).astype(np.float32)
+
+
+def test_near_duplicates_are_grouped(signatures):
+    names, matrix = signatures
+
+    groups = dedupe.find_duplicate_groups(names, matrix, threshold=0.95)
+
+    assert sorted(groups) == [
+        ["copy0.mp4", "video00.mp4"],
+        ["copy1a.mp4", "copy1b.mp4", "video01.mp4"],
+    ]
+
+
+def test_unrelated_videos_are_not_grouped(signatures):
+    names, matrix = signatures
+    # Similar, but well below the threshold
+    rng = np.random.default_rng(4)
+    related = unit_rows(matrix[:1] + 0.8 * unit_rows(rng.standard_normal((1, 96))))
+    assert 0.5 < float(related[0] @ matrix[0]) < 0.9
+
+    groups = dedupe.find_duplicate_groups(
+        names[:50] + ["related.mp4"], np.vstack([matrix[:50], related]), threshold=0.95
+    )
+
+    assert groups == []
+
+
+def test_signature_is_unit_length_with_a_block_per_option():
+    video_embeddings = SimpleNamespace(
+        vectors=np.array([[3.0, 4.0], [0.0, 2.0]], dtype=np.float32),
+        embeddings=[SimpleNamespace(embeddingOption=option) for option in ("audio", "visual-text")],
+    )
+
+    signature = dedupe.video_signature(video_embeddings)
+
+    # visual-text, visual-image (missing), then audio
+    np.testing.assert_allclose(signature, np.array([0, 1, 0, 0, 0.6, 0.8]) / np.sqrt(2), rtol=1e-6)
+
+
+def write_analysis(directory, name: str, title: str) -> None:
+    analysis = VideoAnalysis(
+        videoName=name,
+        s3URI=f"s3://bucket/commercials/{name}",
+        title=title,
+        summary=f"The {title} commercial.",
+        keywords=["car"],
+        dateCreated="2025-07-23T00:00:00 UTC",
+    )
+    (directory / f"{name[:-4]}.json").write_text(analysis.model_dump_json())
+
+
+def test_duplicates_link_to_the_canonical_analysis(tmp_path):
+    write_analysis(tmp_path, "b.mp4", "Road Trip")
+    canonical = dedupe.choose_canonical(["a.mp4", "b.mp4"], str(tmp_path))
+
+    assert canonical == "b.mp4"
+    assert dedupe.link_pegasus_analysis("a.mp4", canonical, str(tmp_path))
+    linked = json.loads((tmp_path / "a.json").read_text())
+    assert (linked["videoName"], linked["s3URI"], linked["title"]) == (
+        "a.mp4",
+        "s3://bucket/commercials/a.mp4",
+        "Road Trip",
+    )
+
+
+def test_an_existing_analysis_is_never_overwritten(tmp_path):
+    write_analysis(tmp_path, "a.mp4", "Own Analysis")
+    write_analysis(tmp_path, "b.mp4", "Road Trip")
+    before = (tmp_path / "a.json").read_text()
+
+    assert not dedupe.link_pegasus_analysis("a.mp4", "b.mp4", str(tmp_path))
+    assert (tmp_path / "a.json").read_text() == before
+    # Nothing to link from a canonical video without an analysis
+    assert not dedupe.link_pegasus_analysis("c.mp4", "d.mp4", str(tmp_path))
+    assert not (tmp_path / "c.json").exists()
+
+
+def test_candidate_probability_rises_with_similarity():
+    probabilities = [dedupe.candidate_probability(s) for s in (0.5, 0.8, 0.95, 0.99)]
+
+    assert probabilities == sorted(probabilities)
+    assert probabilities[0] < 0.02 and probabilities[2] > 0.95
+    with pytest.raises(ValueError):
+        dedupe.lsh_candidate_pairs(np.zeros((2, 10), dtype=bool), num_bands=3)
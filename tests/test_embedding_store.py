@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pytest
+
+from embedding_store import (
+    embeddings_exist,
+    get_embeddings_file_path,
+    get_embeddings_source_files,
+    iter_video_embeddings,
+    read_video_embeddings,
+    write_video_embeddings,
+)
+
+
+@pytest.mark.parametrize(
+    "file_format, dtype", [("json", "float32"), ("npy", "float32"), ("npy", "float16")]
+)
+def test_round_trip_keeps_metadata_and_vectors(tmp_path, make_video_embeddings, file_format, dtype):
+    original = make_video_embeddings()
+
+    path = write_video_embeddings(original, str(tmp_path), file_format=file_format, dtype=dtype)
+    loaded = read_video_embeddings(str(tmp_path), "video.mp4")
+
+    assert path == get_embeddings_file_path(str(tmp_path), "video.mp4", file_format)
+    assert loaded.model_dump(exclude={"embeddings"}) == original.model_dump(exclude={"embeddings"})
+    assert [s.startSec for s in loaded.embeddings] == [s.startSec for s in original.embeddings]
+    tolerance = 1e-3 if dtype == "float16" else 1e-6
+    np.testing.assert_allclose(loaded.vectors, original.vectors, rtol=tolerance, atol=tolerance)
+    assert loaded.materialize().embeddings[1].embedding == pytest.approx(
+        original.embeddings[1].embedding, rel=tolerance, abs=tolerance
+    )
+
+
+def test_npy_vectors_are_memory_mapped_and_stored_compactly(tmp_path, make_video_embeddings):
+    original = make_video_embeddings(segments=16, dimensions=64)
+    write_video_embeddings(original, str(tmp_path), file_format="json")
+    write_video_embeddings(original, str(tmp_path), file_format="npy", dtype="float16")
+
+    # The .npy file wins when both formats exist
+    loaded = read_video_embeddings(str(tmp_path), "video.json")
+
+    assert isinstance(loaded.vectors, np.memmap) and loaded.vectors.dtype == np.float16
+    assert loaded.embeddings[0].embedding == []
+    npy_path = get_embeddings_file_path(str(tmp_path), "video.mp4", "npy")
+    json_path = get_embeddings_file_path(str(tmp_path), "video.mp4", "json")
+    assert os.path.getsize(npy_path) < os.path.getsize(json_path) / 5
+    assert get_embeddings_source_files(str(tmp_path), "video.mp4") == [
+        npy_path,
+        os.path.join(str(tmp_path), "video.meta.json"),
+    ]
+    in_memory = read_video_embeddings(str(tmp_path), "video.mp4", mmap=False)
+    assert not isinstance(in_memory.vectors, np.memmap)
+
+
+def test_iterates_each_video_once_and_skips_bookkeeping_files(tmp_path, make_video_embeddings):
+    write_video_embeddings(make_video_embeddings("b.mp4"), str(tmp_path), file_format="npy")
+    write_video_embeddings(make_video_embeddings("b.mp4"), str(tmp_path), file_format="json")
+    write_video_embeddings(make_video_embeddings("a.mp4"), str(tmp_path))
+    (tmp_path / "_duplicates.json").write_text("{}")
+    (tmp_path / "_manifest.jsonl").write_text("")
+
+    names = [video.videoName for video in iter_video_embeddings(str(tmp_path))]
+
+    assert names == ["a.mp4", "b.mp4"]
+
+
+def test_missing_embeddings(tmp_path):
+    assert not embeddings_exist(str(tmp_path), "video.mp4")
+    assert get_embeddings_source_files(str(tmp_path), "video.mp4") == []
+    with pytest.raises(FileNotFoundError):
+        read_video_embeddings(str(tmp_path), "video.mp4")
+    with pytest.raises(ValueError):
+        get_embeddings_file_path(str(tmp_path), "video.mp4", "parquet")
@@ -0,0 +1,153 @@
+import io
+import json
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from data import VideoEmbeddingSegment
+from embedding_store import read_video_embeddings
+from embedding_stream import (
+    SegmentSpool,
+    iter_output_segments,
+    plan_windows,
+    write_spooled_video_embeddings,
+)
+
+
+def output_json(segments) -> bytes:
+    return json.dumps({"data": segments}, ensure_ascii=False).encode("utf-8")
+
+
+def segment(index: int, dimensions: int = 4, option: str = "visual-text") -> dict:
+    return {
+        "embedding": [index + i / 10 for i in range(dimensions)],
+        "embeddingOption": option,
+        "startSec": 6.0 * index,
+        "endSec": 6.0 * (index + 1),
+    }
+
+
+class SyntheticOutput(io.RawIOBase):
+    """A Marengo output.json of many segments, generated as it is read rather than held in memory."""
+
+    def __init__(self, segments: int, dimensions: int) -> None:
+        self.parts = self._parts(segments, dimensions)
+        self.pending = b""
+
+    @staticmethod
+    def _parts(segments: int, dimensions: int):
+        yield b'{"data": ['
+        for index in range(segments):
+            vector = ",".join(f"{(index * 7 + i) % 1000 / 1000:.6f}" for i in range(dimensions))
+            yield (
+                ("," if index else "")
+                + f'{{"embedding": [{vector}], "embeddingOption": "audio", '
+                f'"startSec": {6.0 * index}, "endSec": {6.0 * (index + 1)}}}'
+            ).encode()
+        yield b"]}"
+
+    def read(self, size: int = -1) -> bytes:
+        while len(self.pending) < size:
+            part = next(self.parts, None)
+            if part is None:
+                break
+            self.pending += part
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+@pytest.mark.parametrize(
+    "duration, window, expected",
+    [
+        (None, 900, [(0.0, 0.0)]),
+        (600, 900, [(0.0, 0.0)]),
+        (900, 900, [(0.0, 0.0)]),
+        (2000, 0, [(0.0, 0.0)]),
+        (1800, 900, [(0.0, 900), (900.0, 900)]),
+        (2000, 900, [(0.0, 900), (900.0, 900), (1800.0, 200)]),
+    ],
+)
+def test_plan_windows_covers_the_video_without_gaps(duration, window, expected):
+    windows = plan_windows(duration, window)
+
+    assert windows == expected
+    if len(windows) > 1:
+        assert all(a + b == c for (a, b), (c, _) in zip(windows, windows[1:]))
+        assert windows[-1][0] + windows[-1][1] == duration
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 1 << 16])
+def test_parses_segments_split_across_chunks(chunk_size):
+    segments = [segment(i) for i in range(5)]
+    # A multi-byte character split between chunks must not break the UTF-8 decoding
+    segments[2]["embeddingOption"] = "visual-text-é"
+
+    parsed = list(iter_output_segments(io.BytesIO(output_json(segments)), chunk_size))
+
+    assert [s.model_dump() for s in parsed] == segments
+
+
+def test_parses_an_empty_segment_list_and_rejects_a_truncated_one():
+    assert list(iter_output_segments(io.BytesIO(b'{"data": [ ]}'))) == []
+
+    truncated = output_json([segment(0), segment(1)])[:-20]
+    with pytest.raises(ValueError):
+        list(iter_output_segments(io.BytesIO(truncated), chunk_size=16))
+
+
+def test_memory_stays_flat_while_parsing_a_large_output():
+    segments, dimensions = 2000, 256
+    # Each segment's JSON is about 2.3 KB, so the whole file is about 4.6 MB
+    tracemalloc.start()
+    try:
+        count = 0
+        for parsed in iter_output_segments(SyntheticOutput(segments, dimensions), 16 * 1024):
+            assert len(parsed.embedding) == dimensions
+            count += 1
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert count == segments
+    assert peak < 1024 * 1024
+
+
+def test_spooled_windows_are_written_in_order(tmp_path):
+    spools = []
+    for window in range(2):
+        spool = SegmentSpool(str(tmp_path / "spool" / f"video.{window:04d}"))
+        for index in range(window * 3, window * 3 + 3):
+            spool.append(VideoEmbeddingSegment(**segment(index)))
+        spool.close()
+        spools.append(spool)
+    metadata = {
+        "videoName": "video.mp4",
+        "s3URI": "s3://bucket/commercials/video.mp4",
+        "keyframeURL": "https://example.com/video.jpg",
+        "dateCreated": "2025-07-23T00:00:00 UTC",
+        "sizeBytes": 1,
+        "durationSec": 36.0,
+        "contentType": "video/mp4",
+    }
+
+    for file_format in ("json", "npy"):
+        directory = str(tmp_path / file_format)
+        write_spooled_video_embeddings(metadata, spools, directory, file_format=file_format)
+        video_embeddings = read_video_embeddings(directory, "video.mp4")
+
+        assert [s.startSec for s in video_embeddings.embeddings] == [6.0 * i for i in range(6)]
+        assert np.array_equal(
+            video_embeddings.vectors,
+            np.asarray([segment(i)["embedding"] for i in range(6)], dtype=np.float32),
+        )
+    assert spools[1].end_sec == 36.0
+
+
+def test_spool_rejects_a_segment_of_another_dimension(tmp_path):
+    spool = SegmentSpool(str(tmp_path / "video.0000"))
+    spool.append(VideoEmbeddingSegment(**segment(0)))
+
+    with pytest.raises(ValueError):
+        spool.append(VideoEmbeddingSegment(**segment(1, dimensions=5)))
+    spool.remove()
@@ -0,0 +1,44 @@
+import json
+
+from PIL import Image
+
+import ffmpeg_extract_keyframe as keyframes
+
+
+def test_segments_sharing_a_start_get_their_own_keyframe():
+    paths = {
+        keyframes.segment_keyframe_path("video", 0.0, 6.0),
+        keyframes.segment_keyframe_path("video", 0.0, 10.0),
+        keyframes.segment_keyframe_path("video", 6.0, 10.0),
+    }
+
+    assert len(paths) == 3
+
+
+def test_sprite_sheet_tiles_frames_in_segment_order(tmp_path):
+    segments = [(0.0, 6.0), (6.0, 12.0), (12.0, 18.0)]
+    frame_paths = []
+    for index, color in enumerate(["red", "green", "blue"]):
+        frame_path = tmp_path / f"frame{index}.jpg"
+        Image.new("RGB", (640, 360), color).save(frame_path)
+        frame_paths.append(str(frame_path))
+
+    sprite_path = tmp_path / "video_sprite.jpg"
+    keyframes.build_sprite_sheet(frame_paths, segments, str(sprite_path), columns=2, thumbnail_width=160)
+
+    with Image.open(sprite_path) as sprite:
+        assert sprite.size == (320, 180)
+    tiles = json.loads((tmp_path / "video_sprite.json").read_text())
+    assert [(tile["startSec"], tile["x"], tile["y"]) for tile in tiles] == [
+        (0.0, 0, 0),
+        (6.0, 160, 0),
+        (12.0, 0, 90),
+    ]
+
+
+def test_no_frames_writes_no_sprite_sheet(tmp_path):
+    sprite_path = tmp_path / "video_sprite.jpg"
+
+    keyframes.build_sprite_sheet([], [], str(sprite_path))
+
+    assert not sprite_path.exists()
@@ -0,0 +1,96 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from botocore.exceptions import ClientError
+
+import generate_analyses_pegasus as pegasus
+from instrumentation import METRICS
+from rate_limiter import AdaptiveRateLimiter
+
+STRUCTURED = json.dumps(
+    {"title": "Lemonade Stand", "summary": "Kids sell lemonade.", "keywords": ["lemonade", "kids"]}
+)
+
+
+class ScriptedBedrock:
+    """Answers each `invoke_model` call with the next scripted message, or raises it if it is an exception."""
+
+    def __init__(self, *replies) -> None:
+        self.replies = list(replies)
+        self.prompts = []
+
+    def invoke_model(self, modelId, body, contentType, accept):
+        self.prompts.append(json.loads(body)["inputPrompt"])
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return {"body": io.BytesIO(json.dumps({"message": reply}).encode())}
+
+
+@pytest.fixture
+def analyze(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / pegasus.LOCAL_DESTINATION_DIRECTORY).mkdir()
+    monkeypatch.setattr(pegasus, "USE_STRUCTURED_OUTPUT", True)
+    METRICS.clear()
+    executor = ThreadPoolExecutor(max_workers=3)
+    limiter = AdaptiveRateLimiter(initial_rate=1e6, max_rate=1e6)
+
+    def analyze(client):
+        return pegasus.analyze_video(client, "123456789012", "lemonade.mp4", executor, limiter)
+
+    yield analyze
+    executor.shutdown()
+
+
+def test_structured_output_needs_one_call(analyze):
+    client = ScriptedBedrock(STRUCTURED)
+
+    video_analysis = analyze(client)
+
+    assert client.prompts == [pegasus.PROMPT_STRUCTURED]
+    assert video_analysis.keywords == ["lemonade", "kids"]
+    assert METRICS.counter("pegasus_fallbacks", stage="pegasus") == 0
+
+
+def test_unparseable_structured_output_falls_back_to_per_field_prompts(analyze):
+    client = ScriptedBedrock("Sorry, here is a title: Lemonade", "Lemonade Stand", "Kids.", '["kids"]')
+
+    video_analysis = analyze(client)
+
+    assert len(client.prompts) == 4
+    assert video_analysis.title and video_analysis.keywords
+    assert METRICS.counter("pegasus_fallbacks", stage="pegasus") == 1
+
+
+def test_call_errors_fail_the_video_without_falling_back(analyze):
+    denied = ClientError(
+        {"Error": {"Code": "AccessDeniedException", "Message": "denied"}}, "InvokeModel"
+    )
+    client = ScriptedBedrock(denied, "unused", "unused", "unused")
+
+    with pytest.raises(ClientError):
+        analyze(client)
+
+    assert client.prompts == [pegasus.PROMPT_STRUCTURED]
+    assert METRICS.counter("pegasus_fallbacks", stage="pegasus") == 0
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "not json",
+        json.dumps({"title": "Lemonade", "summary": "Kids."}),
+        json.dumps({"title": " ", "summary": "Kids.", "keywords": []}),
+        json.dumps(["Lemonade", "Kids."]),
+    ],
+)
+def test_parse_structured_analysis_rejects_incomplete_messages(message):
+    assert pegasus.parse_structured_analysis(message, "a.mp4", "s3://b/a.mp4", "now") is None
+
+
+def test_parse_keywords_accepts_a_comma_separated_fallback():
+    assert pegasus.parse_keywords('["a", " b ", ""]') == ["a", "b"]
+    assert pegasus.parse_keywords("[lemonade, 'kids', summer]") == ["lemonade", "kids", "summer"]
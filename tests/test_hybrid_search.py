@@ -0,0 +1,98 @@
+import pytest
+
+from hybrid_search import HybridSearcher, reciprocal_rank_fusion, weighted_score_fusion
+from search_queries import lexical_query
+
+SOURCES = [
+    {"videoName": "video0.mp4", "title": "Truck ad", "summary": "A pickup truck tows a boat."},
+    {"videoName": "video1.mp4", "title": "Truck sale", "summary": "Trucks on sale, truck deals."},
+    {"videoName": "video2.mp4", "title": "Coffee", "summary": "Morning coffee at home."},
+    {"videoName": "video3.mp4", "title": "Sneakers", "summary": "Running shoes on a track."},
+]
+
+
+def hits(*ids_and_scores):
+    return [{"_id": video_id, "_score": score} for video_id, score in ids_and_scores]
+
+
+def test_rrf_rewards_videos_ranked_by_both_searches():
+    lexical = hits(("a", 12.0), ("b", 9.0), ("c", 1.0))
+    vector = hits(("c", 0.9), ("a", 0.8))
+
+    fused = reciprocal_rank_fusion([lexical, vector], weights=[1.0, 1.0], rrf_k=60)
+
+    assert [hit["_id"] for hit in fused] == ["a", "c", "b"]
+    assert fused[0]["_score"] == pytest.approx(1 / 61 + 1 / 62)
+    assert [hit["_ranks"] for hit in fused] == [[1, 2], [3, 1], [2, None]]
+
+
+def test_weighted_fusion_normalizes_each_list():
+    lexical = hits(("a", 30.0), ("b", 10.0))
+    vector = hits(("b", 0.9), ("a", 0.7))
+
+    fused = weighted_score_fusion([lexical, vector], weights=[0.25, 0.75])
+
+    assert [(hit["_id"], hit["_score"]) for hit in fused] == [("b", 0.75), ("a", 0.25)]
+
+
+class CountingEncoder:
+    def __init__(self, index) -> None:
+        self.index = index
+        self.calls = 0
+
+    def __call__(self, text: str):
+        self.calls += 1
+        return self.index.vectors[0].tolist()
+
+
+@pytest.fixture
+def index(make_local_index):
+    return make_local_index(segments_per_video=(2, 2, 2, 2), sources=SOURCES)
+
+
+@pytest.mark.parametrize("fusion", ["rrf", "weighted"])
+def test_confident_lexical_hits_skip_the_embedding_with_fused_scores(index, fusion):
+    encode = CountingEncoder(index)
+    searcher = HybridSearcher(
+        index,
+        "test",
+        encode,
+        fusion=fusion,
+        lexical_first=True,
+        min_lexical_hits=2,
+        min_lexical_score=0.1,
+    )
+
+    response = searcher.search("truck", size=5)
+    searcher.close()
+
+    assert response["skipped_embedding"] and encode.calls == 0
+    lexical = index.search(body=lexical_query("truck", size=20))["hits"]["hits"]
+    assert len(lexical) == 2 and lexical[0]["_score"] > 1.0
+    fuse = reciprocal_rank_fusion if fusion == "rrf" else weighted_score_fusion
+    expected = fuse([lexical, []], [0.5, 0.5])
+    assert [(hit["_id"], hit["_score"], hit["_ranks"]) for hit in response["hits"]["hits"]] == [
+        (hit["_id"], pytest.approx(hit["_score"]), hit["_ranks"]) for hit in expected
+    ]
+    # No raw BM25 score survives
+    assert response["hits"]["max_score"] <= 0.5
+
+
+def test_too_few_confident_hits_fall_back_to_hybrid_search(index):
+    encode = CountingEncoder(index)
+    searcher = HybridSearcher(
+        index, "test", encode, lexical_first=True, min_lexical_hits=3, min_lexical_score=0.1
+    )
+
+    response = searcher.search("truck", size=4)
+    searcher.close()
+
+    assert not response["skipped_embedding"] and encode.calls == 1
+    top = response["hits"]["hits"][0]
+    # video0 is the best vector match (its own first segment) and a lexical match
+    assert top["_id"] == "video0.mp4" and None not in top["_ranks"]
+
+
+def test_rejects_unknown_fusion(index):
+    with pytest.raises(ValueError):
+        HybridSearcher(index, "test", CountingEncoder(index), fusion="max")
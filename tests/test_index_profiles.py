@@ -0,0 +1,109 @@
+import pytest
+
+from embedding_store import write_video_embeddings
+from index_profiles import MEMORY_OVERHEAD, PROFILES, IndexProfile, count_local_vectors
+
+
+def vector_mapping(profile: IndexProfile) -> dict:
+    return profile.to_index_body()["mappings"]["properties"]["embeddings"]["properties"][
+        "embedding"
+    ]
+
+
+@pytest.mark.parametrize("name", sorted(PROFILES))
+def test_every_profile_builds_a_nested_knn_mapping(name):
+    body = PROFILES[name].to_index_body()
+
+    assert body["settings"]["index"]["knn"] is True
+    assert body["mappings"]["properties"]["embeddings"]["type"] == "nested"
+    assert vector_mapping(PROFILES[name])["type"] == "knn_vector"
+
+
+@pytest.mark.parametrize(
+    "profile, engine, encoder",
+    [
+        (IndexProfile(name="float"), "faiss", None),
+        (IndexProfile(name="fp16", quantization="fp16"), "faiss", {"name": "sq", "parameters": {"type": "fp16"}}),
+        (IndexProfile(name="byte", quantization="byte"), "lucene", {"name": "sq"}),
+    ],
+)
+def test_quantization_selects_the_engine_and_encoder(profile, engine, encoder):
+    method = vector_mapping(profile)["method"]
+
+    assert method["engine"] == engine
+    assert method["parameters"].get("encoder") == encoder
+    # The Lucene engine takes ef_search at query time only
+    assert ("ef_search" in method["parameters"]) == (engine == "faiss")
+
+
+def test_on_disk_and_pq_mappings():
+    on_disk = vector_mapping(IndexProfile(name="disk", on_disk=True, compression_level="8x"))
+    assert on_disk["mode"] == "on_disk" and on_disk["compression_level"] == "8x"
+
+    pq = IndexProfile(name="pq", quantization="pq", pq_model_id="model")
+    assert vector_mapping(pq) == {"type": "knn_vector", "model_id": "model"}
+    train = pq.to_train_model_body("sample", "embedding")
+    assert train["method"]["parameters"]["encoder"]["parameters"] == {"m": 64, "code_size": 8}
+
+
+def test_replicas_are_only_set_when_configured():
+    assert "number_of_replicas" not in IndexProfile(name="a").to_index_body()["settings"]["index"]
+    settings = IndexProfile(name="b", number_of_replicas=0).to_index_body()["settings"]["index"]
+    assert settings["number_of_replicas"] == 0
+
+
+@pytest.mark.parametrize(
+    "fields, message",
+    [
+        ({"quantization": "int4"}, "Unsupported quantization"),
+        ({"on_disk": True, "quantization": "fp16"}, "on-disk mode"),
+        ({"compression_level": "3x"}, "compression level"),
+        ({"quantization": "pq", "pq_m": 100, "pq_model_id": "model"}, "pq_m"),
+        ({"quantization": "pq"}, "pq_model_id"),
+    ],
+)
+def test_invalid_profiles_are_rejected(fields, message):
+    with pytest.raises(ValueError, match=message):
+        IndexProfile(name="invalid", **fields).to_index_body()
+
+
+def test_train_model_body_requires_pq():
+    with pytest.raises(ValueError):
+        PROFILES["fp16"].to_train_model_body("sample", "embedding")
+
+
+def test_memory_estimates_shrink_with_quantization():
+    estimates = [
+        PROFILES[name].bytes_per_vector()
+        for name in ("default", "fp16", "byte", "on-disk-8x", "on-disk-32x", "pq")
+    ]
+
+    assert estimates == sorted(estimates, reverse=True)
+    # Float32 vectors plus 8 bytes per graph link
+    assert PROFILES["default"].bytes_per_vector() == pytest.approx(MEMORY_OVERHEAD * (1024 * 4 + 8 * 16))
+
+
+def test_memory_estimate_counts_shards_replicas_and_code_books():
+    profile = IndexProfile(name="p", number_of_shards=4, number_of_replicas=2)
+    estimate = profile.estimate_memory(1000)
+
+    assert estimate["primary_bytes"] == pytest.approx(profile.bytes_per_vector() * 1000)
+    assert estimate["total_bytes"] == pytest.approx(estimate["primary_bytes"] * 3)
+    assert estimate["bytes_per_shard"] == pytest.approx(estimate["primary_bytes"] / 4)
+
+    pq = PROFILES["pq"]
+    code_books = pq.estimate_memory(1000, num_segments=3)["primary_bytes"] - pq.estimate_memory(
+        1000, num_segments=1
+    )["primary_bytes"]
+    assert code_books == pytest.approx(MEMORY_OVERHEAD * 2 * 256 * 4 * 1024)
+
+
+def test_count_local_vectors_reads_both_formats(tmp_path, make_video_embeddings):
+    write_video_embeddings(make_video_embeddings("a.mp4", segments=3), str(tmp_path))
+    write_video_embeddings(
+        make_video_embeddings("b.mp4", segments=5), str(tmp_path), file_format="npy"
+    )
+
+    assert count_local_vectors(str(tmp_path)) == (8, 8)
+    (tmp_path / "empty").mkdir()
+    assert count_local_vectors(str(tmp_path / "empty")) == (0, 0)
@@ -0,0 +1,96 @@
+import json
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from instrumentation import Metrics, count_sdk_throttles, export_metrics, start_metrics
+
+
+@pytest.fixture
+def metrics():
+    return Metrics(run_id="test", clock=lambda: 1000.0, max_spans=3)
+
+
+def test_spans_are_aggregated_while_only_the_most_recent_are_kept(metrics):
+    for seconds in (0.1, 0.2, 0.3, 0.4, 0.5):
+        metrics.record_span("bulk_request", seconds, stage="index", video="a.mp4")
+
+    assert [span["seconds"] for span in metrics.spans()] == [0.3, 0.4, 0.5]
+    prometheus = metrics.to_prometheus()
+    assert 'tl_bulk_request_seconds_count{stage="index",status="ok"} 5' in prometheus
+    assert 'tl_bulk_request_seconds_sum{stage="index",status="ok"} 1.500000' in prometheus
+    assert "bulk_request" in metrics.summary() and " 5 " in metrics.summary()
+
+
+def test_prometheus_exports_the_longest_span_as_a_gauge(metrics):
+    metrics.record_span("pegasus_invoke", 2.0, stage="pegasus", video="a.mp4")
+    metrics.record_span("pegasus_invoke", 3.0, stage="pegasus", video="b.mp4")
+    metrics.increment("throttles", stage="pegasus")
+    metrics.increment("throttles", 2, stage="pegasus")
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert "# TYPE tl_pegasus_invoke_seconds summary" in lines
+    assert "# TYPE tl_pegasus_invoke_seconds_max gauge" in lines
+    assert 'tl_pegasus_invoke_seconds_max{stage="pegasus",status="ok"} 3.000000' in lines
+    assert 'tl_throttles_total{stage="pegasus"} 3' in lines
+    # The per-video label is aggregated away
+    assert not any("a.mp4" in line for line in lines)
+
+
+def test_span_context_records_errors(metrics):
+    with pytest.raises(KeyError):
+        with metrics.span("document", stage="documents") as labels:
+            labels["bytes"] = 10
+            raise KeyError("title")
+
+    span = metrics.spans()[0]
+    assert span["status"] == "error" and span["error"] == "KeyError" and span["bytes"] == 10
+
+
+def test_streamed_spans_are_written_once_with_the_counters(tmp_path, metrics):
+    start_metrics("script", metrics, "jsonl", str(tmp_path))
+    for seconds in range(5):
+        metrics.record_span("marengo_download", float(seconds), stage="marengo")
+    metrics.increment("videos_processed", stage="marengo")
+
+    file_path = export_metrics("script", metrics, "jsonl", str(tmp_path))
+
+    with open(file_path) as f:
+        records = [json.loads(line) for line in f]
+    assert [r["seconds"] for r in records if r["type"] == "span"] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert [r["name"] for r in records if r["type"] == "counter"] == ["videos_processed"]
+
+
+def test_count_sdk_throttles_counts_attempts_the_sdk_retries():
+    metrics = Metrics()
+    client = boto3.client(
+        "bedrock-runtime",
+        region_name="us-east-1",
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+        config=Config(retries={"total_max_attempts": 2, "mode": "standard"}),
+    )
+    sends = []
+
+    class Body:
+        def stream(self, **kwargs):
+            yield b'{"message": "Too many requests"}'
+
+    def throttle(request, **kwargs):
+        sends.append(request)
+        return AWSResponse(
+            request.url, 429, {"x-amzn-ErrorType": "ThrottlingException:http://internal"}, Body()
+        )
+
+    client.meta.events.register("before-send", throttle)
+    count_sdk_throttles(client, "pegasus", metrics)
+
+    with pytest.raises(ClientError):
+        client.invoke_model(modelId="model", body=b"{}")
+
+    assert len(sends) == 2
+    assert metrics.counter("throttles", stage="pegasus") == 2
@@ -0,0 +1,134 @@
+import json
+
+import numpy as np
+import pytest
+
+from search_queries import knn_query, radial_query
+
+SCORE_MODES = {"avg": np.mean, "sum": np.sum, "min": np.min, "max": np.max}
+
+
+def brute_force(index, vector, k, score_mode="max", expand=False, option=None):
+    """Rank videos by scoring every segment one at a time, as a reference for the vectorized engine."""
+    vector = np.asarray(vector, dtype=np.float64)
+    ranked = []
+    for video, video_id in enumerate(index.ids):
+        scores = []
+        for row in range(index.offsets[video], index.offsets[video + 1]):
+            if option is not None and index.segment_options[row] != option:
+                continue
+            segment = index.vectors[row].astype(np.float64)
+            cosine = segment @ vector / (np.linalg.norm(segment) * np.linalg.norm(vector))
+            scores.append((1.0 + cosine) / 2.0)
+        if scores:
+            ranked.append((max(scores), video_id, scores))
+    # The k videos with the best segment are the candidates, then scored with the score mode
+    candidates = sorted(ranked, reverse=True)[:k]
+    scored = [
+        (SCORE_MODES[score_mode](scores) if expand else max(scores), video_id)
+        for _, video_id, scores in candidates
+    ]
+    return sorted(scored, reverse=True)
+
+
+def ranking(response):
+    return [(hit["_score"], hit["_id"]) for hit in response["hits"]["hits"]]
+
+
+def assert_same_ranking(actual, expected):
+    assert [video_id for _, video_id in actual] == [video_id for _, video_id in expected]
+    np.testing.assert_allclose(
+        [score for score, _ in actual], [score for score, _ in expected], rtol=1e-5
+    )
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_knn_ranking_matches_brute_force(make_local_index, k):
+    index = make_local_index(segments_per_video=(3, 5, 2, 4, 1, 6), seed=k)
+    query = np.random.default_rng(100 + k).standard_normal(8)
+
+    response = index.search(knn_query(query.tolist(), k=k))
+
+    assert_same_ranking(ranking(response), brute_force(index, query, k))
+
+
+@pytest.mark.parametrize("score_mode", sorted(SCORE_MODES))
+def test_expanded_score_modes_match_brute_force(make_local_index, score_mode):
+    index = make_local_index()
+    query = np.random.default_rng(1).standard_normal(8)
+    body = knn_query(query.tolist(), k=4, expand_nested_docs=True)
+    body["query"]["nested"]["score_mode"] = score_mode
+
+    response = index.search(body)
+
+    assert_same_ranking(
+        ranking(response), brute_force(index, query, 4, score_mode=score_mode, expand=True)
+    )
+
+
+def test_filtered_search_only_matches_filtered_segments(make_local_index):
+    index = make_local_index()
+    query = index.vectors[0].tolist()  # A visual-text segment of video0
+    body = knn_query(
+        query,
+        k=4,
+        filter={"term": {"embeddings.embeddingOption": "audio"}},
+        inner_hits=True,
+        inner_hits_size=10,
+        expand_nested_docs=True,
+    )
+
+    response = index.search(body)
+
+    assert_same_ranking(
+        ranking(response), brute_force(index, query, 4, expand=True, option="audio")
+    )
+    for hit in response["hits"]["hits"]:
+        segments = hit["inner_hits"]["embeddings"]["hits"]["hits"]
+        assert segments and all(
+            segment["fields"]["embeddings.embeddingOption"] == ["audio"] for segment in segments
+        )
+        assert hit["_score"] == pytest.approx(segments[0]["_score"])
+
+
+def test_radial_search_returns_every_video_within_the_distance(make_local_index):
+    index = make_local_index()
+    query = index.vectors[3]  # The first segment of video1
+
+    response = index.search(radial_query(query.tolist(), max_distance=0.2, size=10))
+
+    cosine = index.vectors @ query / (np.linalg.norm(index.vectors, axis=1) * np.linalg.norm(query))
+    within = {index.ids[video] for video in index.segment_video[(1.0 - cosine) <= 0.2]}
+    assert {hit["_id"] for hit in response["hits"]["hits"]} == within
+    assert response["hits"]["hits"][0]["_id"] == "video1.mp4"
+
+
+def test_msearch_matches_single_searches(make_local_index):
+    index = make_local_index()
+    queries = np.random.default_rng(2).standard_normal((3, 8))
+    bodies = [knn_query(query.tolist(), k=2) for query in queries]
+    lines = []
+    for body in bodies:
+        lines += ['{"index": "local-index"}', json.dumps(body)]
+
+    responses = index.msearch(body="\n".join(lines) + "\n")["responses"]
+
+    for body, response in zip(bodies, responses):
+        assert_same_ranking(ranking(response), ranking(index.search(body)))
+
+
+def test_knn_query_expands_and_rescores_together():
+    plain = knn_query([0.0, 1.0], k=3, filter={"match_all": {}})
+    expanded = knn_query([0.0, 1.0], k=3, filter={"match_all": {}}, expand_nested_docs=True)
+
+    knn = expanded["query"]["nested"]["query"]["knn"]["embeddings.embedding"]
+    assert knn == {
+        "vector": [0.0, 1.0],
+        "k": 3,
+        "filter": {"match_all": {}},
+        "expand_nested_docs": True,
+        "rescore": True,
+    }
+    assert expanded["query"]["nested"]["score_mode"] == "max"
+    assert "score_mode" not in plain["query"]["nested"]
+    assert "rescore" not in plain["query"]["nested"]["query"]["knn"]["embeddings.embedding"]
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from manifest import Manifest
+from utilities import S3Object, Utilities
+
+
+@pytest.fixture
+def manifest_path(tmp_path):
+    return str(tmp_path / "state" / "manifest.jsonl")
+
+
+def test_records_survive_a_reload_and_the_last_line_wins(manifest_path):
+    manifest = Manifest(manifest_path)
+    manifest.record("a.mp4", "etag-1", invocationArn="arn/1")
+    manifest.record("b.mp4", "etag-2")
+    manifest.record("a.mp4", "etag-3", invocationArn="arn/3")
+
+    reloaded = Manifest(manifest_path)
+
+    assert len(reloaded) == 2 and list(reloaded) == ["a.mp4", "b.mp4"]
+    assert reloaded.get("a.mp4")["invocationArn"] == "arn/3"
+    assert reloaded.is_current("a.mp4", "etag-3")
+    assert not reloaded.is_current("a.mp4", "etag-1")
+    assert not reloaded.is_current("c.mp4", "etag-1") and "c.mp4" not in reloaded
+
+
+def test_a_torn_last_line_is_skipped(manifest_path):
+    Manifest(manifest_path).record("a.mp4", "etag-1")
+    with open(manifest_path, "a") as f:
+        f.write('{"key": "b.mp4", "fingerp\n\n')
+
+    reloaded = Manifest(manifest_path)
+
+    assert list(reloaded) == ["a.mp4"]
+
+
+def test_concurrent_records_each_append_one_whole_line(manifest_path):
+    manifest = Manifest(manifest_path)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda i: manifest.record(f"video{i}.mp4", f"etag-{i}"), range(200)))
+
+    with open(manifest_path) as f:
+        assert len(f.readlines()) == 200
+    assert len(Manifest(manifest_path)) == 200
+
+
+class FakePaginatedS3:
+    """Serves a listing in pages of `page_size` objects and records how many pages were read."""
+
+    def __init__(self, keys, page_size: int) -> None:
+        self.pages = [keys[i : i + page_size] for i in range(0, len(keys), page_size)]
+        self.pages_read = 0
+        self.requests = []
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        self.requests.append((Bucket, Prefix))
+        for keys in self.pages:
+            self.pages_read += 1
+            yield {
+                "Contents": [
+                    {
+                        "Key": key,
+                        "Size": 100 * (i + 1),
+                        "ETag": f'"etag-{key}"',
+                        "LastModified": datetime(2025, 7, 23),
+                    }
+                    for i, key in enumerate(keys)
+                ]
+            }
+        yield {"KeyCount": 0}  # A trailing page without Contents
+
+
+def test_listing_streams_video_objects_page_by_page():
+    keys = ["commercials/a.mp4", "commercials/notes.txt", "commercials/b.mp4", "commercials/c.mp4"]
+    client = FakePaginatedS3(keys, page_size=2)
+
+    videos = Utilities.iter_video_objects_from_s3(client, "bucket", "commercials/")
+    first = next(videos)
+
+    assert client.pages_read == 1
+    assert first == S3Object("commercials/a.mp4", 100, "etag-commercials/a.mp4", datetime(2025, 7, 23))
+    assert [video.file_name for video in videos] == ["b.mp4", "c.mp4"]
+    assert client.pages_read == 2 and client.requests == [("bucket", "commercials/")]
+
+
+def test_video_names_skip_other_objects():
+    client = FakePaginatedS3(["x/a.mp4", "x/a.mov", "x/b.mp4"], page_size=10)
+
+    assert Utilities.get_list_of_video_names_from_s3(client, "bucket", "x/") == ["a.mp4", "b.mp4"]
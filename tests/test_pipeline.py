@@ -0,0 +1,231 @@
+import io
+import json
+import os
+import threading
+from datetime import datetime
+
+import pytest
+from botocore.exceptions import ClientError
+
+import generate_embeddings_marengo as marengo
+import pipeline
+from embedding_store import read_video_embeddings
+from manifest import Manifest
+from pipeline_journal import COMPLETED, FAILED, SUBMITTED, PipelineJournal
+from utilities import S3Object
+
+VIDEO = S3Object("commercials/video.mp4", 1000, "etag-1", datetime(2025, 7, 23))
+ARN_PREFIX = "arn:aws:bedrock:us-east-1:123456789012:async-invoke"
+
+
+class FakeBedrock:
+    """Starts Marengo jobs that complete at once, writing one 6-second segment per 30 seconds of window."""
+
+    def __init__(self, s3: "FakeS3") -> None:
+        self.s3 = s3
+        self.started = []
+        self.polled = []
+        self.failing = set()
+        self.expired = set()
+
+    def start_async_invoke(self, modelId, modelInput, outputDataConfig):
+        self.started.append(modelInput)
+        invocation_arn = f"{ARN_PREFIX}/job{len(self.started)}"
+        self.s3.write_output(invocation_arn, modelInput.get("startSec", 0.0))
+        return {"invocationArn": invocation_arn}
+
+    def get_async_invoke(self, invocationArn):
+        self.polled.append(invocationArn)
+        if invocationArn in self.expired:
+            raise ClientError(
+                {"Error": {"Code": "ValidationException", "Message": "expired"}}, "GetAsyncInvoke"
+            )
+        if invocationArn in self.failing:
+            return {"invocationArn": invocationArn, "status": "Failed", "failureMessage": "bad window"}
+        return {"invocationArn": invocationArn, "status": "Completed"}
+
+
+class FakeS3:
+    def __init__(self) -> None:
+        self.objects = {}
+
+    def write_output(self, invocation_arn: str, start_sec: float) -> None:
+        segments = [
+            {
+                "embedding": [start_sec + offset, 1.0],
+                "embeddingOption": "visual-text",
+                "startSec": start_sec + offset,
+                "endSec": start_sec + offset + 6.0,
+            }
+            for offset in (0.0, 30.0)
+        ]
+        key = f"{marengo.S3_DESTINATION_PREFIX}/{invocation_arn.split('/')[-1]}/output.json"
+        self.objects[key] = json.dumps({"data": segments}).encode()
+
+    def get_object(self, Bucket, Key):
+        data = self.objects[Key]
+        return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://example.com/{Params['Key']}"
+
+
+@pytest.fixture
+def clients(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(marengo, "MAX_SUBMITS_PER_SECOND", 1e9)
+    monkeypatch.setattr(marengo, "POLL_INTERVAL_SECONDS", 0.0)
+    # A 150-second video in 60-second windows: (0, 60), (60, 60), (120, 30)
+    monkeypatch.setattr(marengo, "WINDOW_SECONDS", 60.0)
+    monkeypatch.setattr(marengo, "PROBE_MIN_BYTES", 0)
+    monkeypatch.setattr(marengo, "get_video_duration", lambda url: 150.0)
+    s3 = FakeS3()
+    return FakeBedrock(s3), s3
+
+
+@pytest.fixture
+def journal():
+    journal = PipelineJournal(":memory:")
+    journal.register(VIDEO.file_name, "marengo", VIDEO.etag)
+    yield journal
+    journal.close()
+
+
+def test_marengo_stage_splits_a_long_video_into_windows(clients, journal):
+    bedrock, s3 = clients
+
+    pipeline.run_marengo_stage(journal, bedrock, s3, "123456789012", [VIDEO])
+
+    assert [(job.get("startSec"), job.get("lengthSec")) for job in bedrock.started] == [
+        (None, 60.0),
+        (60.0, 60.0),
+        (120.0, 30.0),
+    ]
+    video_embeddings = read_video_embeddings(marengo.LOCAL_DESTINATION_DIRECTORY, VIDEO.file_name)
+    assert [segment.startSec for segment in video_embeddings.embeddings] == [
+        0.0, 30.0, 60.0, 90.0, 120.0, 150.0
+    ]
+    assert journal.get(VIDEO.file_name, "marengo")["state"] == COMPLETED
+    assert journal.invocations(VIDEO.file_name, "marengo") == []
+    manifest = Manifest(marengo.MANIFEST_FILE_PATH)
+    assert manifest.is_current(VIDEO.file_name, VIDEO.etag)
+    assert len(manifest.get(VIDEO.file_name)["invocationArns"]) == 3
+
+
+def test_marengo_stage_fails_a_video_when_a_window_fails(clients, journal):
+    bedrock, s3 = clients
+    # The first two windows finish first, so their spools must be removed
+    bedrock.failing.add(f"{ARN_PREFIX}/job3")
+
+    pipeline.run_marengo_stage(journal, bedrock, s3, "123456789012", [VIDEO])
+
+    record = journal.get(VIDEO.file_name, "marengo")
+    assert record["state"] == FAILED and record["error"] == "bad window"
+    assert journal.invocations(VIDEO.file_name, "marengo") == []
+    assert VIDEO.file_name not in Manifest(marengo.MANIFEST_FILE_PATH)
+    assert not os.listdir(marengo.SPOOL_DIRECTORY)
+
+
+def test_marengo_stage_resumes_recorded_windows_after_a_restart(clients, journal):
+    bedrock, s3 = clients
+    # Before the restart, the first two windows were submitted and recorded
+    for window, start_sec in ((0, 0.0), (1, 60.0)):
+        s3.write_output(f"{ARN_PREFIX}/before{window}", start_sec)
+        journal.set_invocation(VIDEO.file_name, "marengo", window, 3, f"{ARN_PREFIX}/before{window}")
+    journal.set(VIDEO.file_name, "marengo", SUBMITTED, invocation_arn=f"{ARN_PREFIX}/before1")
+
+    pipeline.run_marengo_stage(journal, bedrock, s3, "123456789012", [VIDEO])
+
+    assert [job.get("startSec") for job in bedrock.started] == [120.0]
+    assert {f"{ARN_PREFIX}/before0", f"{ARN_PREFIX}/before1"} <= set(bedrock.polled)
+    assert journal.get(VIDEO.file_name, "marengo")["state"] == COMPLETED
+    video_embeddings = read_video_embeddings(marengo.LOCAL_DESTINATION_DIRECTORY, VIDEO.file_name)
+    assert len(video_embeddings.embeddings) == 6
+
+
+def test_marengo_stage_resumes_a_single_window_arn_and_resubmits_an_expired_one(
+    clients, journal, monkeypatch
+):
+    bedrock, s3 = clients
+    monkeypatch.setattr(marengo, "get_video_duration", lambda url: 30.0)
+    other = S3Object("commercials/other.mp4", 1000, "etag-2", datetime(2025, 7, 23))
+    journal.register(other.file_name, "marengo", other.etag)
+    # Recorded before videos were split into windows: only the stage row holds the ARN
+    s3.write_output(f"{ARN_PREFIX}/before", 0.0)
+    journal.set(VIDEO.file_name, "marengo", SUBMITTED, invocation_arn=f"{ARN_PREFIX}/before")
+    journal.set(other.file_name, "marengo", SUBMITTED, invocation_arn=f"{ARN_PREFIX}/gone")
+    bedrock.expired.add(f"{ARN_PREFIX}/gone")
+
+    pipeline.run_marengo_stage(journal, bedrock, s3, "123456789012", [VIDEO, other])
+
+    assert len(bedrock.started) == 1
+    assert journal.get(VIDEO.file_name, "marengo")["state"] == COMPLETED
+    assert journal.get(other.file_name, "marengo")["state"] == COMPLETED
+
+
+def marking_stage(journal, name, depends_on=(), states=None, barrier=None, error=None, runs=None):
+    """A pipeline stage that records the videos it ran for and marks them done, or as given in `states`."""
+
+    def run(videos):
+        runs[name] = [video.file_name for video in videos]
+        if barrier is not None:
+            barrier.wait(timeout=5)
+        for video in videos:
+            journal.set(video.file_name, name, (states or {}).get(video.file_name, COMPLETED))
+        if error is not None:
+            raise RuntimeError(error)
+
+    return pipeline.Stage(name, depends_on, run)
+
+
+def test_run_pipeline_runs_independent_stages_together_and_gates_dependents_per_video():
+    journal = PipelineJournal(":memory:")
+    videos = [
+        S3Object(f"commercials/{name}", 1000, f"etag-{name}", datetime(2025, 7, 23))
+        for name in ("a.mp4", "b.mp4", "c.mp4")
+    ]
+    runs = {}
+    # Both independent stages must be running at once to pass the barrier
+    barrier = threading.Barrier(2)
+    stages = [
+        marking_stage(journal, "marengo", barrier=barrier, runs=runs),
+        marking_stage(journal, "pegasus", states={"b.mp4": FAILED}, barrier=barrier, runs=runs),
+        marking_stage(
+            journal,
+            "documents",
+            ("marengo", "pegasus"),
+            states={"c.mp4": FAILED},
+            error="index unavailable",
+            runs=runs,
+        ),
+        marking_stage(journal, "index", ("documents",), runs=runs),
+        pipeline.Stage(
+            "keyframe",
+            (),
+            lambda videos: runs.setdefault("keyframe", [v.file_name for v in videos]),
+            output_exists=lambda video: video.file_name == "a.mp4",
+        ),
+    ]
+
+    pipeline.run_pipeline(journal, stages, videos)
+
+    assert not barrier.broken
+    assert runs["keyframe"] == ["b.mp4", "c.mp4"]
+    assert runs["documents"] == ["a.mp4", "c.mp4"]
+    # A stage that stops with an error still releases its dependents for the videos it finished
+    assert runs["index"] == ["a.mp4"]
+    journal.close()
+
+
+def test_run_pipeline_ignores_dependencies_outside_the_run():
+    journal = PipelineJournal(":memory:")
+    runs = {}
+    journal.register(VIDEO.file_name, "marengo", VIDEO.etag)
+    journal.set(VIDEO.file_name, "marengo", COMPLETED)
+
+    pipeline.run_pipeline(
+        journal, [marking_stage(journal, "documents", ("marengo",), runs=runs)], [VIDEO]
+    )
+
+    assert runs == {"documents": [VIDEO.file_name]}
+    journal.close()
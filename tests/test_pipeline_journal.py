@@ -0,0 +1,67 @@
+import pytest
+
+from pipeline_journal import COMPLETED, FAILED, INDEXED, PENDING, SUBMITTED, PipelineJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = PipelineJournal(str(tmp_path / "journal.db"))
+    yield journal
+    journal.close()
+
+
+def test_state_survives_reopening_the_database(tmp_path):
+    db_path = str(tmp_path / "journal.db")
+    journal = PipelineJournal(db_path)
+    journal.register("a.mp4", "marengo", "etag-1")
+    journal.set("a.mp4", "marengo", SUBMITTED, invocation_arn="arn/a")
+    journal.set_invocation("a.mp4", "marengo", 0, 2, "arn/a0")
+    journal.close()
+
+    reopened = PipelineJournal(db_path)
+    record = reopened.get("a.mp4", "marengo")
+    assert (record["state"], record["fingerprint"], record["invocation_arn"]) == (
+        SUBMITTED,
+        "etag-1",
+        "arn/a",
+    )
+    assert reopened.invocations("a.mp4", "marengo") == [
+        {"window_index": 0, "windows": 2, "invocation_arn": "arn/a0"}
+    ]
+    reopened.close()
+
+
+def test_register_resets_only_changed_videos(journal):
+    assert journal.register("a.mp4", "marengo", "etag-1") == PENDING
+    journal.set("a.mp4", "marengo", SUBMITTED, invocation_arn="arn/a")
+    journal.set_invocation("a.mp4", "marengo", 0, 1, "arn/a")
+
+    assert journal.register("a.mp4", "marengo", "etag-1") == SUBMITTED
+    assert journal.invocations("a.mp4", "marengo")
+
+    # New content: the old invocations are forgotten, and existing output no longer counts
+    assert journal.register("a.mp4", "marengo", "etag-2", done=True) == PENDING
+    assert journal.invocations("a.mp4", "marengo") == []
+    assert journal.get("a.mp4", "marengo")["invocation_arn"] is None
+
+
+def test_existing_output_marks_a_new_video_done(journal):
+    assert journal.register("a.mp4", "documents", "etag-1", done=True) == COMPLETED
+    assert journal.is_done("a.mp4", "documents")
+    assert not journal.is_done("b.mp4", "documents")
+
+
+def test_states_are_listed_and_counted_per_stage(journal):
+    for video, state in (("a.mp4", INDEXED), ("b.mp4", FAILED), ("c.mp4", COMPLETED)):
+        journal.register(video, "index", "etag")
+        journal.set(video, "index", state, error="boom" if state == FAILED else None)
+    journal.register("a.mp4", "marengo", "etag")
+
+    assert journal.videos_in_state("index", COMPLETED, INDEXED) == ["a.mp4", "c.mp4"]
+    assert journal.get("b.mp4", "index")["error"] == "boom"
+    # Setting a new state keeps the fingerprint
+    assert journal.get("b.mp4", "index")["fingerprint"] == "etag"
+    assert journal.summary() == {
+        "index": {INDEXED: 1, FAILED: 1, COMPLETED: 1},
+        "marengo": {PENDING: 1},
+    }
@@ -0,0 +1,167 @@
+import json
+import os
+
+import pytest
+
+import prepare_opensearch_documents as documents
+from bulk_indexer import BulkIndexer
+from embedding_store import write_video_embeddings
+from manifest import Manifest
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Point the script's input and output directories at a temporary directory."""
+    for name in (
+        "LOCAL_EMBEDDINGS_DIRECTORY",
+        "LOCAL_ANALYSIS_DIRECTORY",
+        "LOCAL_OPENSEARCH_DIRECTORY",
+    ):
+        directory = tmp_path / getattr(documents, name)
+        directory.mkdir()
+        monkeypatch.setattr(documents, name, str(directory))
+    return tmp_path
+
+
+def write_analysis(workspace, name: str, title: str) -> str:
+    analysis_file = f"{os.path.splitext(name)[0]}.json"
+    analysis = {
+        "videoName": name,
+        "s3URI": f"s3://videos/{name}",
+        "title": title,
+        "summary": f"A video about {title.lower()}.",
+        "keywords": ["test"],
+        "dateCreated": "2025-07-23T00:00:00 UTC",
+    }
+    with open(os.path.join(documents.LOCAL_ANALYSIS_DIRECTORY, analysis_file), "w") as f:
+        json.dump(analysis, f)
+    return analysis_file
+
+
+@pytest.fixture
+def prepared_video(workspace, make_video_embeddings):
+    write_video_embeddings(
+        make_video_embeddings("harbor.mp4"), documents.LOCAL_EMBEDDINGS_DIRECTORY
+    )
+    return write_analysis(workspace, "harbor.mp4", "Harbor")
+
+
+def read_document(analysis_file: str) -> dict:
+    with open(os.path.join(documents.LOCAL_OPENSEARCH_DIRECTORY, analysis_file)) as f:
+        return json.load(f)
+
+
+def test_unchanged_inputs_are_skipped(prepared_video, workspace):
+    manifest = Manifest(str(workspace / "manifest.jsonl"))
+
+    assert documents.prepare_opensearch_document_if_changed(prepared_video, manifest)
+    first = read_document(prepared_video)
+    assert not documents.prepare_opensearch_document_if_changed(prepared_video, manifest)
+
+    # A fresh manifest read back from disk also sees the document as current
+    reloaded = Manifest(str(workspace / "manifest.jsonl"))
+    assert not documents.prepare_opensearch_document_if_changed(prepared_video, reloaded)
+    assert read_document(prepared_video) == first
+    assert len(first["embeddings"]) == 4
+
+
+def test_changed_analysis_rewrites_the_document_and_keeps_its_creation_date(
+    prepared_video, workspace
+):
+    manifest = Manifest(str(workspace / "manifest.jsonl"))
+    documents.prepare_opensearch_document_if_changed(prepared_video, manifest)
+    date_created = read_document(prepared_video)["dateCreated"]
+    manifest.record(
+        prepared_video,
+        manifest.get(prepared_video)["fingerprint"],
+        videoName="harbor.mp4",
+        documentDateCreated="2025-01-01T00:00:00 UTC",
+    )
+
+    write_analysis(workspace, "harbor.mp4", "Harbor at night")
+
+    assert documents.prepare_opensearch_document_if_changed(prepared_video, manifest)
+    document = read_document(prepared_video)
+    assert document["title"] == "Harbor at night"
+    assert document["dateCreated"] == "2025-01-01T00:00:00 UTC" != date_created
+
+
+def test_deleted_document_is_regenerated(prepared_video, workspace):
+    manifest = Manifest(str(workspace / "manifest.jsonl"))
+    documents.prepare_opensearch_document_if_changed(prepared_video, manifest)
+
+    os.remove(os.path.join(documents.LOCAL_OPENSEARCH_DIRECTORY, prepared_video))
+
+    assert documents.prepare_opensearch_document_if_changed(prepared_video, manifest)
+    assert read_document(prepared_video)["videoName"] == "harbor.mp4"
+
+
+def test_input_hash_covers_both_embedding_formats(prepared_video, make_video_embeddings):
+    json_hash = documents.compute_input_hash(prepared_video)
+    assert documents.compute_input_hash(prepared_video) == json_hash
+
+    # The .npy format takes precedence once written, and hashes its sidecar too
+    write_video_embeddings(
+        make_video_embeddings("harbor.mp4"),
+        documents.LOCAL_EMBEDDINGS_DIRECTORY,
+        file_format="npy",
+    )
+    npy_hash = documents.compute_input_hash(prepared_video)
+    assert npy_hash != json_hash
+
+    meta_path = os.path.join(documents.LOCAL_EMBEDDINGS_DIRECTORY, "harbor.meta.json")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta["keyframeURL"] = "https://example.com/other.jpg"
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    assert documents.compute_input_hash(prepared_video) != npy_hash
+
+
+def test_missing_embeddings_are_reported(workspace):
+    analysis_file = write_analysis(workspace, "orphan.mp4", "Orphan")
+
+    with pytest.raises(FileNotFoundError, match="orphan.json"):
+        documents.compute_input_hash(analysis_file)
+
+
+class RecordingBulkClient:
+    def __init__(self) -> None:
+        self.indexed = []
+
+    def bulk(self, index, body):
+        lines = body.splitlines()
+        items = []
+        for action in lines[0::2]:
+            (action_name, meta), = json.loads(action).items()
+            self.indexed.append(meta["_id"])
+            items.append({action_name: {"_id": meta["_id"], "status": 201}})
+        return {"errors": False, "items": items}
+
+
+def test_only_changed_documents_are_reindexed(workspace, make_video_embeddings):
+    document_manifest = Manifest(str(workspace / "documents.jsonl"))
+    index_manifest = Manifest(str(workspace / "index.jsonl"))
+    analysis_files = []
+    for seed, name in enumerate(("a.mp4", "b.mp4", "c.mp4")):
+        write_video_embeddings(
+            make_video_embeddings(name, seed=seed), documents.LOCAL_EMBEDDINGS_DIRECTORY
+        )
+        analysis_files.append(write_analysis(workspace, name, name.upper()))
+        documents.prepare_opensearch_document_if_changed(analysis_files[-1], document_manifest)
+
+    client = RecordingBulkClient()
+    indexer = BulkIndexer(client, "videos", id_field="videoName", sleep=lambda seconds: None)
+    first = indexer.index_changed_documents(
+        documents.LOCAL_OPENSEARCH_DIRECTORY, document_manifest, index_manifest
+    )
+    assert first.indexed == 3 and sorted(client.indexed) == ["a.mp4", "b.mp4", "c.mp4"]
+
+    write_analysis(workspace, "b.mp4", "B, revised")
+    documents.prepare_opensearch_document_if_changed(analysis_files[1], document_manifest)
+    client.indexed.clear()
+
+    second = indexer.index_changed_documents(
+        documents.LOCAL_OPENSEARCH_DIRECTORY, document_manifest, index_manifest
+    )
+    assert second.indexed == 1 and client.indexed == ["b.mp4"]
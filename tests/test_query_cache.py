@@ -0,0 +1,97 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from query_cache import QueryEmbeddingCache
+from query_encoder import QueryEncoder
+
+MODEL_ID = "twelvelabs.marengo-embed-2-7-v1:0"
+DAY = 24 * 60 * 60
+
+
+@pytest.fixture
+def now():
+    """A settable wall clock: now[0] is the current time."""
+    return [1_750_000_000.0]
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "query_embeddings.db")
+
+
+def open_cache(cache_path, now, **kwargs) -> QueryEmbeddingCache:
+    return QueryEmbeddingCache(cache_path, clock=lambda: now[0], **kwargs)
+
+
+def test_spelling_variants_share_an_entry_but_models_do_not(cache_path, now):
+    cache = open_cache(cache_path, now)
+    calls = []
+
+    def compute(text):
+        calls.append(text)
+        return [1.0, 2.0, 3.0]
+
+    first = cache.get_or_compute("A red  car", MODEL_ID, compute)
+    again = cache.get_or_compute("  a RED car ", MODEL_ID, compute)
+    cache.get_or_compute("a red car", "another-model", compute)
+
+    assert again is first and first.dtype == np.float32
+    assert calls == ["A red  car", "a red car"]
+    assert not first.flags.writeable
+    assert cache.stats["memory_hits"] == 1 and cache.stats["misses"] == 2
+    cache.close()
+
+
+def test_embeddings_outlive_the_process_and_the_memory_lru(cache_path, now):
+    cache = open_cache(cache_path, now, capacity=2)
+    for text in ("one", "two", "three"):
+        cache.put(text, MODEL_ID, [len(text), 0.5])
+    assert cache.stats["memory_size"] == 2
+
+    # "one" was evicted from memory, so it comes from SQLite
+    np.testing.assert_array_equal(cache.get("one", MODEL_ID), [3.0, 0.5])
+    assert cache.stats["disk_hits"] == 1
+    cache.close()
+
+    reopened = open_cache(cache_path, now)
+    np.testing.assert_array_equal(reopened.get("three", MODEL_ID), [5.0, 0.5])
+    assert reopened.stats == {
+        "memory_hits": 0,
+        "disk_hits": 1,
+        "misses": 0,
+        "hit_rate": 1.0,
+        "memory_size": 1,
+        "disk_size": 3,
+    }
+    reopened.close()
+
+
+def test_expired_embeddings_are_misses_and_can_be_purged(cache_path, now):
+    cache = open_cache(cache_path, now, ttl_seconds=30 * DAY)
+    cache.put("old", MODEL_ID, [1.0])
+    now[0] += 20 * DAY
+    cache.put("recent", MODEL_ID, [2.0])
+    now[0] += 15 * DAY
+
+    assert cache.get("old", MODEL_ID) is None
+    assert cache.get("recent", MODEL_ID) is not None
+    assert cache.evict_expired() == 1
+    assert cache.stats["disk_size"] == 1
+    cache.close()
+
+
+def test_query_encoder_embeds_a_repeated_query_once(cache_path, now):
+    class SyncBedrock:
+        calls = 0
+
+        def invoke_model(self, **kwargs):
+            SyncBedrock.calls += 1
+            return {"body": io.BytesIO(json.dumps({"embedding": [0.5, 0.25]}).encode())}
+
+    encoder = QueryEncoder(SyncBedrock(), cache=open_cache(cache_path, now))
+
+    assert encoder.encode("Red car") == encoder.encode("red car") == [0.5, 0.25]
+    assert SyncBedrock.calls == 1
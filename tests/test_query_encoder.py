@@ -0,0 +1,130 @@
+import io
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from query_encoder import QueryEncoder
+
+EMBEDDING = [0.25, -0.5, 1.0]
+SYNC_UNSUPPORTED = "Invocation of model ID with on-demand throughput isn't supported."
+
+
+def client_error(code: str, message: str = "", operation: str = "InvokeModel") -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def async_only(s3, **kwargs) -> "FakeBedrock":
+    return FakeBedrock(s3, sync_error=client_error("ValidationException", SYNC_UNSUPPORTED), **kwargs)
+
+
+class FakeBedrock:
+    """Embeds synchronously unless `sync_error` is set; async jobs end with `final_status` after `polls` polls."""
+
+    def __init__(self, s3, sync_error=None, final_status="Completed", polls=1) -> None:
+        self.s3 = s3
+        self.sync_error = sync_error
+        self.final_status = final_status
+        self.polls = polls
+        self.sync_calls = 0
+        self.status_checks = 0
+
+    def invoke_model(self, modelId, body, contentType, accept):
+        self.sync_calls += 1
+        if self.sync_error is not None:
+            raise self.sync_error
+        return {"body": io.BytesIO(json.dumps({"embedding": EMBEDDING}).encode())}
+
+    def start_async_invoke(self, modelId, modelInput, outputDataConfig):
+        return {"invocationArn": "arn:aws:bedrock:us-east-1:123456789012:async-invoke/query1"}
+
+    def get_async_invoke(self, invocationArn):
+        self.status_checks += 1
+        if self.status_checks < self.polls:
+            return {"status": "InProgress"}
+        if self.final_status == "Completed":
+            self.s3.objects["embeddings/query1/output.json"] = json.dumps(
+                {"data": [{"embedding": EMBEDDING}]}
+            ).encode()
+        return {"status": self.final_status, "failureMessage": "stopped by user"}
+
+
+class FakeS3:
+    def __init__(self) -> None:
+        self.objects = {}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise client_error("404", operation="HeadObject")
+        return {}
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def encoder(bedrock, s3, clock=None, **kwargs) -> QueryEncoder:
+    clock = clock or FakeClock()
+    return QueryEncoder(bedrock, s3, bucket="bucket", clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_sync_invocation_is_used_when_available():
+    s3 = FakeS3()
+    query_encoder = encoder(FakeBedrock(s3), s3)
+
+    assert query_encoder.encode("a red car") == EMBEDDING
+    stats = query_encoder.latency_stats()
+    assert (stats["count"], stats["sync_calls"], stats["async_calls"]) == (1, 1, 0)
+
+
+def test_unsupported_sync_invocation_falls_back_to_async_for_good():
+    s3 = FakeS3()
+    bedrock = async_only(s3)
+    query_encoder = encoder(bedrock, s3)
+
+    assert query_encoder.encode("a red car") == EMBEDDING
+    assert query_encoder.encode("a blue car") == EMBEDDING
+    assert bedrock.sync_calls == 1
+    assert query_encoder.async_calls == 2
+
+
+def test_a_bad_request_does_not_disable_sync_invocation():
+    s3 = FakeS3()
+    bedrock = FakeBedrock(s3, sync_error=client_error("ValidationException", "Input text is too long"))
+    query_encoder = encoder(bedrock, s3)
+
+    with pytest.raises(ClientError):
+        query_encoder.encode("x" * 10000)
+    assert query_encoder.use_sync
+
+
+@pytest.mark.parametrize("final_status", ["Failed", "Stopped"])
+def test_a_job_that_ends_without_output_fails_at_once(final_status):
+    s3 = FakeS3()
+    clock = FakeClock()
+    bedrock = async_only(s3, final_status=final_status)
+    query_encoder = encoder(bedrock, s3, clock=clock, timeout=300.0)
+
+    with pytest.raises(RuntimeError, match=final_status.lower()):
+        query_encoder.encode("a red car")
+    # Stopped on the first status check, long before the timeout
+    assert bedrock.status_checks == 1
+    assert clock.now < 5.0
+
+
+def test_a_job_that_never_finishes_times_out():
+    s3 = FakeS3()
+    bedrock = async_only(s3, polls=10**6)
+
+    with pytest.raises(TimeoutError):
+        encoder(bedrock, s3, timeout=30.0).encode("a red car")
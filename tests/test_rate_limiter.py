@@ -0,0 +1,88 @@
+import pytest
+
+from rate_limiter import AdaptiveRateLimiter
+
+
+class FakeClock:
+    """A clock that only moves when the limiter sleeps, so pacing is exact and instant."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def limiter(clock: FakeClock, **kwargs) -> AdaptiveRateLimiter:
+    return AdaptiveRateLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_acquire_paces_requests_at_the_rate(clock):
+    rate_limiter = limiter(clock, initial_rate=2.0, burst=1.0)
+
+    for _ in range(5):
+        rate_limiter.acquire()
+
+    # The first request uses the full bucket; the other four wait half a second each
+    assert clock.now == pytest.approx(2.0)
+    assert clock.sleeps == pytest.approx([0.5] * 4)
+
+
+def test_throttle_halves_the_rate_down_to_the_floor(clock):
+    rate_limiter = limiter(clock, initial_rate=4.0, min_rate=0.4)
+
+    rates = []
+    for _ in range(5):
+        rate_limiter.on_throttle()
+        rates.append(rate_limiter.rate)
+
+    assert rates == pytest.approx([2.0, 1.0, 0.5, 0.4, 0.4])
+    assert rate_limiter.throttle_count == 5
+
+
+def test_throttle_drains_the_bucket_for_every_waiting_worker(clock):
+    rate_limiter = limiter(clock, initial_rate=2.0, burst=3.0)
+
+    rate_limiter.on_throttle()
+    rate_limiter.acquire()
+
+    # Despite a full bucket of three, the next request waits a whole interval at the new rate
+    assert clock.sleeps == pytest.approx([1.0])
+
+
+def test_successes_recover_the_rate_additively_up_to_the_ceiling(clock):
+    rate_limiter = limiter(
+        clock, initial_rate=4.0, max_rate=4.0, increase_step=0.5, decrease_factor=0.5
+    )
+    rate_limiter.on_throttle()
+
+    rates = []
+    for _ in range(6):
+        rate_limiter.on_success()
+        rates.append(rate_limiter.rate)
+
+    assert rates == pytest.approx([2.5, 3.0, 3.5, 4.0, 4.0, 4.0])
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"initial_rate": 0.05, "min_rate": 0.1},
+        {"initial_rate": 20.0, "max_rate": 10.0},
+        {"min_rate": 0.0, "initial_rate": 1.0},
+        {"decrease_factor": 1.0},
+    ],
+)
+def test_rejects_invalid_settings(kwargs):
+    with pytest.raises(ValueError):
+        AdaptiveRateLimiter(**kwargs)
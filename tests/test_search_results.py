@@ -0,0 +1,137 @@
+import json
+
+import numpy as np
+import pytest
+
+from local_search import LocalVectorIndex
+from search_queries import knn_query
+from search_results import SearchResults, fetch_vectors, lean_query, search
+
+VECTOR_FIELD = "embeddings.embedding"
+
+
+def inner_hits_clause(vector) -> dict:
+    return {
+        "nested": {
+            "path": "embeddings",
+            "query": {"knn": {VECTOR_FIELD: {"vector": vector, "k": 2}}},
+            "inner_hits": {"fields": ["embeddings.startSec", VECTOR_FIELD]},
+        }
+    }
+
+
+@pytest.fixture(scope="module")
+def index() -> LocalVectorIndex:
+    rng = np.random.default_rng(7)
+    return LocalVectorIndex.from_videos(
+        (
+            {"videoName": name, "title": name.upper(), "durationSec": 12.0},
+            rng.standard_normal((segments, 4)).astype(np.float32),
+            [
+                {"embeddingOption": "visual-text", "startSec": 6.0 * s, "endSec": 6.0 * (s + 1)}
+                for s in range(segments)
+            ],
+        )
+        for name, segments in (("a.mp4", 2), ("b.mp4", 3))
+    )
+
+
+def test_lean_query_strips_vectors_from_inner_hits_anywhere_in_the_tree():
+    body = {
+        "size": 3,
+        "query": {
+            "function_score": {
+                "query": {
+                    "bool": {
+                        "should": [inner_hits_clause([0.1, 0.2]), {"match": {"title": "car"}}]
+                    }
+                }
+            }
+        },
+    }
+    original = json.dumps(body)
+
+    lean = lean_query(body, fields=["videoName"])
+
+    nested = lean["query"]["function_score"]["query"]["bool"]["should"][0]["nested"]
+    assert nested["inner_hits"] == {"fields": ["embeddings.startSec"], "_source": False}
+    assert nested["query"]["knn"][VECTOR_FIELD]["vector"] == [0.1, 0.2]
+    assert lean["_source"] == {"includes": ["videoName"]}
+    assert json.dumps(body) == original
+
+
+def test_lean_query_without_fields_returns_no_source():
+    lean = lean_query({"query": inner_hits_clause([0.0])}, fields=[])
+
+    assert lean["_source"] is False
+    assert lean["query"]["nested"]["inner_hits"]["_source"] is False
+
+
+def test_search_returns_typed_hits_without_vectors(index):
+    body = knn_query(index.vectors[3].tolist(), size=2, inner_hits=True)
+
+    results = search(index, body, fields=["videoName", "title"])
+
+    assert isinstance(results, SearchResults)
+    assert results[0].videoName == "b.mp4" and results[0]["title"] == "B.MP4"
+    assert results[0].segments[0].offset == 1
+    assert "embeddings" not in results[0].source
+    # Neither the inner hits nor the _source carry a vector
+    assert '"embedding"' not in json.dumps(results.raw)
+    assert f'"{VECTOR_FIELD}"' not in json.dumps(results.raw)
+
+
+def test_fetch_vectors_from_a_local_index(index):
+    vectors = fetch_vectors(index, [("b.mp4", 2), ("a.mp4", 0), ("b.mp4", 0)])
+
+    np.testing.assert_array_equal(vectors, index.vectors[[4, 0, 2]])
+    with pytest.raises(KeyError):
+        fetch_vectors(index, [("a.mp4", 2)])
+    with pytest.raises(KeyError):
+        fetch_vectors(index, [("c.mp4", 0)])
+
+
+class FakeOpenSearch:
+    """Answers `ids` queries from the local index's documents, recording each request."""
+
+    def __init__(self, index: LocalVectorIndex, empty=()) -> None:
+        self.index = index
+        self.empty = set(empty)
+        self.requests = []
+
+    def search(self, body, index=None, filter_path=None):
+        self.requests.append(body)
+        hits = []
+        for video_id in body["query"]["ids"]["values"]:
+            if video_id not in self.index.ids:
+                continue
+            row = self.index.ids.index(video_id)
+            lo, hi = self.index.offsets[row], self.index.offsets[row + 1]
+            segments = [] if video_id in self.empty else [
+                {"embedding": vector.tolist()} for vector in self.index.vectors[lo:hi]
+            ]
+            hits.append({"_id": video_id, "_source": {"embeddings": segments}})
+        return {"hits": {"hits": hits}}
+
+
+def test_fetch_vectors_reads_each_video_once_in_batches(index):
+    client = FakeOpenSearch(index)
+
+    vectors = fetch_vectors(
+        client, [("b.mp4", 2), ("a.mp4", 1), ("b.mp4", 0)], index="test", batch_size=1
+    )
+
+    np.testing.assert_array_equal(vectors, index.vectors[[4, 1, 2]])
+    assert [request["query"]["ids"]["values"] for request in client.requests] == [
+        ["b.mp4"],
+        ["a.mp4"],
+    ]
+    assert client.requests[0]["_source"] == {"includes": [VECTOR_FIELD]}
+    assert fetch_vectors(client, []).shape == (0, 0)
+
+
+def test_fetch_vectors_reports_missing_videos_and_segments(index):
+    with pytest.raises(KeyError, match="c.mp4"):
+        fetch_vectors(FakeOpenSearch(index), [("a.mp4", 0), ("c.mp4", 0)])
+    with pytest.raises(KeyError, match="Segment 0"):
+        fetch_vectors(FakeOpenSearch(index, empty=["a.mp4"]), [("a.mp4", 0)])
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from local_search import LocalVectorIndex
+from search_service import SearchService, StubEncoder
+
+DIMENSIONS = 16
+
+
+class CountingIndex:
+    """Wraps a local index, counting the searches and holding each one open for a moment."""
+
+    def __init__(self, index: LocalVectorIndex, latency: float = 0.05) -> None:
+        self.index = index
+        self.latency = latency
+        self.searches = 0
+        self._lock = threading.Lock()
+
+    def search(self, body, index=None):
+        with self._lock:
+            self.searches += 1
+        time.sleep(self.latency)
+        return self.index.search(body=body, index=index)
+
+
+@pytest.fixture
+def service():
+    rng = np.random.default_rng(0)
+    index = LocalVectorIndex.from_videos(
+        (
+            {"videoName": f"video{v}.mp4"},
+            rng.standard_normal((3, DIMENSIONS)).astype(np.float32),
+            [
+                {"embeddingOption": option, "startSec": 0.0, "endSec": 6.0}
+                for option in ("visual-text", "visual-image", "audio")
+            ],
+        )
+        for v in range(5)
+    )
+    service = SearchService(CountingIndex(index), "test", StubEncoder(DIMENSIONS, latency_ms=50).encode, max_workers=8)
+    yield service
+    service.close()
+
+
+def run_concurrently(service: SearchService, requests):
+    async def run():
+        return await asyncio.gather(*(service.search(**request) for request in requests))
+
+    return asyncio.run(run())
+
+
+def test_identical_concurrent_queries_share_one_embedding_and_search(service):
+    responses = run_concurrently(service, [{"text": "red sports car"}] * 10)
+
+    assert service.os_client.searches == 1
+    assert service.stats()["embeddings"] == {"started": 1, "coalesced": 9}
+    assert service.stats()["searches"] == {"started": 1, "coalesced": 9}
+    assert all(response is responses[0] for response in responses)
+
+
+def test_queries_share_the_embedding_but_not_the_search_when_parameters_differ(service):
+    run_concurrently(
+        service,
+        [
+            {"text": "red sports car", "k": 3},
+            {"text": "  red   sports car ", "k": 3},
+            {"text": "red sports car", "k": 5},
+            {"text": "red sports car", "k": 3, "embedding_option": "audio"},
+        ],
+    )
+
+    assert service.stats()["embeddings"] == {"started": 1, "coalesced": 3}
+    assert service.stats()["searches"] == {"started": 3, "coalesced": 1}
+
+
+def test_sequential_queries_are_not_coalesced(service):
+    for _ in range(2):
+        run_concurrently(service, [{"text": "red sports car"}])
+
+    assert service.stats()["embeddings"] == {"started": 2, "coalesced": 0}
+    assert service.os_client.searches == 2
+    assert service.histograms["search"].count == 2
+
+
+def test_rejects_invalid_requests(service):
+    with pytest.raises(ValueError):
+        run_concurrently(service, [{"text": "car", "embedding": [0.0] * DIMENSIONS}])
+    with pytest.raises(ValueError):
+        run_concurrently(service, [{"text": "car", "k": 0}])
@@ -0,0 +1,151 @@
+import pytest
+
+from segment_aggregation import iter_segments, merge_segments, top_clips
+
+
+def segment(video: str, option: str, start: float, score: float, offset: int = 0) -> dict:
+    return {
+        "videoName": video,
+        "title": video.upper(),
+        "offset": offset,
+        "score": score,
+        "embeddingOption": option,
+        "startSec": start,
+        "endSec": start + 6.0,
+    }
+
+
+def response(*videos) -> dict:
+    """Build a nested k-NN response from (video name, [segment, ...]) pairs, as `fields` inner hits."""
+    return {
+        "hits": {
+            "hits": [
+                {
+                    "_id": name,
+                    "_source": {"videoName": name, "title": name.upper()},
+                    "inner_hits": {
+                        "embeddings": {
+                            "hits": {
+                                "hits": [
+                                    {
+                                        "_nested": {"offset": s["offset"]},
+                                        "_score": s["score"],
+                                        "fields": {
+                                            "embeddings.embeddingOption": [s["embeddingOption"]],
+                                            "embeddings.startSec": [s["startSec"]],
+                                            "embeddings.endSec": [s["endSec"]],
+                                        },
+                                    }
+                                    for s in segments
+                                ]
+                            }
+                        }
+                    },
+                }
+                for name, segments in videos
+            ]
+        }
+    }
+
+
+class TestIterSegments:
+    def test_reads_fields(self):
+        segments = [segment("a.mp4", "audio", 0.0, 0.9, 0), segment("a.mp4", "visual-text", 6.0, 0.8, 1)]
+
+        assert list(iter_segments(response(("a.mp4", segments)))) == segments
+
+    def test_falls_back_to_the_source_and_the_hit_id(self):
+        results = {
+            "hits": {
+                "hits": [
+                    {
+                        "_id": "b.mp4",
+                        "inner_hits": {
+                            "embeddings": {
+                                "hits": {
+                                    "hits": [
+                                        {
+                                            "_nested": {"offset": 3},
+                                            "_score": 0.7,
+                                            "_source": {"embeddingOption": "audio", "startSec": 18, "endSec": 24},
+                                        }
+                                    ]
+                                }
+                            }
+                        },
+                    },
+                    {"_id": "c.mp4", "_source": {"videoName": "c.mp4"}},
+                ]
+            }
+        }
+
+        (only,) = iter_segments(results)
+        assert only["videoName"] == "b.mp4" and only["title"] is None
+        assert (only["offset"], only["startSec"], only["endSec"]) == (3, 18.0, 24.0)
+
+
+class TestMergeSegments:
+    def test_adjacent_segments_of_any_modality_form_one_clip(self):
+        clips = list(
+            merge_segments(
+                [
+                    segment("a.mp4", "audio", 6.0, 0.6, 1),
+                    segment("a.mp4", "visual-text", 0.0, 0.9, 0),
+                    segment("a.mp4", "visual-text", 12.3, 0.7, 2),
+                    segment("a.mp4", "audio", 30.0, 0.8, 5),
+                ]
+            )
+        )
+
+        assert [(clip.startSec, clip.endSec) for clip in clips] == [(0.0, 18.3), (30.0, 36.0)]
+        assert clips[0].offsets == [0, 1, 2]
+        assert clips[0].modalityScores == {"visual-text": 0.9, "audio": 0.6}
+        # The weighted mean is over every weighted option, so a missing modality counts as zero
+        assert clips[0].score == pytest.approx((0.9 + 0.6) / 3)
+        assert clips[1].score == pytest.approx(0.8 / 3)
+
+    def test_clips_are_capped_at_the_maximum_length(self):
+        segments = [segment("a.mp4", "audio", 6.0 * i, 0.5, i) for i in range(6)]
+
+        clips = list(merge_segments(segments, max_clip_sec=12.0))
+
+        assert [clip.offsets for clip in clips] == [[0, 1], [2, 3], [4, 5]]
+
+    def test_weights_and_minimum_score_filter_segments(self):
+        segments = [
+            segment("a.mp4", "audio", 0.0, 0.9),
+            segment("a.mp4", "visual-text", 6.0, 0.4),
+            segment("b.mp4", "visual-image", 0.0, 0.8),
+        ]
+
+        clips = list(merge_segments(segments, modality_weights={"audio": 2.0, "visual-text": 1.0}, min_score=0.5))
+
+        assert [(clip.videoName, clip.modalityScores) for clip in clips] == [("a.mp4", {"audio": 0.9})]
+        assert clips[0].score == pytest.approx(2.0 * 0.9 / 3.0)
+
+    def test_weights_must_not_all_be_zero(self):
+        with pytest.raises(ValueError):
+            list(merge_segments([], modality_weights={"audio": 0.0}))
+
+
+def test_top_clips_ranks_multimodal_moments_first():
+    results = response(
+        ("a.mp4", [segment("a.mp4", "audio", 0.0, 0.95, 0)]),
+        (
+            "b.mp4",
+            [
+                segment("b.mp4", "visual-text", 12.0, 0.8, 2),
+                segment("b.mp4", "visual-image", 12.0, 0.75, 3),
+                segment("b.mp4", "audio", 18.0, 0.7, 4),
+            ],
+        ),
+        ("c.mp4", [segment("c.mp4", "visual-text", 0.0, 0.5, 0)]),
+    )
+
+    clips = top_clips(results, n=2)
+
+    assert [(clip.videoName, clip.startSec, clip.endSec) for clip in clips] == [
+        ("b.mp4", 12.0, 24.0),
+        ("a.mp4", 0.0, 6.0),
+    ]
+    assert top_clips(results, n=10)[-1].videoName == "c.mp4"
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from embedding_store import write_video_embeddings
+from segment_analytics import SegmentCorpus, reduce_dimensions
+
+
+@pytest.fixture
+def embeddings_directory(tmp_path, make_video_embeddings):
+    for name, segments, file_format, seed in (
+        ("a.mp4", 5, "json", 1),
+        ("b.mp4", 4, "npy", 2),
+        ("c.mp4", 2, "json", 3),
+    ):
+        video_embeddings = make_video_embeddings(name, segments, seed=seed)
+        write_video_embeddings(video_embeddings, str(tmp_path), file_format=file_format)
+    return tmp_path
+
+
+def test_batches_span_videos_and_filter_by_option(embeddings_directory):
+    corpus = SegmentCorpus(str(embeddings_directory), batch_size=4)
+
+    assert len(corpus) == 11 and corpus.dimensions == 8
+    assert [len(batch) for batch in corpus.iter_batches()] == [4, 4, 3]
+    assert corpus.video_names == ["a.mp4", "b.mp4", "c.mp4"]
+
+    audio = SegmentCorpus(str(embeddings_directory), embedding_option="audio")
+    assert len(audio) == 3 + 2 + 1
+    assert list(audio.offsets) == [0, 2, 4, 0, 2, 0]
+
+
+def test_fewer_segments_than_components_are_projected(embeddings_directory):
+    corpus = SegmentCorpus(str(embeddings_directory), embedding_option="visual-text")
+
+    projected = reduce_dimensions(corpus, n_components=50, cache_directory=None)
+
+    assert projected.shape == (len(corpus), len(corpus))
+    assert np.isfinite(projected).all()
+
+
+def test_short_batches_are_carried_into_the_next_fit(embeddings_directory, tmp_path):
+    # Every batch of 3 is shorter than the 5 components, and the last one has 2 rows
+    corpus = SegmentCorpus(str(embeddings_directory), batch_size=3)
+
+    projected = reduce_dimensions(corpus, n_components=5, cache_directory=str(tmp_path / "cache"))
+
+    assert projected.shape == (11, 5)
+    # The components are ordered by explained variance
+    variances = projected.var(axis=0)
+    assert np.all(np.diff(variances) <= 1e-6)
+    cached = reduce_dimensions(corpus, n_components=5, cache_directory=str(tmp_path / "cache"))
+    np.testing.assert_array_equal(cached, projected)
+
+
+def test_empty_corpus_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        reduce_dimensions(SegmentCorpus(str(tmp_path)), cache_directory=None)
@@ -0,0 +1,134 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from thumbnail_service import ThumbnailService
+
+COLORS = {"a.jpg": "red", "b.jpg": "green", "c.jpg": "blue"}
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, status_code: int = 200) -> None:
+        self.content = content
+        self.status_code = status_code
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise OSError(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    """Serves a solid-color 640x360 JPEG per keyframe name and counts the requests."""
+
+    def __init__(self) -> None:
+        self.requests = []
+
+    def get(self, url, timeout=None):
+        self.requests.append(url)
+        name = url.rsplit("/", 1)[-1]
+        if name not in COLORS:
+            return FakeResponse(b"", status_code=404)
+        buffer = io.BytesIO()
+        Image.new("RGB", (640, 360), COLORS[name]).save(buffer, format="JPEG")
+        return FakeResponse(buffer.getvalue())
+
+    def close(self) -> None:
+        pass
+
+
+def url(name: str) -> str:
+    return f"https://example.com/keyframes/{name}"
+
+
+@pytest.fixture
+def session():
+    return FakeSession()
+
+
+def make_service(directory, session, **kwargs) -> ThumbnailService:
+    return ThumbnailService(
+        cache_directory=str(directory), size=(64, 36), session=session, max_workers=2, **kwargs
+    )
+
+
+def test_downscales_and_serves_repeats_from_memory(tmp_path, session):
+    service = make_service(tmp_path, session)
+
+    first = service.get_many([url("a.jpg"), url("b.jpg"), url("a.jpg")])
+    second = service.get(url("a.jpg"))
+
+    assert first[0].size == (64, 36) and first[0] is first[2] and second is first[0]
+    assert len(session.requests) == 2
+    assert service.stats["misses"] == 2 and service.stats["memory_hits"] == 1
+    service.close()
+
+
+def test_disk_cache_evicts_the_least_recently_used_thumbnail(tmp_path, session):
+    service = make_service(tmp_path, session, memory_capacity=1)
+    # One at a time, so b.jpg is the most recently used
+    service.get(url("a.jpg"))
+    service.get(url("b.jpg"))
+    thumbnail_bytes = min(os.path.getsize(tmp_path / key) for key in os.listdir(tmp_path))
+    # Room for the two thumbnails on disk, but not a third
+    service.max_disk_bytes = service.stats["disk_bytes"] + thumbnail_bytes // 2
+
+    # a.jpg is no longer in memory, so this reads it from disk and makes b.jpg the least recent
+    service.get(url("a.jpg"))
+    service.get(url("c.jpg"))
+
+    assert service.stats["disk_hits"] == 1
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [service._key(url("a.jpg")), service._key(url("c.jpg"))]
+    )
+    assert service.stats["disk_bytes"] <= service.max_disk_bytes
+
+    # The evicted thumbnail is fetched again
+    service.get(url("b.jpg"))
+    assert session.requests.count(url("b.jpg")) == 2
+    service.close()
+
+
+def test_disk_cache_survives_a_restart(tmp_path, session):
+    make_service(tmp_path, session).get_many([url("a.jpg"), url("b.jpg")])
+
+    service = make_service(tmp_path, session)
+    thumbnails = service.get_many([url("a.jpg"), url("b.jpg")])
+
+    assert all(thumbnail.size == (64, 36) for thumbnail in thumbnails)
+    assert len(session.requests) == 2
+    assert service.stats["disk_hits"] == 2 and service.stats["disk_size"] == 2
+    service.close()
+
+
+def test_missing_keyframes_leave_an_empty_grid_cell(tmp_path, session):
+    service = make_service(tmp_path, session, base_url="http://localhost:8000/")
+
+    thumbnails = service.get_many([url("a.jpg"), url("missing.jpg")])
+    grid = service.grid([url("a.jpg"), url("missing.jpg")], columns=2, padding=0)
+
+    assert thumbnails[1] is None
+    assert session.requests[0] == "http://localhost:8000/a.jpg"
+    assert grid.size == (128, 36)
+    assert grid.getpixel((96, 18)) == (255, 255, 255)
+    assert service.stats["disk_size"] == 1
+    service.close()
+
+
+def test_a_failed_disk_write_keeps_the_thumbnail_in_memory_only(tmp_path, session, monkeypatch):
+    def full_disk(file, mode="r", *args, **kwargs):
+        if "w" in mode:
+            raise OSError(28, "No space left on device")
+        return open(file, mode, *args, **kwargs)
+
+    service = make_service(tmp_path, session)
+    monkeypatch.setattr("thumbnail_service.open", full_disk, raising=False)
+
+    thumbnail = service.get(url("a.jpg"))
+
+    assert thumbnail is not None and thumbnail.size == (64, 36)
+    assert service.get(url("a.jpg")) is thumbnail
+    assert service.stats["disk_size"] == 0 and service.stats["disk_bytes"] == 0
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".jpg")]
+    service.close()
@@ -0,0 +1,256 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import io
+import os
+import threading
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+DEFAULT_CACHE_DIRECTORY = "thumbnails"
+
+
+class ThumbnailService:
+    """Concurrent keyframe loader with a two-level LRU of downscaled thumbnails.
+
+    Keyframes missing from the cache are fetched in parallel over one pooled
+    HTTP session, so a grid of results costs about one round trip. Each JPEG is
+    decoded at reduced scale (PIL draft mode), downscaled to the thumbnail size,
+    and kept in an in-memory LRU over a size-bounded on-disk LRU of small JPEGs,
+    so repeated grids skip the network and the full-size decode entirely.
+    """
+
+    def __init__(
+        self,
+        cache_directory: str = DEFAULT_CACHE_DIRECTORY,
+        size: Tuple[int, int] = (480, 270),
+        memory_capacity: int = 512,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+        max_workers: int = 16,
+        timeout: float = 10.0,
+        base_url: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+    ) -> None:
+        """Initialize the service and index the on-disk cache.
+        Args:
+            cache_directory (str): The on-disk thumbnail cache directory.
+            size (Tuple[int, int]): The maximum thumbnail width and height; the aspect ratio is kept.
+            memory_capacity (int): The maximum number of thumbnails held in memory.
+            max_disk_bytes (int): The maximum size of the on-disk cache, in bytes.
+            max_workers (int): The number of keyframes fetched concurrently; also the connection pool size.
+            timeout (float): The HTTP timeout, in seconds.
+            base_url (str, optional): Fetch keyframes by file name from this URL instead of their
+                own URL, e.g., a local file server (`python -m http.server --directory keyframes`).
+            session (requests.Session, optional): The HTTP session. Defaults to a pooled session.
+        """
+        self.cache_directory = cache_directory
+        self.size = size
+        self.memory_capacity = memory_capacity
+        self.max_disk_bytes = max_disk_bytes
+        self.timeout = timeout
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._memory: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Index the disk cache, least recently used first, by modification time
+        os.makedirs(cache_directory, exist_ok=True)
+        entries = []
+        for file_name in os.listdir(cache_directory):
+            if file_name.endswith(".jpg"):
+                stat = os.stat(os.path.join(cache_directory, file_name))
+                entries.append((stat.st_mtime, file_name, stat.st_size))
+        self._disk: "OrderedDict[str, int]" = OrderedDict(
+            (file_name, file_size) for _, file_name, file_size in sorted(entries)
+        )
+        self._disk_bytes = sum(self._disk.values())
+
+    def get(self, url: str) -> Optional[Image.Image]:
+        """Get the thumbnail of one keyframe.
+        Args:
+            url (str): The keyframe URL.
+        Returns:
+            Optional[Image.Image]: The thumbnail, or None if it could not be loaded.
+        """
+        return self.get_many([url])[0]
+
+    def get_many(self, urls: Sequence[str]) -> List[Optional[Image.Image]]:
+        """Get the thumbnails of several keyframes, fetching every cache miss concurrently.
+        Args:
+            urls (Sequence[str]): The keyframe URLs.
+        Returns:
+            List[Optional[Image.Image]]: The thumbnails in URL order; None for keyframes that could not be loaded.
+        """
+        thumbnails: Dict[str, Optional[Image.Image]] = {}
+        missing = []
+        for url in dict.fromkeys(urls):
+            thumbnail = self._get_cached(self._key(url))
+            if thumbnail is not None:
+                thumbnails[url] = thumbnail
+            else:
+                missing.append(url)
+
+        for url, thumbnail in zip(missing, self._executor.map(self._fetch, missing)):
+            thumbnails[url] = thumbnail
+        return [thumbnails[url] for url in urls]
+
+    def grid(
+        self,
+        urls: Sequence[str],
+        columns: int = 3,
+        padding: int = 4,
+        background: str = "white",
+    ) -> Image.Image:
+        """Compose the thumbnails of several keyframes into a single grid image.
+        Args:
+            urls (Sequence[str]): The keyframe URLs, in row-major order.
+            columns (int): The number of columns.
+            padding (int): The space around each thumbnail, in pixels.
+            background (str): The background color, also shown for keyframes that could not be loaded.
+        Returns:
+            Image.Image: The grid image.
+        """
+        thumbnails = self.get_many(urls)
+        cell_width, cell_height = self.size[0] + padding * 2, self.size[1] + padding * 2
+        rows = max(1, -(-len(urls) // columns))
+        sheet = Image.new("RGB", (cell_width * columns, cell_height * rows), background)
+        for index, thumbnail in enumerate(thumbnails):
+            if thumbnail is None:
+                continue
+            row, column = divmod(index, columns)
+            # Center each thumbnail in its cell
+            sheet.paste(
+                thumbnail,
+                (
+                    column * cell_width + (cell_width - thumbnail.width) // 2,
+                    row * cell_height + (cell_height - thumbnail.height) // 2,
+                ),
+            )
+        return sheet
+
+    @property
+    def stats(self) -> dict:
+        """Return the hit and miss counters and the cache sizes."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_size": len(self._memory),
+            "disk_size": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+    def close(self) -> None:
+        """Shut down the fetch workers and close the HTTP session."""
+        self._executor.shutdown()
+        self.session.close()
+
+    def _key(self, url: str) -> str:
+        """Build the cache file name for a keyframe URL and the thumbnail size."""
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return f"{digest[:32]}-{self.size[0]}x{self.size[1]}.jpg"
+
+    def _get_cached(self, key: str) -> Optional[Image.Image]:
+        """Get a thumbnail from memory, or from disk into memory."""
+        with self._lock:
+            thumbnail = self._memory.get(key)
+            if thumbnail is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return thumbnail
+            if key not in self._disk:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(key)
+
+        file_path = os.path.join(self.cache_directory, key)
+        try:
+            with Image.open(file_path) as image:
+                thumbnail = image.convert("RGB")
+            os.utime(file_path)  # Keep the LRU order across runs
+        except OSError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, thumbnail)
+        return thumbnail
+
+    def _fetch(self, url: str) -> Optional[Image.Image]:
+        """Download a keyframe, downscale it, and cache the thumbnail in memory and on disk."""
+        if self.base_url:
+            fetch_url = f"{self.base_url}/{url.rsplit('/', 1)[-1]}"
+        else:
+            fetch_url = url
+        try:
+            response = self.session.get(fetch_url, timeout=self.timeout)
+            response.raise_for_status()
+            thumbnail = self._downscale(response.content)
+        except Exception as e:
+            print(f"Error loading video thumbnail from URL {fetch_url}: {e}")
+            return None
+
+        key = self._key(url)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, format="JPEG", quality=85)
+        try:
+            with open(os.path.join(self.cache_directory, key), "wb") as f:
+                f.write(buffer.getvalue())
+        except OSError as e:
+            # A full or read-only disk only costs the disk cache; keep the thumbnail in memory
+            print(f"Error caching video thumbnail for URL {url}: {e}")
+            with self._lock:
+                self._remember(key, thumbnail)
+            return thumbnail
+
+        with self._lock:
+            self._disk_bytes += buffer.tell() - self._disk.get(key, 0)
+            self._disk[key] = buffer.tell()
+            self._disk.move_to_end(key)
+            self._evict_disk()
+            self._remember(key, thumbnail)
+        return thumbnail
+
+    def _downscale(self, data: bytes) -> Image.Image:
+        """Decode an image at reduced scale and shrink it to the thumbnail size."""
+        image = Image.open(io.BytesIO(data))
+        # For JPEGs, decode at the smallest 1/2, 1/4, or 1/8 scale that still covers the thumbnail
+        image.draft("RGB", self.size)
+        image = image.convert("RGB")
+        image.thumbnail(self.size, reducing_gap=2.0)
+        return image
+
+    def _remember(self, key: str, thumbnail: Image.Image) -> None:
+        """Add a thumbnail to the in-memory LRU, evicting the least recently used entry if full."""
+        self._memory[key] = thumbnail
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_capacity:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self) -> None:
+        """Delete the least recently used thumbnails until the disk cache fits its budget."""
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            key, file_size = self._disk.popitem(last=False)
+            self._disk_bytes -= file_size
+            try:
+                os.remove(os.path.join(self.cache_directory, key))
+            except FileNotFoundError:
+                pass
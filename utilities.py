@@ -1,10 +1,53 @@
-from typing import List
+from datetime import datetime
+from typing import Callable, Iterator, List, NamedTuple
 import time
 
 import boto3
+from botocore.exceptions import ClientError
+from opensearchpy import AWSV4SignerAuth, OpenSearch, RequestsHttpConnection
+
+from instrumentation import METRICS
+
+
+class S3Object(NamedTuple):
+    key: str
+    size: int
+    etag: str
+    last_modified: datetime
+
+    @property
+    def file_name(self) -> str:
+        return self.key.split("/")[-1]
 
 
 class Utilities:
+    @staticmethod
+    def iter_video_objects_from_s3(
+        client: boto3.client, bucket: str, prefix: str, suffix: str = ".mp4"
+    ) -> Iterator[S3Object]:
+        """Lazily list the video objects in an S3 bucket with the specified prefix, page by page.
+        Args:
+            client (boto3.client): The Boto3 S3 client.
+            bucket (str): The name of the S3 bucket.
+            prefix (str): The prefix to filter the objects.
+            suffix (str): The file extension to keep. Defaults to .mp4.
+        Yields:
+            S3Object: The key, size, ETag, and last-modified time of each video object, taken
+                straight from the listing so no per-object HEAD request is needed.
+        """
+        paginator = client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            METRICS.increment("s3_requests", operation="list_objects_v2", bucket=bucket)
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith(suffix):
+                    METRICS.increment("s3_objects_listed", bucket=bucket)
+                    yield S3Object(
+                        key=obj["Key"],
+                        size=obj["Size"],
+                        etag=obj["ETag"].strip('"'),
+                        last_modified=obj["LastModified"],
+                    )
+
     @staticmethod
     def get_list_of_video_names_from_s3(
         client: boto3.client, bucket: str, prefix: str
@@ -17,15 +60,10 @@ class Utilities:
         Returns:
             List[str]: A list of video file names (with .mp4 extension) in the specified S3 bucket.
         """
-        response = client.list_objects_v2(Bucket=bucket, Prefix=prefix)
-
-        video_files = []
-        if "Contents" in response:
-            for obj in response["Contents"]:
-                if obj["Key"].endswith(".mp4"):
-                    filename = obj["Key"].split("/")[-1]
-                    video_files.append(filename)
-        return video_files
+        return [
+            obj.file_name
+            for obj in Utilities.iter_video_objects_from_s3(client, bucket, prefix)
+        ]
 
     @staticmethod
     def get_s3_object_metadata(client: boto3.client, bucket: str, key: str) -> dict:
@@ -37,9 +75,33 @@ class Utilities:
         Returns:
             dict: The metadata of the S3 object.
         """
+        METRICS.increment("s3_requests", operation="head_object", bucket=bucket)
         response = client.head_object(Bucket=bucket, Key=key)
         return response
 
+    @staticmethod
+    def create_opensearch_client(
+        endpoint: str, region: str, service: str = "aoss"
+    ) -> OpenSearch:
+        """Create an OpenSearch client for Amazon OpenSearch Serverless (or Service), as in the notebook.
+        Args:
+            endpoint (str): The OpenSearch endpoint host name.
+            region (str): The AWS Region of the endpoint.
+            service (str): The signing service name: aoss for Serverless, or es for Service.
+        Returns:
+            OpenSearch: The OpenSearch client.
+        """
+        credentials = boto3.Session(region_name=region).get_credentials()
+        auth = AWSV4SignerAuth(credentials, region, service)
+        return OpenSearch(
+            hosts=[{"host": endpoint, "port": 443}],
+            http_auth=auth,
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=RequestsHttpConnection,
+            pool_maxsize=20,
+        )
+
     @staticmethod
     def poll_job_status(client: boto3.client, invocation_arn: str) -> str:
         """Poll the job status until it is completed or failed.
@@ -49,7 +111,9 @@ class Utilities:
         Returns:
             str: The final job status.
         """
+        started = time.perf_counter()
         while True:
+            METRICS.increment("bedrock_requests", operation="get_async_invoke")
             response = client.get_async_invoke(invocationArn=invocation_arn)
             status = response["status"]
 
@@ -64,4 +128,73 @@ class Utilities:
             else:
                 # Still in progress, so wait and retry
                 time.sleep(10)  # Adjust polling interval as necessary
+        METRICS.record_span(
+            "async_job_poll",
+            time.perf_counter() - started,
+            job=invocation_arn.split("/")[-1],
+            job_status=status,
+        )
         return response["status"]
+
+    @staticmethod
+    def wait_for_async_output(
+        bedrock_client: boto3.client,
+        s3_client: boto3.client,
+        invocation_arn: str,
+        bucket: str,
+        key: str,
+        initial_interval: float = 0.25,
+        max_interval: float = 4.0,
+        timeout: float = 300.0,
+        status_check_every: int = 4,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> str:
+        """Wait for an async job's output object to appear in S3, polling with exponential backoff.
+        Watching the output key directly returns as soon as the output is written, without waiting
+        for the job status to catch up; the job status is still checked periodically to catch failures.
+        Args:
+            bedrock_client (boto3.client): The Boto3 client for the Bedrock service.
+            s3_client (boto3.client): The Boto3 S3 client.
+            invocation_arn (str): The ARN of the job invocation.
+            bucket (str): The S3 bucket of the output object.
+            key (str): The S3 key of the output object.
+            initial_interval (float): The first polling interval, in seconds; doubled each round.
+            max_interval (float): The longest polling interval, in seconds.
+            timeout (float): The maximum time to wait, in seconds.
+            status_check_every (int): Check the job status every this many polling rounds.
+            sleep (Callable[[float], None]): Sleep function, in seconds.
+            clock (Callable[[], float]): Monotonic clock, in seconds.
+        Returns:
+            str: The final job status: Completed, Failed, or Stopped.
+        Raises:
+            TimeoutError: If the output does not appear within the timeout.
+        """
+        deadline = clock() + timeout
+        interval = initial_interval
+        rounds = 0
+        with METRICS.span("async_output_wait", job=invocation_arn.split("/")[-1]) as span:
+            while True:
+                METRICS.increment("s3_requests", operation="head_object", bucket=bucket)
+                try:
+                    s3_client.head_object(Bucket=bucket, Key=key)
+                    span["job_status"] = "Completed"
+                    return "Completed"
+                except ClientError as e:
+                    if e.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+                        raise
+
+                rounds += 1
+                if rounds % status_check_every == 0:
+                    METRICS.increment("bedrock_requests", operation="get_async_invoke")
+                    response = bedrock_client.get_async_invoke(invocationArn=invocation_arn)
+                    # A failed or stopped job never writes its output, so stop waiting for it
+                    if response["status"] in ("Failed", "Stopped"):
+                        print(f"Job {response['status'].lower()}: {response.get('failureMessage')}")
+                        span["job_status"] = response["status"]
+                        return response["status"]
+
+                if clock() + interval > deadline:
+                    raise TimeoutError(f"Timed out waiting for s3://{bucket}/{key}")
+                sleep(interval)
+                interval = min(interval * 2, max_interval)